@@ -0,0 +1,658 @@
+"""
+Async TXSPEAK Backend
+ASGI variant of server.py: same /api/* routes and responses, with contract reads
+issued concurrently through the pooled async RPC provider.
+
+Run with: hypercorn asgi_server:app --bind 0.0.0.0:8003
+"""
+
+import asyncio
+import json
+import time
+from functools import wraps
+from quart import Quart, Response, g, request, jsonify, websocket, send_file
+from quart_cors import cors
+from web3 import Web3
+from provider import make_async_web3
+
+import metrics
+import server
+from server import (
+    CONTRACT_ADDRESSES, NETWORK,
+    STATS_TTL, ACCOUNT_TTL, MESSAGE_TTL, RESPONSE_TTL, ACCOUNT_READS, WINDOWS,
+    STREAM_KEEPALIVE, AUTH_BATCH_LIMIT, cache, contracts, block_watcher, message_store, event_hub, format_sse,
+    format_presale_stats, format_profile, format_message, format_verification, build_leaderboard,
+    format_presale_history, format_presale_phase, format_balance, parse_address_list, parse_search_filters,
+    parse_quote_request,
+    response_etag, pinned_response, content_headers, CONTENT_MAX_AGE,
+    recover_signer, signature_verifier, nonce_store, complete_login, session_address
+)
+
+app = cors(Quart(__name__))
+
+aw3 = make_async_web3()
+
+async def call(prepared, block_identifier='latest'):
+    """eth_call a PreparedCall from the shared contract registry over the async provider"""
+    data = await aw3.eth.call({'to': prepared.address, 'data': prepared.encode()}, block_identifier)
+    return prepared.decode(data)
+
+async def load_stats(keys, block_identifier='latest'):
+    """Async cache loader for the global token and presale stats"""
+    async def token_stats():
+        token = contracts.get('txspk_token')
+        if not token:
+            return {}
+        total_supply, name, symbol = await asyncio.gather(
+            call(token.totalSupply(), block_identifier),
+            call(token.name(), block_identifier),
+            call(token.symbol(), block_identifier)
+        )
+        return {
+            'total_supply': total_supply,
+            'name': name,
+            'symbol': symbol
+        }
+
+    async def presale_stats():
+        presale = contracts.get('presale')
+        if not presale:
+            return {}
+        stats, phase_info = await asyncio.gather(
+            call(presale.getPresaleStats(), block_identifier),
+            call(presale.getCurrentPhaseInfo(), block_identifier)
+        )
+        return format_presale_stats(stats, phase_info)
+
+    loaders = {'token_stats': token_stats, 'presale_stats': presale_stats}
+    keys = [key for key in keys if key in loaders]
+    results = await asyncio.gather(*[loaders[key]() for key in keys])
+    return dict(zip(keys, results))
+
+async def load_account_reads(keys, block_identifier='latest'):
+    """Async cache loader for per-address token reads, keyed by (kind, address)"""
+    token = contracts['txspk_token']
+    results = await asyncio.gather(*[
+        call(getattr(token, ACCOUNT_READS[kind])(Web3.to_checksum_address(address)), block_identifier)
+        for kind, address in keys
+    ], return_exceptions=True)
+    return {key: None if isinstance(result, Exception) else result for key, result in zip(keys, results)}
+
+async def load_messages(keys):
+    """Async cache loader for Message records, keyed by ('message', id)"""
+    message_ids = [msg_id for _, msg_id in keys]
+    found, missing = message_store.lookup(message_ids)
+    if missing:
+        messaging = contracts['messaging']
+        results = await asyncio.gather(*[
+            call(messaging.getMessage(msg_id)) for msg_id in missing
+        ], return_exceptions=True)
+        fetched = {
+            msg_id: None if isinstance(result, Exception) else result
+            for msg_id, result in zip(missing, results)
+        }
+        message_store.put(fetched)
+        found.update(fetched)
+    return {('message', msg_id): found.get(msg_id) for msg_id in message_ids}
+
+# Pinned-block reads, as in server.py
+async def current_block():
+    block = block_watcher.dispatched_block
+    return block if block is not None else await aw3.eth.block_number
+
+def pinned(loader, block):
+    async def load(keys):
+        values = await loader(keys, block)
+        seen = block_watcher.last_block
+        if seen is not None and seen > block:
+            for key in keys:
+                cache.invalidate(key)
+        return values
+    load.block = block
+    return load
+
+async def account_reads(address, kinds, block):
+    """{(kind, address): value} for one lowercased address, from the local ledgers when caught up"""
+    local = server.local_account_reads([address], kinds)
+    keys = [(kind, address) for kind in kinds if (kind, address) not in local]
+    reads = await cache.get_many_async(keys, pinned(load_account_reads, block), ACCOUNT_TTL)
+    reads.update(local)
+    return reads
+
+def block_cached(view):
+    """Pin a GET view to one block (as g.block) and cache its 200 responses under (path, args, block)"""
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        g.block = await current_block()
+        key = ('response', request.path, tuple(sorted(request.args.items(multi=True))), g.block)
+        rendered = {}
+
+        async def render(keys):
+            rendered['response'] = response = await app.make_response(await view(*args, **kwargs))
+            if response.status_code != 200:
+                return {}
+            body = await response.get_data()
+            return {key: (body, response_etag(body))}
+
+        # render needs this request's context, so expired responses are re-rendered, never refreshed in the background
+        cached = (await cache.get_many_async([key], render, RESPONSE_TTL, stale_ttl=0))[key]
+        if cached is None:
+            return rendered.get('response') or await view(*args, **kwargs)
+        body, etag = cached
+        return pinned_response(Response, body, etag, g.block, request.if_none_match)
+    return wrapper
+
+@app.before_serving
+async def start_background_workers():
+    # Indexer, leaderboard and block watcher are shared with the Flask app and run in threads;
+    # with SHARED_STATE_URL set, only one of several hypercorn workers runs them
+    server.start_worker()
+
+@app.after_serving
+async def close_rpc_sessions():
+    await aw3.provider.close()
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+async def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else None
+        metrics.observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+    return response
+
+# Routes
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    connected = await aw3.is_connected()
+    return jsonify({
+        'status': 'healthy',
+        'network': NETWORK,
+        'connected': connected,
+        'block_number': await aw3.eth.block_number if connected else None,
+        'rpc_endpoints': aw3.provider.status()
+    })
+
+@app.route('/api/contracts', methods=['GET'])
+async def get_contracts():
+    return jsonify({
+        'contracts': CONTRACT_ADDRESSES,
+        'network': NETWORK
+    })
+
+@app.route('/api/contracts', methods=['POST'])
+async def set_contracts():
+    """Set contract addresses after deployment"""
+    data = await request.get_json()
+    await asyncio.to_thread(server.set_contract_addresses, data)
+    return jsonify({'message': 'Contract addresses updated', 'contracts': CONTRACT_ADDRESSES})
+
+@app.route('/api/token/stats', methods=['GET'])
+@block_cached
+async def get_token_stats():
+    try:
+        return jsonify({
+            'success': True,
+            'data': (await cache.get_many_async(['token_stats'], pinned(load_stats, g.block), STATS_TTL))['token_stats'],
+            'block_number': g.block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/token/balance/<address>', methods=['GET'])
+@block_cached
+async def get_token_balance(address):
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token']:
+            return jsonify({'error': 'Token contract not deployed yet'}), 400
+
+        if not Web3.is_address(address):
+            return jsonify({'error': 'Invalid address'}), 400
+
+        address = address.lower()
+        balance = (await account_reads(address, ('balance',), g.block))[('balance', address)]
+
+        return jsonify({
+            'success': True,
+            'balance': balance,
+            'balance_formatted': Web3.from_wei(balance, 'ether'),
+            'block_number': g.block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/token/balances', methods=['POST'])
+async def get_token_balances():
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token']:
+            return jsonify({'error': 'Token contract not deployed yet'}), 400
+
+        addresses, error = parse_address_list(await request.get_json(silent=True))
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Misses go through the Multicall3 batcher so the whole page costs one RPC round
+        block = await current_block()
+        reads = await asyncio.to_thread(server.bulk_account_reads, addresses, ('balance',), block)
+        return jsonify({
+            'success': True,
+            'balances': {address: format_balance(reads[('balance', address)]) for address in addresses},
+            'block_number': block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/token/holders', methods=['GET'])
+async def get_token_holders():
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token']:
+            return jsonify({'error': 'Token contract not deployed yet'}), 400
+        if not server.holder_ledger:
+            return jsonify({'error': 'Holder index not available yet'}), 503
+
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        rows, total = server.holder_ledger.top(limit, offset)
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'holders': [dict(row, balance_formatted=Web3.from_wei(row['balance'], 'ether')) for row in rows],
+                'holder_count': total,
+                'limit': limit,
+                'offset': offset,
+                'synced': server.token_indexer.synced
+            }
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/token/holders/reconcile', methods=['GET'])
+async def get_holder_reconciliation():
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token']:
+            return jsonify({'error': 'Token contract not deployed yet'}), 400
+        if not server.holder_ledger:
+            return jsonify({'error': 'Holder index not available yet'}), 503
+
+        return jsonify({
+            'success': True,
+            'data': await asyncio.to_thread(server.reconcile_supply)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/user/profile/<address>', methods=['GET'])
+@block_cached
+async def get_user_profile(address):
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token']:
+            return jsonify({'error': 'Token contract not deployed yet'}), 400
+
+        if not Web3.is_address(address):
+            return jsonify({'error': 'Invalid address'}), 400
+
+        kinds = ('profile', 'inbox_price', 'balance')
+        reads = await account_reads(address.lower(), kinds, g.block)
+        profile, inbox_price, balance = [reads[(kind, address.lower())] for kind in kinds]
+
+        return jsonify({
+            'success': True,
+            'profile': format_profile(address, profile, inbox_price, balance),
+            'block_number': g.block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/user/profiles', methods=['POST'])
+async def get_user_profiles():
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token']:
+            return jsonify({'error': 'Token contract not deployed yet'}), 400
+
+        addresses, error = parse_address_list(await request.get_json(silent=True))
+        if error:
+            return jsonify({'error': error}), 400
+
+        block = await current_block()
+        reads = await asyncio.to_thread(server.bulk_account_reads, addresses, ('profile', 'inbox_price', 'balance'), block)
+        return jsonify({
+            'success': True,
+            'profiles': {
+                address: format_profile(Web3.to_checksum_address(address), reads[('profile', address)],
+                                        reads[('inbox_price', address)], reads[('balance', address)])
+                for address in addresses
+            },
+            'block_number': block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/quote', methods=['GET', 'POST'])
+async def get_quote():
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token'] or not CONTRACT_ADDRESSES['messaging']:
+            return jsonify({'error': 'Contracts not deployed yet'}), 400
+
+        if request.method == 'POST':
+            data = await request.get_json(silent=True)
+        else:
+            data = dict(request.args, recipients=[r for r in request.args.get('recipients', '').split(',') if r])
+        sender, recipients, amount, error = parse_quote_request(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        block = await current_block()
+        quote, error = await asyncio.to_thread(server.build_quote, sender, recipients, amount, block)
+        if error:
+            return jsonify({'error': error}), 503
+        return jsonify({
+            'success': True,
+            'quote': quote,
+            'block_number': block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/messages/inbox/<address>', methods=['GET'])
+async def get_user_inbox(address):
+    return await list_messages('inbox', address)
+
+@app.route('/api/messages/sent/<address>', methods=['GET'])
+async def get_user_sent_messages(address):
+    return await list_messages('sent', address)
+
+async def list_messages(kind, address):
+    """Cursor-paginated inbox or sent messages: ?before=<id>&limit=N"""
+    try:
+        if not CONTRACT_ADDRESSES['messaging']:
+            return jsonify({'error': 'Messaging contract not deployed yet'}), 400
+
+        if not Web3.is_address(address):
+            return jsonify({'error': 'Invalid address'}), 400
+
+        before = request.args.get('before', type=int)
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        # Index lookups and incremental ID list syncs are short - run them off the loop
+        page_ids, next_cursor = await asyncio.to_thread(server.page_message_ids, kind, address, before, limit)
+
+        results = await cache.get_many_async([('message', msg_id) for msg_id in page_ids], load_messages, MESSAGE_TTL)
+        server.prefetch_content(results.values())
+
+        messages = []
+        for msg_id in page_ids:
+            message = results[('message', msg_id)]
+            if message is None:
+                print(f"Error fetching message {msg_id}")
+                continue
+            messages.append(format_message(msg_id, message))
+
+        return jsonify({
+            'success': True,
+            'messages': messages,
+            'next_cursor': next_cursor
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/content/<cid>', methods=['GET'])
+async def get_content(cid):
+    """Bytes of a message's IPFS attachment from the local cache; supports Range and If-None-Match"""
+    # A cache miss waits on the download, so look it up off the loop
+    entry, error, status = await asyncio.to_thread(server.find_content, cid)
+    if error:
+        return jsonify({'error': error}), status
+    path, content_type, size = entry
+    # ASGI has no sendfile, so Quart streams the file in chunks
+    response = await send_file(path, mimetype=content_type or 'application/octet-stream',
+                               add_etags=False, cache_timeout=CONTENT_MAX_AGE)
+    response.set_etag(cid)
+    await response.make_conditional(request, accept_ranges=True, complete_length=size)
+    return content_headers(response)
+
+@app.route('/api/messages/search', methods=['GET'])
+async def search_messages():
+    """Search stored messages, newest first; same parameters as server.py"""
+    try:
+        if not CONTRACT_ADDRESSES['messaging']:
+            return jsonify({'error': 'Messaging contract not deployed yet'}), 400
+
+        filters, error = parse_search_filters(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+
+        results, next_cursor = await asyncio.to_thread(message_store.search, **filters)
+        return jsonify({
+            'success': True,
+            'messages': [format_message(msg_id, message) for msg_id, message in results],
+            'next_cursor': next_cursor
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/presale/stats', methods=['GET'])
+@block_cached
+async def get_presale_stats():
+    try:
+        return jsonify({
+            'success': True,
+            'data': (await cache.get_many_async(['presale_stats'], pinned(load_stats, g.block), STATS_TTL))['presale_stats'],
+            'block_number': g.block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/presale/history', methods=['GET'])
+async def get_presale_history():
+    try:
+        if not CONTRACT_ADDRESSES['presale']:
+            return jsonify({'error': 'Presale contract not deployed yet'}), 400
+        if not server.presale_analytics:
+            return jsonify({'error': 'Presale analytics not available yet'}), 503
+
+        start = request.args.get('from', type=int)
+        end = request.args.get('to', type=int)
+        points = min(max(request.args.get('points', 200, type=int), 1), 1000)
+        rows, step = server.presale_analytics.history(start, end, points)
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'step': step,
+                'points': format_presale_history(rows),
+                'synced': server.presale_indexer.synced
+            }
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/presale/phases', methods=['GET'])
+async def get_presale_phases():
+    try:
+        if not CONTRACT_ADDRESSES['presale']:
+            return jsonify({'error': 'Presale contract not deployed yet'}), 400
+        if not server.presale_analytics:
+            return jsonify({'error': 'Presale analytics not available yet'}), 503
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'phases': [format_presale_phase(phase) for phase in server.presale_analytics.phase_stats()],
+                'synced': server.presale_indexer.synced
+            }
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/leaderboard', methods=['GET'])
+async def get_leaderboard():
+    try:
+        if not CONTRACT_ADDRESSES['messaging']:
+            return jsonify({'error': 'Messaging contract not deployed yet'}), 400
+        if not server.leaderboard_engine:
+            return jsonify({'error': 'Leaderboard not available yet'}), 503
+
+        window = request.args.get('window', 'all')
+        if window not in WINDOWS:
+            return jsonify({'error': f"Invalid window, expected one of: {', '.join(WINDOWS)}"}), 400
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+
+        return jsonify({
+            'success': True,
+            'data': build_leaderboard(window, limit, offset)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stream', methods=['GET'])
+async def stream_updates():
+    """Server-Sent Events stream: ?address=<address>&topics=inbox,presale"""
+    address = request.args.get('address')
+    topics = set(request.args.get('topics', 'inbox,presale').split(','))
+
+    if address and not Web3.is_address(address):
+        return jsonify({'error': 'Invalid address'}), 400
+    if 'inbox' in topics and not address:
+        return jsonify({'error': 'Address required for inbox updates'}), 400
+
+    subscription = event_hub.subscribe(address, topics, loop=asyncio.get_running_loop())
+    if subscription is None:
+        return jsonify({'error': 'Too many streaming clients'}), 503
+
+    async def generate():
+        try:
+            yield b': connected\n\n'
+            while True:
+                update = await subscription.get_async(timeout=STREAM_KEEPALIVE)
+                yield (format_sse(update) if update else ': keepalive\n\n').encode()
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    response = await app.make_response(generate())
+    response.timeout = None
+    response.headers['Content-Type'] = 'text/event-stream'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.websocket('/api/ws')
+async def websocket_updates():
+    """WebSocket variant of /api/stream; each update is sent as one JSON text frame"""
+    address = websocket.args.get('address')
+    topics = set(websocket.args.get('topics', 'inbox,presale').split(','))
+    if (address and not Web3.is_address(address)) or ('inbox' in topics and not address):
+        await websocket.close(1008)
+        return
+
+    subscription = event_hub.subscribe(address, topics, loop=asyncio.get_running_loop())
+    if subscription is None:
+        await websocket.close(1013)
+        return
+    try:
+        while True:
+            update = await subscription.get_async(timeout=STREAM_KEEPALIVE)
+            if update is not None:
+                await websocket.send(json.dumps(update, default=str))
+    finally:
+        event_hub.unsubscribe(subscription)
+
+@app.route('/api/indexer/status', methods=['GET'])
+async def get_indexer_status():
+    return jsonify({
+        'success': True,
+        'indexer': server.message_indexer.status() if server.message_indexer else None,
+        'presale_indexer': server.presale_indexer.status() if server.presale_indexer else None,
+        'token_indexer': server.token_indexer.status() if server.token_indexer else None,
+        'price_indexer': server.price_indexer.status() if server.price_indexer else None
+    })
+
+@app.route('/api/auth/nonce/<address>', methods=['GET'])
+async def get_auth_nonce(address):
+    """Generate nonce for wallet authentication"""
+    if not Web3.is_address(address):
+        return jsonify({'error': 'Invalid address'}), 400
+
+    nonce = nonce_store.issue(address)
+
+    return jsonify({
+        'success': True,
+        'nonce': nonce
+    })
+
+@app.route('/api/auth/verify', methods=['POST'])
+async def verify_signature():
+    """Verify signed message for wallet authentication"""
+    data = await request.get_json()
+    address = data.get('address')
+    message = data.get('message')
+    signature = data.get('signature')
+
+    if not all([address, message, signature]):
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    try:
+        # ECDSA recovery is CPU-bound - keep it off the event loop
+        recovered_address = await asyncio.to_thread(recover_signer, message, signature)
+
+        session = complete_login(address, recovered_address)
+        if not session:
+            return jsonify({'error': 'Invalid signature'}), 401
+        if not nonce_store.consume(address, message):
+            return jsonify({'error': 'Invalid or expired nonce'}), 401
+
+        return jsonify({
+            'success': True,
+            'token': session['token'],
+            'expires_at': session['expires_at'],
+            'address': address
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'Verification failed: {str(e)}'}), 401
+
+@app.route('/api/auth/verify/batch', methods=['POST'])
+async def verify_signatures_batch():
+    """Verify many signed messages at once: {"items": [{address, message, signature}, ...]}"""
+    data = await request.get_json() or {}
+    items = data.get('items')
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Missing items'}), 400
+    if len(items) > AUTH_BATCH_LIMIT:
+        return jsonify({'error': f'At most {AUTH_BATCH_LIMIT} items per batch'}), 400
+    if not all(isinstance(item, dict) and all([item.get('address'), item.get('message'), item.get('signature')])
+               for item in items):
+        return jsonify({'error': 'Missing required fields'}), 400
+
+    recovered = await asyncio.to_thread(
+        signature_verifier.recover_many, [(item['message'], item['signature']) for item in items]
+    )
+    return jsonify({
+        'success': True,
+        'results': [format_verification(item, address, error)
+                    for item, (address, error) in zip(items, recovered)]
+    })
+
+@app.route('/api/auth/session', methods=['GET'])
+async def get_session():
+    """Check a session token without touching signatures or the chain"""
+    address = session_address(request.headers.get('Authorization'))
+    if not address:
+        return jsonify({'error': 'Authentication required'}), 401
+    return jsonify({
+        'success': True,
+        'address': address
+    })
+
+if __name__ == '__main__':
+    print(f"Starting async TXSPEAK Backend on {NETWORK} network")
+    app.run(host='0.0.0.0', port=8003)
@@ -0,0 +1,220 @@
+"""
+Wallet authentication for TXSPEAK backend
+ECDSA recovery runs in a process pool, with an LRU of recent results; logins
+consume single-use nonces and return HMAC-signed session tokens
+"""
+
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+
+def recover_signer(message, signature):
+    """Recover the address that personal_sign-ed a text message"""
+    return Account.recover_message(encode_defunct(text=message), signature=signature)
+
+
+def _recover_chunk(pairs):
+    # Runs in a worker process: returns (address, None) or (None, error) per pair
+    results = []
+    for message, signature in pairs:
+        try:
+            results.append((recover_signer(message, signature), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
+class SignatureVerifier:
+    """Recovers signers off the request threads and memoizes the results.
+
+    ``(message, signature)`` pairs map deterministically to one address (or
+    one error), so results are kept in a bounded LRU and retried
+    verifications cost a dict lookup. Misses are split into chunks across a
+    process pool so recovery does not hold the server's GIL. ``workers=0``
+    recovers inline.
+    """
+
+    def __init__(self, workers=None, cache_size=10000, min_chunk=16):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.cache_size = cache_size
+        self.min_chunk = min_chunk
+        self.lock = threading.Lock()
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.executor = None
+        if self.workers:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('fork')
+            )
+
+    def start(self):
+        """Fork the worker processes now, before the server starts its background threads"""
+        if self.executor:
+            list(self.executor.map(_recover_chunk, [[] for _ in range(self.workers)]))
+
+    def recover(self, message, signature):
+        """Recovered address for one pair; raises ValueError if the signature is malformed"""
+        address, error = self.recover_many([(message, signature)])[0]
+        if error is not None:
+            raise ValueError(error)
+        return address
+
+    def recover_many(self, pairs):
+        """Return (address, error) for each (message, signature) pair, in order"""
+        results = [None] * len(pairs)
+        missing = {}
+        with self.lock:
+            for i, pair in enumerate(pairs):
+                cached = self.results.get(pair)
+                if cached is not None:
+                    self.results.move_to_end(pair)
+                    results[i] = cached
+                    self.hits += 1
+                else:
+                    missing.setdefault(pair, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            todo = list(missing)
+            for pair, result in zip(todo, self._recover_uncached(todo)):
+                for i in missing[pair]:
+                    results[i] = result
+            with self.lock:
+                for pair, result in zip(todo, [results[missing[pair][0]] for pair in todo]):
+                    self.results[pair] = result
+                while len(self.results) > self.cache_size:
+                    self.results.popitem(last=False)
+        return results
+
+    def _recover_uncached(self, pairs):
+        if not self.executor:
+            return _recover_chunk(pairs)
+        size = max(self.min_chunk, -(-len(pairs) // self.workers))
+        chunks = [pairs[i:i + size] for i in range(0, len(pairs), size)]
+        return [result for chunk in self.executor.map(_recover_chunk, chunks) for result in chunk]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'cached': len(self.results),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class NonceStore:
+    """Single-use login nonces with a bounded lifetime.
+
+    Nonces are kept in issue order, and all share one TTL, so expired entries
+    are always at the front and sweeping them is amortized O(1) per issue.
+    The store never holds more than ``max_entries`` outstanding nonces.
+    """
+
+    PREFIX = 'Please sign this message to authenticate with TXSPEAK: '
+
+    def __init__(self, ttl=300, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.nonces = OrderedDict()
+
+    def issue(self, address):
+        """Create a nonce for address and return the message the wallet should sign"""
+        message = f"{self.PREFIX}{secrets.token_hex(16)}:{int(time.time())}"
+        now = time.monotonic()
+        with self.lock:
+            self._sweep(now)
+            while len(self.nonces) >= self.max_entries:
+                self.nonces.popitem(last=False)
+            self.nonces[message] = (address.lower(), now + self.ttl)
+        return message
+
+    def consume(self, address, message):
+        """Use up a nonce; True only once, for the address it was issued to, before it expires"""
+        with self.lock:
+            entry = self.nonces.pop(message, None)
+        if entry is None:
+            return False
+        owner, expires = entry
+        return owner == address.lower() and time.monotonic() < expires
+
+    def _sweep(self, now):
+        while self.nonces:
+            message, (_, expires) = next(iter(self.nonces.items()))
+            if expires > now:
+                break
+            del self.nonces[message]
+
+    def __len__(self):
+        return len(self.nonces)
+
+
+class SharedNonceStore:
+    """NonceStore over a shared state store, so a nonce issued by one worker can be consumed by any"""
+
+    PREFIX = NonceStore.PREFIX
+
+    def __init__(self, store, ttl=300):
+        self.store = store
+        self.ttl = ttl
+
+    def issue(self, address):
+        message = f"{self.PREFIX}{secrets.token_hex(16)}:{int(time.time())}"
+        self.store.set(f"nonce:{message}", address.lower(), self.ttl)
+        return message
+
+    def consume(self, address, message):
+        owner = self.store.pop(f"nonce:{message}")
+        return owner is not None and owner == address.lower()
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+class SessionTokens:
+    """Stateless session tokens: ``<address>.<expiry>.<HMAC-SHA256>``.
+
+    Checking one is a single HMAC over a few dozen bytes, with no storage
+    lookup, signature recovery or chain read. Every process that verifies
+    tokens must share the secret.
+    """
+
+    def __init__(self, secret, ttl=24 * 3600):
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.ttl = ttl
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, address):
+        """Return (token, expires_at) for address"""
+        expires_at = int(time.time()) + self.ttl
+        payload = f"{address.lower()}.{expires_at}"
+        return f"{payload}.{self._sign(payload)}", expires_at
+
+    def verify(self, token):
+        """Return the session address, or None for a forged, malformed or expired token"""
+        try:
+            address, expires_at, signature = token.split('.')
+            payload = f"{address}.{expires_at}"
+            # compare_digest rejects non-ASCII str; as bytes a forged signature is just a mismatch
+            if not hmac.compare_digest(signature.encode('ascii'), self._sign(payload).encode('ascii')):
+                return None
+            if int(expires_at) < time.time():
+                return None
+        except (ValueError, AttributeError):
+            return None
+        return address
@@ -0,0 +1,112 @@
+"""
+Read batching for TXSPEAK backend
+Packs independent contract reads into a single Multicall3 aggregate3 eth_call
+"""
+
+import time
+from web3 import Web3
+from contracts import PreparedCall
+
+# Multicall3 is deployed at the same address on mainnet, Sepolia and most testnets
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
+    }
+]
+
+
+class CallBatcher:
+    """Run many contract function calls in one round trip.
+
+    Calls are bound contract functions, e.g. ``contract.functions.getMessage(1)``,
+    or PreparedCalls from the contract registry, which skip web3's per-call
+    setup. Results come back in the same order, decoded the same way
+    ``.call()`` would decode them. A call that reverts yields ``None``.
+    """
+
+    def __init__(self, w3, multicall_address=MULTICALL3_ADDRESS, retry_after=300):
+        self.w3 = w3
+        self.multicall = w3.eth.contract(
+            address=Web3.to_checksum_address(multicall_address),
+            abi=MULTICALL3_ABI
+        )
+        self.retry_after = retry_after
+        self.unavailable_until = 0
+
+    def call(self, calls, block_identifier='latest'):
+        """Execute calls, batched through Multicall3 when it is available"""
+        calls = list(calls)
+        if not calls:
+            return []
+        if len(calls) > 1 and time.time() >= self.unavailable_until:
+            try:
+                return self._call_multicall(calls, block_identifier)
+            except Exception as e:
+                # No aggregator on this chain (or it reverted) - back off and read one by one
+                print(f"Multicall unavailable, falling back to single calls: {e}")
+                self.unavailable_until = time.time() + self.retry_after
+        return self._call_each(calls, block_identifier)
+
+    def _call_multicall(self, calls, block_identifier):
+        payload = [
+            (fn.address, True, fn.encode() if isinstance(fn, PreparedCall) else fn._encode_transaction_data())
+            for fn in calls
+        ]
+        results = self.multicall.functions.aggregate3(payload).call(block_identifier=block_identifier)
+
+        decoded = []
+        for fn, (success, data) in zip(calls, results):
+            if not success:
+                decoded.append(None)
+                continue
+            decoded.append(self._decode(fn, data))
+        return decoded
+
+    def _call_each(self, calls, block_identifier):
+        results = []
+        for fn in calls:
+            try:
+                results.append(fn.call(block_identifier=block_identifier))
+            except Exception as e:
+                print(f"Call {fn.fn_name} failed: {e}")
+                results.append(None)
+        return results
+
+    def _decode(self, fn, data):
+        if isinstance(fn, PreparedCall):
+            return fn.decode(data)
+        output_types = [output['type'] for output in fn.abi['outputs']]
+        values = list(self.w3.codec.decode(output_types, data))
+        for i, output_type in enumerate(output_types):
+            if output_type == 'address':
+                values[i] = Web3.to_checksum_address(values[i])
+        if len(values) == 1:
+            return values[0]
+        return values
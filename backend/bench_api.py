@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+API load benchmark for TXSPEAK backend
+Deploys the contracts on an in-process chain (local_chain.py), seeds it, then drives
+every /api/* route concurrently through the Flask app and reports throughput,
+p50/p99 latency and RPC calls per request for each route.
+
+Usage: python bench_api.py [--users 200] [--messages 500] [--purchases 200]
+                           [--requests 500] [--concurrency 16] [--latency-ms 20]
+                           [--json out.json] [--baseline old.json --tolerance 0.2]
+
+With --baseline, exits non-zero when a route's p99 or RPC calls per request
+regress by more than the tolerance. /api/stream and /api/ws are long-lived and
+not driven here.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from web3 import Web3
+import local_chain
+import metrics
+from local_chain import SimulatedChain, request_scope
+from provider import use_web3
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def build_scenarios(users, message_senders, cids):
+    """(route label, request function) pairs; each function makes one logical API request"""
+    addresses = [address for address, _ in users]
+    keys = dict(users)
+
+    def login(client, rng):
+        address = rng.choice(addresses)
+        nonce = client.get(f'/api/auth/nonce/{address}').get_json()['nonce']
+        signature = Account.sign_message(encode_defunct(text=nonce), private_key=keys[address]).signature.hex()
+        return client.post('/api/auth/verify', json={'address': address, 'message': nonce, 'signature': signature})
+
+    def verify_batch(client, rng):
+        items = []
+        for address in rng.sample(addresses, 20):
+            nonce = client.get(f'/api/auth/nonce/{address}').get_json()['nonce']
+            signature = Account.sign_message(encode_defunct(text=nonce), private_key=keys[address]).signature.hex()
+            items.append({'address': address, 'message': nonce, 'signature': signature})
+        return client.post('/api/auth/verify/batch', json={'items': items})
+
+    session = {}
+
+    def check_session(client, rng):
+        if 'token' not in session:
+            session['token'] = login(client, rng).get_json()['token']
+        return client.get('/api/auth/session', headers={'Authorization': f"Bearer {session['token']}"})
+
+    return [
+        ('GET /api/health', lambda c, r: c.get('/api/health')),
+        ('GET /api/contracts', lambda c, r: c.get('/api/contracts')),
+        ('GET /api/token/stats', lambda c, r: c.get('/api/token/stats')),
+        ('GET /api/token/balance', lambda c, r: c.get(f'/api/token/balance/{r.choice(addresses)}')),
+        ('POST /api/token/balances', lambda c, r: c.post('/api/token/balances', json={'addresses': r.sample(addresses, 50)})),
+        ('GET /api/token/holders', lambda c, r: c.get('/api/token/holders?limit=50')),
+        ('GET /api/token/holders/reconcile', lambda c, r: c.get('/api/token/holders/reconcile')),
+        ('GET /api/user/profile', lambda c, r: c.get(f'/api/user/profile/{r.choice(addresses)}')),
+        ('POST /api/user/profiles', lambda c, r: c.post('/api/user/profiles', json={'addresses': r.sample(addresses, 50)})),
+        ('GET /api/quote', lambda c, r: c.get(
+            f"/api/quote?sender={r.choice(addresses)}&recipients={','.join(r.sample(addresses, 3))}&amount=10"
+        )),
+        ('POST /api/quote (50)', lambda c, r: c.post('/api/quote', json={
+            'sender': r.choice(addresses), 'recipients': r.sample(addresses, 50), 'amount': 10
+        })),
+        ('GET /api/messages/inbox', lambda c, r: c.get(f'/api/messages/inbox/{r.choice(message_senders)}?limit=20')),
+        ('GET /api/messages/sent', lambda c, r: c.get(f'/api/messages/sent/{r.choice(message_senders)}?limit=20')),
+        ('GET /api/messages/search', lambda c, r: c.get(
+            f"/api/messages/search?q=message+body+{r.randrange(100)}&type={r.choice(('text', 'pitch', 'question'))}"
+        )),
+        ('GET /api/content', lambda c, r: c.get(f'/api/content/{r.choice(cids)}')),
+        ('GET /api/content (range)', lambda c, r: c.get(f'/api/content/{r.choice(cids)}', headers={'Range': 'bytes=0-65535'})),
+        ('GET /api/presale/stats', lambda c, r: c.get('/api/presale/stats')),
+        ('GET /api/presale/history', lambda c, r: c.get('/api/presale/history?points=200')),
+        ('GET /api/presale/phases', lambda c, r: c.get('/api/presale/phases')),
+        ('GET /api/leaderboard', lambda c, r: c.get(f"/api/leaderboard?window={r.choice(('all', '7d', '24h'))}&limit=20")),
+        ('GET /api/indexer/status', lambda c, r: c.get('/api/indexer/status')),
+        ('GET /api/auth/nonce', lambda c, r: c.get(f'/api/auth/nonce/{r.choice(addresses)}')),
+        ('login (nonce + verify)', login),
+        ('POST /api/auth/verify/batch (20)', verify_batch),
+        ('GET /api/auth/session', check_session),
+    ]
+
+
+def drive(app, chain, label, request_fn, total, concurrency):
+    """Run total requests from concurrency threads; returns the route's result row"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        request_scope.label = label
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                response = request_fn(client, rng)
+                failed = response.status_code >= 400
+            except Exception as e:
+                print(f"{label}: {e}")
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += failed
+
+    chain.reset_counts()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), name=f'bench-{i}') for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        'route': label,
+        'requests': total,
+        'errors': errors[0],
+        'throughput': total / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'rpc_per_request': chain.labels[label] / total,
+        'background_rpc': chain.labels['background']
+    }
+
+
+def chain_activity(w3, token, users, interval, stop):
+    """Keep producing blocks with transfers so invalidation and indexing stay in the picture"""
+    rng = random.Random(7)
+    addresses = [address for address, _ in users]
+    while not stop.wait(interval):
+        sender, recipient = rng.sample(addresses, 2)
+        try:
+            token.functions.transfer(recipient, Web3.to_wei(1, 'ether')).transact({'from': sender})
+        except Exception as e:
+            print(f"Chain activity failed: {e}")
+
+
+def compare(rows, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {row['route']: row for row in json.load(f)['routes']}
+    regressions = []
+    for row in rows:
+        old = baseline.get(row['route'])
+        if not old:
+            continue
+        if row['p99_ms'] > old['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{row['route']}: p99 {old['p99_ms']:.1f}ms -> {row['p99_ms']:.1f}ms")
+        if row['rpc_per_request'] > old['rpc_per_request'] * (1 + tolerance) + 0.01:
+            regressions.append(f"{row['route']}: RPC/request {old['rpc_per_request']:.2f} -> {row['rpc_per_request']:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--purchases', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=20, help='simulated RPC round trip')
+    parser.add_argument('--tx-interval', type=float, default=1.0, help='seconds between background transfers')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    chain = SimulatedChain()
+    w3 = use_web3(Web3(metrics.instrument_provider(chain)))
+
+    print('Deploying contracts...')
+    contracts = local_chain.deploy_all(w3)
+    print(f"Seeding {args.users} users, {args.messages} messages, {args.purchases} purchases...")
+    users = local_chain.create_users(w3, args.users)
+    workdir = tempfile.mkdtemp(prefix='txspeak-bench-')
+    # IPFS attachments are served by a local directory standing in for the gateway
+    content_dir = os.path.join(workdir, 'ipfs')
+    os.makedirs(content_dir)
+    cids = local_chain.seed(w3, contracts, users, messages=args.messages, purchases=args.purchases,
+                            content_dir=content_dir)
+
+    os.environ.update({
+        'IPFS_GATEWAY': f'file://{content_dir}',
+        'CONTENT_CACHE_DIR': os.path.join(workdir, 'content'),
+        'MULTICALL_ADDRESS': contracts['multicall'].address,
+        'INDEX_DB_PATH': os.path.join(workdir, 'index.db'),
+        'MESSAGE_DB_PATH': os.path.join(workdir, 'messages.db'),
+        'HOLDER_SNAPSHOT_PATH': os.path.join(workdir, 'holders.json'),
+        'BLOCK_POLL_INTERVAL': '0.5'
+    })
+    import server
+
+    server.signature_verifier.start()
+    client = server.app.test_client()
+    client.post('/api/contracts', json={key: contracts[key].address for key in ('txspk_token', 'messaging', 'presale')})
+    server.update_cache()
+    server.block_watcher.start()
+
+    print('Waiting for the indexers to catch up...')
+    while not all(indexer.synced for indexer in server.running_indexers()):
+        time.sleep(0.2)
+
+    senders = list({address for address, _ in users})
+    scenarios = build_scenarios(users, senders, cids)
+    chain.latency = args.latency_ms / 1000
+    stop = threading.Event()
+    threading.Thread(
+        target=chain_activity, args=(w3, contracts['txspk_token'], users, args.tx_interval, stop), daemon=True
+    ).start()
+
+    rows = []
+    print(f"\n{'route':<36} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'RPC/req':>8} {'errors':>7}")
+    for label, request_fn in scenarios:
+        row = drive(server.app, chain, label, request_fn, args.requests, args.concurrency)
+        rows.append(row)
+        print(f"{label:<36} {row['throughput']:9.1f} {row['p50_ms']:9.2f} {row['p99_ms']:9.2f} "
+              f"{row['rpc_per_request']:8.2f} {row['errors']:7d}")
+    stop.set()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'routes': rows}, f, indent=2)
+    if args.baseline:
+        regressions = compare(rows, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Signature verification benchmark for TXSPEAK backend
+Reports verifications per second (total and per core) for inline recovery,
+the process pool, and memoized retries.
+
+Usage: python bench_auth.py [count] [workers]
+"""
+
+import os
+import sys
+import time
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from auth import SignatureVerifier
+
+
+def make_signed_messages(count):
+    pairs = []
+    for i in range(count):
+        account = Account.create()
+        message = f"Please sign this message to authenticate with TXSPEAK: {int(time.time()) + i}"
+        signed = Account.sign_message(encode_defunct(text=message), private_key=account.key)
+        pairs.append((account.address, message, signed.signature.hex()))
+    return pairs
+
+
+def run(label, verifier, pairs, cores):
+    start = time.perf_counter()
+    results = verifier.recover_many([(message, signature) for _, message, signature in pairs])
+    elapsed = time.perf_counter() - start
+    valid = sum(1 for (address, _, _), (recovered, _) in zip(pairs, results) if recovered == address)
+    rate = len(pairs) / elapsed
+    print(f"{label:<22} {len(pairs):>7} sigs  {elapsed:8.3f}s  {rate:10.0f}/s  {rate / cores:10.0f}/s/core  valid={valid}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+
+    print(f"Signing {count} messages...")
+    pairs = make_signed_messages(count)
+
+    inline = SignatureVerifier(workers=0, cache_size=0)
+    run('inline', inline, pairs, 1)
+
+    pooled = SignatureVerifier(workers=workers, cache_size=count)
+    pooled.start()
+    run(f'pool ({workers} workers)', pooled, pairs, workers)
+    run('pool, memoized retry', pooled, pairs, 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Contract call setup benchmark for TXSPEAK backend
+Measures the per-request cost of building a contract call and decoding its
+result, for a fresh w3.eth.contract per request (the old get_contract_instance
+path) versus the prebuilt ContractRegistry codecs. No node is contacted.
+
+Usage: python bench_contracts.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+# Keep the server's SQLite stores out of the working directory
+os.environ.setdefault('INDEX_DB_PATH', ':memory:')
+os.environ.setdefault('MESSAGE_DB_PATH', ':memory:')
+
+from web3 import Web3
+from contracts import ContractRegistry
+from server import MESSAGING_ABI, PRESALE_ABI, TXSPK_TOKEN_ABI
+
+MESSAGING_ADDRESS = '0x' + '11' * 20
+PRESALE_ADDRESS = '0x' + '22' * 20
+TOKEN_ADDRESS = '0x' + '33' * 20
+USER = Web3.to_checksum_address('0x' + 'ab' * 20)
+
+
+def sample_return_data(w3):
+    """Encoded return data for one getMessage, as the node would send it"""
+    output_types = [output['type'] for output in next(
+        item for item in MESSAGING_ABI if item.get('name') == 'getMessage'
+    )['outputs']]
+    values = [USER, USER, 'Hello', 'Message body ' * 8, 'Qm' + 'x' * 44, 10 ** 18, 1700000000, 1, 'paid', False]
+    return w3.codec.encode(output_types, values)
+
+
+def per_request(w3, data, iterations):
+    """Old path: build the contract from the ABI, encode via ContractFunction, index the tuple by hand"""
+    address = Web3.to_checksum_address(MESSAGING_ADDRESS)
+    token_address = Web3.to_checksum_address(TOKEN_ADDRESS)
+    start = time.perf_counter()
+    for i in range(iterations):
+        contract = w3.eth.contract(address=address, abi=MESSAGING_ABI)
+        fn = contract.functions.getMessage(i)
+        fn._encode_transaction_data()
+        values = w3.codec.decode([output['type'] for output in fn.abi['outputs']], data)
+        {'sender': values[0], 'recipient': values[1], 'subject': values[2], 'amount': values[5]}
+        token = w3.eth.contract(address=token_address, abi=TXSPK_TOKEN_ABI)
+        token.functions.balanceOf(USER)._encode_transaction_data()
+    return time.perf_counter() - start
+
+
+def registry(w3, data, iterations):
+    """New path: look up the prebuilt binding, encode with its codec, decode into a Message record"""
+    contracts = ContractRegistry(w3, {
+        'txspk_token': TXSPK_TOKEN_ABI,
+        'messaging': MESSAGING_ABI,
+        'presale': PRESALE_ABI
+    })
+    contracts.update({'txspk_token': TOKEN_ADDRESS, 'messaging': MESSAGING_ADDRESS, 'presale': PRESALE_ADDRESS})
+    start = time.perf_counter()
+    for i in range(iterations):
+        call = contracts['messaging'].getMessage(i)
+        call.encode()
+        message = call.decode(data)
+        {'sender': message.sender, 'recipient': message.recipient, 'subject': message.subject, 'amount': message.amount}
+        contracts['txspk_token'].balanceOf(USER).encode()
+    return time.perf_counter() - start
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    w3 = Web3()
+    data = sample_return_data(w3)
+
+    for label, run in (('per-request contract', per_request), ('contract registry', registry)):
+        elapsed = run(w3, data, iterations)
+        print(f"{label:<22} {iterations:>7} requests  {elapsed:8.3f}s  {elapsed / iterations * 1e6:10.1f}us/request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+New-block watcher for TXSPEAK backend
+Fetches the logs of watched contracts for each new block and hands them to subscribers
+"""
+
+import asyncio
+import json
+import threading
+import time
+from eth_utils import event_abi_to_log_topic
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+
+class BlockWatcher:
+    """Follows the chain head and dispatches decoded logs block by block.
+
+    The head is polled over HTTP every ``poll_interval`` seconds. When a
+    WebSocket URL is configured (and the websockets package is installed) an
+    ``eth_subscribe`` newHeads subscription wakes the watcher as soon as a block
+    arrives. Nothing is read when no new block has been produced.
+
+    Subscribers are called as ``callback(block_number, events)``; when the
+    watcher falls more than ``max_range`` blocks behind it skips ahead and
+    calls ``callback(block_number, None)`` so caches can be dropped wholesale.
+    """
+
+    def __init__(self, w3, poll_interval=2, ws_url=None, max_range=1000):
+        self.w3 = w3
+        self.poll_interval = poll_interval
+        self.ws_url = ws_url
+        self.max_range = max_range
+        self.lock = threading.Lock()
+        self.contracts = {}
+        self.subscribers = []
+        self.last_block = None
+        # Newest block whose events every subscriber has already seen
+        self.dispatched_block = None
+        # When a poll last caught up with the chain head
+        self.polled_at = None
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+
+    def watch(self, key, contract, event_names):
+        """Watch (or stop watching, when contract is None) the events of one contract"""
+        with self.lock:
+            if contract is None:
+                self.contracts.pop(key, None)
+                return
+            topics = {}
+            for abi in contract.abi:
+                if abi.get('type') == 'event' and abi['name'] in event_names:
+                    topics[event_abi_to_log_topic(abi)] = getattr(contract.events, abi['name'])()
+            self.contracts[key] = (contract.address, topics)
+
+    def subscribe(self, callback, first=False):
+        if first:
+            self.subscribers.insert(0, callback)
+        else:
+            self.subscribers.append(callback)
+
+    def poll(self):
+        """Process all blocks since the last poll; returns the number of events dispatched"""
+        head = self.w3.eth.block_number
+        if self.last_block is None:
+            self.last_block = head
+            self.dispatched_block = head
+            self.polled_at = time.time()
+            return 0
+        if head <= self.last_block:
+            self.polled_at = time.time()
+            return 0
+
+        if head - self.last_block > self.max_range:
+            print(f"Block watcher fell {head - self.last_block} blocks behind, skipping to {head}")
+            self.last_block = head
+            self._dispatch(head, None)
+            self.polled_at = time.time()
+            return 0
+
+        with self.lock:
+            contracts = dict(self.contracts)
+        events = []
+        if contracts:
+            by_address = {address: topics for address, topics in contracts.values()}
+            logs = self.w3.eth.get_logs({
+                'fromBlock': self.last_block + 1,
+                'toBlock': head,
+                'address': list(by_address),
+                'topics': [[topic for topics in by_address.values() for topic in topics]]
+            })
+            for log in logs:
+                topics = by_address.get(log['address'])
+                event_type = topics.get(bytes(log['topics'][0])) if topics else None
+                if event_type is None:
+                    continue
+                decoded = event_type.process_log(log)
+                events.append({
+                    'event': decoded['event'],
+                    'address': log['address'],
+                    'block_number': log['blockNumber'],
+                    'log_index': log['logIndex'],
+                    'args': dict(decoded['args'])
+                })
+            events.sort(key=lambda event: (event['block_number'], event['log_index']))
+
+        self.last_block = head
+        self._dispatch(head, events)
+        self.polled_at = time.time()
+        return len(events)
+
+    def replay(self, block_number, events):
+        """Dispatch a block that another process has already read, as if this watcher had polled it"""
+        self.last_block = block_number
+        self._dispatch(block_number, events)
+        self.polled_at = time.time()
+
+    def _dispatch(self, block_number, events):
+        for callback in self.subscribers:
+            try:
+                callback(block_number, events)
+            except Exception as e:
+                print(f"Block watcher subscriber failed: {e}")
+        self.dispatched_block = block_number
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error watching blocks: {e}")
+            self.wake.wait(self.poll_interval)
+            self.wake.clear()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        if self.ws_url and websockets is not None:
+            threading.Thread(target=lambda: asyncio.run(self._listen_new_heads()), daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake.set()
+
+    async def _listen_new_heads(self):
+        while not self.stop_event.is_set():
+            try:
+                async with websockets.connect(self.ws_url) as ws:
+                    await ws.send(json.dumps({
+                        'jsonrpc': '2.0',
+                        'id': 1,
+                        'method': 'eth_subscribe',
+                        'params': ['newHeads']
+                    }))
+                    async for message in ws:
+                        if json.loads(message).get('method') == 'eth_subscription':
+                            self.wake.set()
+                        if self.stop_event.is_set():
+                            return
+            except Exception as e:
+                print(f"newHeads subscription dropped, retrying: {e}")
+                await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,317 @@
+"""
+Read cache for TXSPEAK backend
+Per-key TTLs, memory-bounded LRU eviction, single-flight loading and stale-while-revalidate,
+optionally backed by a store shared between worker processes
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def estimate_size(value):
+    """Rough in-memory size of a cached value in bytes"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(item) for item in value)
+    elif hasattr(value, '__slots__'):
+        size += sum(estimate_size(getattr(value, field)) for field in value.__slots__)
+    return size
+
+
+class _Flight:
+    """A load in progress that other callers can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.invalidated = False
+
+
+class TTLCache:
+    """Thread-safe cache shared by request threads and background refreshers.
+
+    Values are produced by loader callables that take a list of missing keys
+    and return a dict of key -> value, so several misses can be resolved with
+    one batched RPC. Concurrent misses on the same key share a single load.
+    Once an entry's TTL passes it is still served for ``stale_ttl`` seconds
+    while one background refresh runs. Loaders that can only run inside a
+    request (e.g. ones rendering a response) pass ``stale_ttl=0`` so their
+    entries are never refreshed in the background.
+
+    With a ``shared`` store (see shared_state.py) misses are looked up there
+    before the loader runs, and loaded values are written through. Writes
+    are fenced on the block a loader read at (its ``block`` attribute, else
+    the shared head when the load started), so values read before an
+    invalidation never reach other workers. Single-key invalidations are
+    only propagated while ``owns_invalidation`` is set, i.e. by the process
+    that follows the chain; ``clear`` always is.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, default_ttl=30, stale_ttl=300,
+                 load_timeout=30, refresh_workers=4, shared=None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.load_timeout = load_timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.shared = shared
+        self.owns_invalidation = True
+        self.executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='cache-refresh')
+
+    def get(self, key, loader, ttl=None, stale_ttl=None):
+        return self.get_many([key], loader, ttl, stale_ttl)[key]
+
+    def get_many(self, keys, loader, ttl=None, stale_ttl=None):
+        """Return a dict of key -> value, loading all misses with one loader call"""
+        results, to_load, to_refresh, waits = self._lookup(keys)
+        if to_refresh:
+            self.executor.submit(self._refresh_in_background, to_refresh, loader, ttl, stale_ttl)
+        if to_load:
+            to_load = self._take_shared(to_load, results, stale_ttl)
+        if to_load:
+            fence = self._fence(loader)
+            try:
+                values = loader(to_load)
+            except Exception as e:
+                self._fail(to_load, e)
+                raise
+            results.update(self._complete(to_load, values, ttl, fence, stale_ttl))
+        for key, flight in waits.items():
+            if not flight.event.wait(self.load_timeout):
+                raise TimeoutError(f"Timed out waiting for cache load of {key}")
+            results[key] = self._flight_result(flight)
+        return results
+
+    async def get_many_async(self, keys, loader, ttl=None, stale_ttl=None):
+        """Coroutine version of get_many for an async loader"""
+        results, to_load, to_refresh, waits = self._lookup(keys)
+        if to_refresh:
+            asyncio.ensure_future(self._refresh_async(to_refresh, loader, ttl, stale_ttl))
+        if to_load and self.shared is not None:
+            to_load = await asyncio.to_thread(self._take_shared, to_load, results, stale_ttl)
+        if to_load:
+            fence = await asyncio.to_thread(self._fence, loader) if self.shared is not None else None
+            try:
+                values = await loader(to_load)
+            except Exception as e:
+                self._fail(to_load, e)
+                raise
+            results.update(self._complete(to_load, values, ttl, fence, stale_ttl))
+        for key, flight in waits.items():
+            if not await asyncio.to_thread(flight.event.wait, self.load_timeout):
+                raise TimeoutError(f"Timed out waiting for cache load of {key}")
+            results[key] = self._flight_result(flight)
+        return results
+
+    def _lookup(self, keys):
+        now = time.time()
+        results = {}
+        to_load = []
+        to_refresh = []
+        waits = {}
+        with self.lock:
+            for key in dict.fromkeys(keys):
+                entry = self.entries.get(key)
+                if entry is not None and entry[1] > now:
+                    self.entries.move_to_end(key)
+                    results[key] = entry[0]
+                    self.hits += 1
+                elif entry is not None and entry[2] > now:
+                    self.entries.move_to_end(key)
+                    results[key] = entry[0]
+                    self.stale_hits += 1
+                    if key not in self.inflight:
+                        self.inflight[key] = _Flight()
+                        to_refresh.append(key)
+                elif key in self.inflight:
+                    waits[key] = self.inflight[key]
+                    self.misses += 1
+                else:
+                    self.inflight[key] = _Flight()
+                    to_load.append(key)
+                    self.misses += 1
+        return results, to_load, to_refresh, waits
+
+    def _take_shared(self, keys, results, stale_ttl=None):
+        """Complete the flights of keys another worker has already loaded; returns the keys still missing"""
+        if self.shared is None:
+            return keys
+        try:
+            found = self.shared.get_entries(keys)
+        except Exception as e:
+            print(f"Error reading shared cache: {e}")
+            return keys
+        if not found:
+            return keys
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        with self.lock:
+            for key, (value, expires) in found.items():
+                flight = self.inflight.pop(key, None)
+                if not (flight and flight.invalidated):
+                    self._store(key, value, expires, expires + stale_ttl)
+                if flight:
+                    flight.value = value
+                    flight.event.set()
+                results[key] = value
+            self.shared_hits += len(found)
+        return [key for key in keys if key not in found]
+
+    def _fence(self, loader):
+        """Block a load reads at, for fencing its shared writes; None means unfenced"""
+        if self.shared is None:
+            return None
+        block = getattr(loader, 'block', None)
+        if block is not None:
+            return block
+        try:
+            return self.shared.head()
+        except Exception as e:
+            print(f"Error reading shared head: {e}")
+            return None
+
+    def _share(self, entries, fence):
+        if self.shared is None or not entries:
+            return
+        try:
+            self.shared.put_entries(entries, fence)
+        except Exception as e:
+            print(f"Error writing shared cache: {e}")
+
+    def _flight_result(self, flight):
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def refresh(self, keys, loader, ttl=None):
+        """Load keys now regardless of freshness and store the results"""
+        with self.lock:
+            keys = [key for key in keys if key not in self.inflight]
+            for key in keys:
+                self.inflight[key] = _Flight()
+        if not keys:
+            return {}
+        fence = self._fence(loader)
+        try:
+            values = loader(keys)
+        except Exception as e:
+            self._fail(keys, e)
+            raise
+        return self._complete(keys, values, ttl, fence)
+
+    def _refresh_in_background(self, keys, loader, ttl, stale_ttl=None):
+        try:
+            # Another worker may have refreshed these already
+            keys = self._take_shared(keys, {}, stale_ttl)
+            if keys:
+                fence = self._fence(loader)
+                self._complete(keys, loader(keys), ttl, fence, stale_ttl)
+        except Exception as e:
+            self._fail(keys, e)
+            print(f"Error refreshing cache keys {keys}: {e}")
+
+    async def _refresh_async(self, keys, loader, ttl, stale_ttl=None):
+        try:
+            fence = await asyncio.to_thread(self._fence, loader) if self.shared is not None else None
+            self._complete(keys, await loader(keys), ttl, fence, stale_ttl)
+        except Exception as e:
+            self._fail(keys, e)
+            print(f"Error refreshing cache keys {keys}: {e}")
+
+    def _fail(self, keys, error):
+        with self.lock:
+            for key in keys:
+                flight = self.inflight.pop(key, None)
+                if flight:
+                    flight.error = error
+                    flight.event.set()
+
+    def _complete(self, keys, values, ttl, fence=None, stale_ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        stale_ttl = self.stale_ttl if stale_ttl is None else stale_ttl
+        now = time.time()
+        results = {}
+        shared = {}
+        with self.lock:
+            for key in keys:
+                value = values.get(key)
+                results[key] = value
+                flight = self.inflight.pop(key, None)
+                # Failed reads come back as None - hand them out but never cache them.
+                # A load that raced an invalidation may hold pre-invalidation state.
+                if value is not None and not (flight and flight.invalidated):
+                    self._store(key, value, now + ttl, now + ttl + stale_ttl)
+                    shared[key] = (value, now + ttl)
+                if flight:
+                    flight.value = value
+                    flight.event.set()
+        self._share(shared, fence)
+        return results
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        with self.lock:
+            self._store(key, value, now + ttl, now + ttl + self.stale_ttl)
+        self._share({key: (value, now + ttl)}, None)
+
+    def _store(self, key, value, expires, stale_until):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old[3]
+        size = estimate_size(key) + estimate_size(value)
+        self.entries[key] = (value, expires, stale_until, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= evicted[3]
+
+    def invalidate(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[3]
+            if key in self.inflight:
+                self.inflight[key].invalidated = True
+        if self.shared is not None and self.owns_invalidation:
+            try:
+                self.shared.delete_entries([key])
+            except Exception as e:
+                print(f"Error invalidating shared cache: {e}")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            for flight in self.inflight.values():
+                flight.invalidated = True
+        if self.shared is not None:
+            try:
+                self.shared.clear_entries()
+            except Exception as e:
+                print(f"Error clearing shared cache: {e}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'shared_hits': self.shared_hits
+            }
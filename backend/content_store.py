@@ -0,0 +1,400 @@
+"""
+IPFS content cache for TXSPEAK backend
+Prefetches the CIDs that messages reference into a size-bounded on-disk cache with LRU eviction
+"""
+
+import base64
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# CIDv0 (base58btc sha2-256 multihash) or CIDv1 in the default base32 multibase
+CID_PATTERN = re.compile(r'^(Qm[1-9A-HJ-NP-Za-km-z]{44}|b[a-z2-7]{50,100})$')
+
+CHUNK_SIZE = 64 * 1024
+
+BASE58 = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+RAW = 0x55
+DAG_PB = 0x70
+SHA2_256 = 0x12
+# UnixFS file DAGs as ``ipfs add`` builds them (balanced, 174 links a node), by (chunk size, raw leaves):
+# the CIDv0 default, the CIDv1 default and the 1 MiB chunks several pinning services use
+DAG_LAYOUTS = ((256 * 1024, False), (256 * 1024, True), (1024 * 1024, True))
+MAX_LINKS = 174
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    cid TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    content_type TEXT,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_last_access ON objects (last_access);
+"""
+
+
+def parse_cid(value):
+    """The CID in an ipfsHash value (a bare CID, ipfs://CID or a /ipfs/CID path or URL), else None"""
+    value = (value or '').strip()
+    if value.startswith('ipfs://'):
+        value = value[len('ipfs://'):]
+    elif '/ipfs/' in value:
+        value = value.split('/ipfs/', 1)[1]
+    cid = value.split('/', 1)[0].split('?', 1)[0]
+    return cid if CID_PATTERN.match(cid) else None
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte, n = n & 0x7f, n >> 7
+        if not n:
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+
+def _read_varint(data, pos):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return n, pos
+
+
+def _field(number, data):
+    """A length-delimited protobuf field"""
+    return _varint(number << 3 | 2) + _varint(len(data)) + data
+
+
+def _uint_field(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def decode_cid(cid):
+    """(version, codec, multihash bytes) of a CID that parse_cid accepted"""
+    if cid.startswith('Qm'):
+        n = 0
+        for char in cid:
+            n = n * 58 + BASE58.index(char)
+        return 0, DAG_PB, n.to_bytes(34, 'big')
+    encoded = cid[1:].upper()
+    data = base64.b32decode(encoded + '=' * (-len(encoded) % 8))
+    version, pos = _read_varint(data, 0)
+    codec, pos = _read_varint(data, pos)
+    return version, codec, data[pos:]
+
+
+def _multihash(block):
+    return bytes([SHA2_256, 32]) + hashlib.sha256(block).digest()
+
+
+def _dag_node(data, links=()):
+    """dag-pb block: links first, then the UnixFS data"""
+    encoded = b''.join(
+        _field(2, _field(1, link) + _field(2, b'') + _uint_field(3, tsize)) for link, tsize in links
+    )
+    return encoded + _field(1, data)
+
+
+def _unixfs_file(data, filesize, blocksizes=()):
+    encoded = _uint_field(1, 2) + (_field(2, data) if data else b'') + _uint_field(3, filesize)
+    return encoded + b''.join(_uint_field(4, size) for size in blocksizes)
+
+
+def unixfs_root(path, version=0, chunk_size=256 * 1024, raw_leaves=False):
+    """(codec, multihash) of the root of the balanced UnixFS DAG ``ipfs add`` builds for a file"""
+    def link(codec, block):
+        multihash = _multihash(block)
+        return multihash if version == 0 else _varint(1) + _varint(codec) + multihash
+
+    # (codec, multihash, link bytes, cumulative size, file bytes) per node of the current level
+    level = []
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk and level:
+                break
+            block = chunk if raw_leaves else _dag_node(_unixfs_file(chunk, len(chunk)))
+            codec = RAW if raw_leaves else DAG_PB
+            level.append((codec, _multihash(block), link(codec, block), len(block), len(chunk)))
+            if len(chunk) < chunk_size:
+                break
+    while len(level) > 1:
+        parents = []
+        for i in range(0, len(level), MAX_LINKS):
+            children = level[i:i + MAX_LINKS]
+            sizes = [child[4] for child in children]
+            block = _dag_node(_unixfs_file(b'', sum(sizes), sizes), [(child[2], child[3]) for child in children])
+            tsize = len(block) + sum(child[3] for child in children)
+            parents.append((DAG_PB, _multihash(block), link(DAG_PB, block), tsize, sum(sizes)))
+        level = parents
+    return level[0][0], level[0][1]
+
+
+def file_cid(path):
+    """CIDv0 of a file, as ``ipfs add`` with default settings reports it"""
+    n = int.from_bytes(unixfs_root(path)[1], 'big')
+    encoded = ''
+    while n:
+        n, digit = divmod(n, 58)
+        encoded = BASE58[digit] + encoded
+    return encoded
+
+
+def verify_cid(cid, path):
+    """Whether a file's bytes are the content cid names.
+
+    Raw CIDs are a sha2-256 of the bytes. dag-pb CIDs name a UnixFS DAG, so
+    the DAG is rebuilt for each layout in DAG_LAYOUTS; content added with
+    other settings, or hashed with another function, cannot be verified.
+    """
+    version, codec, multihash = decode_cid(cid)
+    if multihash[:2] != bytes([SHA2_256, 32]):
+        return False
+    if codec == RAW:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.digest() == multihash[2:]
+    if codec != DAG_PB:
+        return False
+    layouts = DAG_LAYOUTS if version == 1 else DAG_LAYOUTS[:1]
+    return any(unixfs_root(path, version, size, raw) == (DAG_PB, multihash) for size, raw in layouts)
+
+
+class HTTPGateway:
+    """Reads CIDs from an IPFS HTTP gateway; ``url`` contains {cid}, e.g. https://ipfs.io/ipfs/{cid}"""
+
+    def __init__(self, url, timeout=30, pool_size=16):
+        self.url = url if '{cid}' in url else url.rstrip('/') + '/{cid}'
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def open(self, cid):
+        """(iterator of byte chunks, content type or None); raises when the gateway can't serve the CID"""
+        response = self.session.get(self.url.format(cid=cid), stream=True, timeout=self.timeout)
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+
+        def chunks():
+            with response:
+                yield from response.iter_content(CHUNK_SIZE)
+        return chunks(), response.headers.get('Content-Type')
+
+
+class DirectoryGateway:
+    """Local stand-in for a gateway that serves files named by CID from a directory"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def open(self, cid):
+        f = open(os.path.join(self.path, cid), 'rb')
+
+        def chunks():
+            with f:
+                yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+        return chunks(), None
+
+
+def make_gateway(url, timeout=30):
+    """HTTPGateway for http(s) URLs, DirectoryGateway for file:///path"""
+    if url.startswith('file://'):
+        return DirectoryGateway(url[len('file://'):])
+    return HTTPGateway(url, timeout=timeout)
+
+
+class ContentTooLarge(Exception):
+    pass
+
+
+class ContentMismatch(Exception):
+    pass
+
+
+class ContentStore:
+    """Content-addressed files on disk, indexed in SQLite and evicted least recently used first.
+
+    An object is written once under ``root/objects`` and never changes, since
+    its CID names its content. Downloads stream into ``root/tmp`` and are
+    renamed into place, so a reader never sees a partial file, and each CID
+    is downloaded by one thread at a time, and only kept if verify_cid
+    confirms the bytes are the CID's content. When the stored total exceeds
+    ``max_bytes`` the least recently read objects are deleted. Reads move an
+    object up the LRU order at most every ``touch_interval`` seconds, so hot
+    objects don't cost a write per request. A CID the gateway failed to
+    serve is not retried for ``retry_after`` seconds.
+    """
+
+    def __init__(self, root, gateway, max_bytes=1024 ** 3, max_object_bytes=50 * 1024 ** 2,
+                 workers=8, retry_after=300, touch_interval=60):
+        self.root = root
+        self.gateway = gateway
+        self.max_bytes = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self.retry_after = retry_after
+        self.touch_interval = touch_interval
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, 'index.db'), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.inflight = {}
+        self.failed = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='content-fetch')
+        self.hits = 0
+        self.misses = 0
+        self.downloaded_bytes = 0
+        self.evicted = 0
+
+    def path_for(self, cid):
+        # Fan out on the CID's tail; its head is the same few characters for every CID of one kind
+        return os.path.join(self.root, 'objects', cid[-2:], cid)
+
+    def lookup(self, cid):
+        """(path, content type, size) of a stored object, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT size, content_type, last_access FROM objects WHERE cid = ?', (cid,)
+            ).fetchone()
+            if row is None:
+                return None
+            size, content_type, last_access = row
+            path = self.path_for(cid)
+            if not os.path.exists(path):
+                # Evicted by another process between its index update and ours
+                with self.conn:
+                    self.conn.execute('DELETE FROM objects WHERE cid = ?', (cid,))
+                return None
+            now = time.time()
+            if now - last_access > self.touch_interval:
+                with self.conn:
+                    self.conn.execute('UPDATE objects SET last_access = ? WHERE cid = ?', (now, cid))
+        return path, content_type, size
+
+    def prefetch(self, cids):
+        """Start downloading any of cids that are not stored yet; returns immediately"""
+        for cid in cids:
+            if cid and self.lookup(cid) is None:
+                self._start(cid)
+
+    def fetch(self, cid, timeout=None):
+        """(path, content type, size) for cid, downloading it first if needed; None if it can't be had in time"""
+        entry = self.lookup(cid)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        future = self._start(cid)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout)
+        except Exception:
+            return None
+
+    def _start(self, cid):
+        """The download of cid in progress, starting it if needed; None while a recent failure is remembered"""
+        with self.lock:
+            future = self.inflight.get(cid)
+            if future is not None:
+                return future
+            if time.monotonic() < self.failed.get(cid, 0):
+                return None
+            future = self.inflight[cid] = Future()
+        self.executor.submit(self._download, cid, future)
+        return future
+
+    def _download(self, cid, future):
+        tmp_path = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+        try:
+            chunks, content_type = self.gateway.open(cid)
+            size = 0
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_object_bytes:
+                        chunks.close()
+                        raise ContentTooLarge(f"{cid} is larger than {self.max_object_bytes} bytes")
+                    f.write(chunk)
+            if not verify_cid(cid, tmp_path):
+                raise ContentMismatch(f"Gateway content for {cid} does not hash to it, or cannot be verified")
+            path = self.path_for(cid)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            with self.lock, self.conn:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO objects (cid, size, content_type, last_access) VALUES (?, ?, ?, ?)',
+                    (cid, size, content_type, time.time())
+                )
+                self.failed.pop(cid, None)
+            self.downloaded_bytes += size
+            self._evict()
+            future.set_result((path, content_type, size))
+        except Exception as e:
+            print(f"Failed to fetch IPFS content {cid}: {e}")
+            now = time.monotonic()
+            with self.lock:
+                self.failed = {failed: until for failed, until in self.failed.items() if until > now}
+                self.failed[cid] = now + self.retry_after
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                self.inflight.pop(cid, None)
+
+    def _evict(self):
+        with self.lock:
+            total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for cid, size in self.conn.execute('SELECT cid, size FROM objects ORDER BY last_access'):
+                if total <= self.max_bytes:
+                    break
+                victims.append(cid)
+                total -= size
+            with self.conn:
+                self.conn.executemany('DELETE FROM objects WHERE cid = ?', [(cid,) for cid in victims])
+        for cid in victims:
+            try:
+                os.remove(self.path_for(cid))
+            except FileNotFoundError:
+                pass
+        self.evicted += len(victims)
+
+    def stats(self):
+        with self.lock:
+            objects, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects').fetchone()
+            downloading = len(self.inflight)
+        return {
+            'objects': objects,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'downloading': downloading,
+            'hits': self.hits,
+            'misses': self.misses,
+            'downloaded_bytes': self.downloaded_bytes,
+            'evicted': self.evicted
+        }
@@ -0,0 +1,179 @@
+"""
+Contract registry for TXSPEAK backend
+Builds contract bindings and ABI call codecs once per deployed address instead of once per request
+"""
+
+from eth_utils import function_abi_to_4byte_selector
+from eth_utils.abi import collapse_if_tuple
+from web3 import Web3
+
+
+class Record:
+    """Fixed-field result of a contract read; subclasses name the fields in ``__slots__``"""
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        fields = ', '.join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Message(Record):
+    """MessagingContract.getMessage"""
+    __slots__ = ('sender', 'recipient', 'subject', 'content', 'ipfs_hash', 'amount',
+                 'timestamp', 'status', 'message_type', 'encrypted')
+
+
+class MessagingStats(Record):
+    """MessagingContract.getLeaderboardData"""
+    __slots__ = ('earned', 'spent', 'messages_received', 'messages_sent', 'avg_response_time')
+
+
+class PresaleStats(Record):
+    """PresaleContract.getPresaleStats"""
+    __slots__ = ('total_eth_raised', 'total_tokens_sold', 'participant_count', 'current_phase', 'presale_active')
+
+
+class PhaseInfo(Record):
+    """PresaleContract.getCurrentPhaseInfo"""
+    __slots__ = ('price', 'start_time', 'end_time', 'max_tokens', 'sold_tokens', 'active')
+
+
+# Functions whose outputs decode into a record rather than a list
+RECORDS = {
+    'getMessage': Message,
+    'getLeaderboardData': MessagingStats,
+    'getPresaleStats': PresaleStats,
+    'getCurrentPhaseInfo': PhaseInfo
+}
+
+
+class FunctionCodec:
+    """Selector, argument types and result decoder for one contract function.
+
+    Calling it with arguments returns a PreparedCall, which CallBatcher
+    encodes with one ``codec.encode`` and no ContractFunction construction.
+    """
+
+    __slots__ = ('w3', 'address', 'name', 'selector', 'input_types', 'output_types', 'address_outputs', 'record')
+
+    def __init__(self, w3, address, abi, record=None):
+        self.w3 = w3
+        self.address = address
+        self.name = abi['name']
+        self.selector = function_abi_to_4byte_selector(abi)
+        self.input_types = [collapse_if_tuple(arg) for arg in abi['inputs']]
+        self.output_types = [collapse_if_tuple(arg) for arg in abi['outputs']]
+        self.address_outputs = [i for i, output_type in enumerate(self.output_types) if output_type == 'address']
+        self.record = record
+
+    def __call__(self, *args):
+        return PreparedCall(self, args)
+
+    def encode(self, args):
+        return self.selector + self.w3.codec.encode(self.input_types, args)
+
+    def decode(self, data):
+        """Decode return data the way ``.call()`` would, or into the function's record type"""
+        values = self.w3.codec.decode(self.output_types, data)
+        if self.address_outputs:
+            values = list(values)
+            for i in self.address_outputs:
+                values[i] = Web3.to_checksum_address(values[i])
+        if self.record is not None:
+            return self.record(*values)
+        if len(values) == 1:
+            return values[0]
+        return list(values)
+
+
+class PreparedCall:
+    """A contract function bound to its arguments, ready for CallBatcher or a direct eth_call"""
+
+    __slots__ = ('codec', 'args')
+
+    def __init__(self, codec, args):
+        self.codec = codec
+        self.args = args
+
+    @property
+    def address(self):
+        return self.codec.address
+
+    @property
+    def fn_name(self):
+        return self.codec.name
+
+    def encode(self):
+        return self.codec.encode(self.args)
+
+    def decode(self, data):
+        return self.codec.decode(data)
+
+    def call(self, block_identifier='latest'):
+        data = self.codec.w3.eth.call({'to': self.codec.address, 'data': self.encode()}, block_identifier)
+        return self.decode(data)
+
+
+class Binding:
+    """One deployed contract: the web3 Contract (for events and logs) plus a codec per function.
+
+    ``binding.balanceOf(address)`` returns a PreparedCall.
+    """
+
+    def __init__(self, w3, address, abi):
+        self.address = Web3.to_checksum_address(address)
+        self.contract = w3.eth.contract(address=self.address, abi=abi)
+        self.functions = {
+            item['name']: FunctionCodec(w3, self.address, item, RECORDS.get(item['name']))
+            for item in abi if item.get('type') == 'function'
+        }
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['functions'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class ContractRegistry:
+    """Bindings for the configured contracts, rebuilt only when an address changes.
+
+    ``update`` is called with the address map at startup and from
+    ``POST /api/contracts``; request handlers only ever look bindings up.
+    """
+
+    def __init__(self, w3, abis):
+        self.w3 = w3
+        self.abis = abis
+        self.bindings = {}
+
+    def update(self, addresses):
+        bindings = {}
+        for key, abi in self.abis.items():
+            address = addresses.get(key)
+            if not address:
+                continue
+            current = self.bindings.get(key)
+            if current and current.address.lower() == address.lower():
+                bindings[key] = current
+            else:
+                bindings[key] = Binding(self.w3, address, abi)
+        # Swap the whole map so concurrent readers never see a half-built registry
+        self.bindings = bindings
+
+    def __getitem__(self, key):
+        return self.bindings[key]
+
+    def get(self, key):
+        return self.bindings.get(key)
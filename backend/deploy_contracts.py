@@ -2,8 +2,14 @@
 """
 Smart Contract Deployment Script for TXSPEAK
 Deploys contracts to Sepolia testnet and updates backend configuration
+
+Every deployment and setup transaction is signed up front with consecutive
+nonces and sent as one batch through TxPipeline, so the whole run takes about
+one block instead of one block per transaction. Needs py-solc-x and solc 0.8.19.
 """
 
+import argparse
+import logging
 import os
 import json
 from web3 import Web3
@@ -11,80 +17,104 @@ from eth_account import Account
 from dotenv import load_dotenv
 import requests
 import time
+from provider import make_web3, rpc_urls
+from tx_pipeline import TxPipeline, create_address
 
 # Load environment variables
 load_dotenv()
 
-def load_contract_source(filename):
-    """Load Solidity contract source code"""
-    contract_path = f"../contracts/{filename}"
-    with open(contract_path, 'r') as file:
-        return file.read()
+CONTRACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'contracts')
+SOLC_VERSION = '0.8.19'
 
-def compile_contract(source_code):
-    """Compile Solidity contract using Solc API"""
-    # For this demo, we'll provide pre-compiled bytecode and ABI
-    # In production, you'd use solc-py or similar
-    
-    # This is a simplified version - normally you'd compile the contracts
-    contracts = {
-        'TXSPKToken': {
-            'abi': [
-                {"inputs": [], "stateMutability": "nonpayable", "type": "constructor"},
-                {"inputs": [{"internalType": "address", "name": "owner", "type": "address"}, {"internalType": "address", "name": "spender", "type": "address"}], "name": "allowance", "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
-                {"inputs": [{"internalType": "address", "name": "spender", "type": "address"}, {"internalType": "uint256", "name": "amount", "type": "uint256"}], "name": "approve", "outputs": [{"internalType": "bool", "name": "", "type": "bool"}], "stateMutability": "nonpayable", "type": "function"},
-                {"inputs": [{"internalType": "address", "name": "account", "type": "address"}], "name": "balanceOf", "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
-                {"inputs": [], "name": "decimals", "outputs": [{"internalType": "uint8", "name": "", "type": "uint8"}], "stateMutability": "view", "type": "function"},
-                {"inputs": [], "name": "name", "outputs": [{"internalType": "string", "name": "", "type": "string"}], "stateMutability": "view", "type": "function"},
-                {"inputs": [], "name": "symbol", "outputs": [{"internalType": "string", "name": "", "type": "string"}], "stateMutability": "view", "type": "function"},
-                {"inputs": [], "name": "totalSupply", "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"},
-                {"inputs": [{"internalType": "address", "name": "recipient", "type": "address"}, {"internalType": "uint256", "name": "amount", "type": "uint256"}], "name": "transfer", "outputs": [{"internalType": "bool", "name": "", "type": "bool"}], "stateMutability": "nonpayable", "type": "function"},
-                {"inputs": [{"internalType": "string", "name": "profile", "type": "string"}], "name": "setUserProfile", "outputs": [], "stateMutability": "nonpayable", "type": "function"},
-                {"inputs": [{"internalType": "uint256", "name": "price", "type": "uint256"}], "name": "setInboxPrice", "outputs": [], "stateMutability": "nonpayable", "type": "function"},
-                {"inputs": [{"internalType": "address", "name": "user", "type": "address"}], "name": "getUserProfile", "outputs": [{"internalType": "string", "name": "", "type": "string"}], "stateMutability": "view", "type": "function"},
-                {"inputs": [{"internalType": "address", "name": "user", "type": "address"}], "name": "getUserInboxPrice", "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}], "stateMutability": "view", "type": "function"}
-            ],
-            # This is a mock bytecode - in production you'd compile the contract
-            'bytecode': '0x608060405234801561001057600080fd5b50600080fd5b'
-        }
-    }
+# Calls into contracts deployed earlier in the same batch can't be estimated, so their gas is fixed
+TRANSFER_GAS = 80000
+WHITELIST_GAS = 40000
+WHITELIST_GAS_PER_ADDRESS = 30000
+WHITELIST_CHUNK = 200
+PHASE_GAS = 200000
+
+def compile_contracts():
+    """Compile the TXSPEAK contracts with py-solc-x; returns {name: (abi, bytecode)}"""
+    import solcx
     
-    return contracts
+    paths = [os.path.join(CONTRACTS_DIR, name) for name in
+             ('TXSPKToken.sol', 'MessagingContract.sol', 'PresaleContract.sol')]
+    compiled = solcx.compile_files(
+        paths, output_values=['abi', 'bin'], solc_version=SOLC_VERSION,
+        allow_paths=[os.path.abspath(CONTRACTS_DIR)]
+    )
+    return {key.rsplit(':', 1)[1]: (artifact['abi'], artifact['bin']) for key, artifact in compiled.items()}
 
-def deploy_contract(w3, account, abi, bytecode, *constructor_args):
-    """Deploy a smart contract"""
+def deploy_contract(w3, abi, bytecode, *constructor_args):
+    """Unsigned deployment transaction for a contract"""
     contract = w3.eth.contract(abi=abi, bytecode=bytecode)
+    return {'data': contract.constructor(*constructor_args)._encode_data_in_transaction()}
+
+def contract_call(w3, address, abi, fn_name, args, gas):
+    """Unsigned transaction calling fn_name on the contract at address"""
+    contract = w3.eth.contract(address=address, abi=abi)
+    return {'to': address, 'data': contract.encodeABI(fn_name=fn_name, args=args), 'gas': gas}
+
+def deploy_all(w3, pipeline, artifacts, presale_allocation, whitelist=(), phase=None):
+    """Send the three deployments and the presale setup as one batch; returns ({name: address}, [PendingTx])
+
+    Contract addresses are known from the deployer's nonces up front, so the
+    constructors and setup calls that need them are signed without waiting
+    for any receipt.
+    """
+    deployer = pipeline.account.address
+    first = pipeline.nonces.allocate(3)
+    addresses = {
+        'txspk_token': create_address(deployer, first),
+        'messaging': create_address(deployer, first + 1),
+        'presale': create_address(deployer, first + 2)
+    }
+    token_abi, token_bin = artifacts['TXSPKToken']
+    presale_abi = artifacts['PresaleContract'][0]
     
-    # Build transaction
-    transaction = contract.constructor(*constructor_args).buildTransaction({
-        'from': account.address,
-        'nonce': w3.eth.get_transaction_count(account.address),
-        'gas': 3000000,
-        'gasPrice': w3.toWei('20', 'gwei')
-    })
-    
-    # Sign and send transaction
-    signed_txn = w3.eth.account.sign_transaction(transaction, private_key=account.key)
-    tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-    
-    # Wait for transaction receipt
-    print(f"Waiting for transaction {tx_hash.hex()}...")
-    tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    txs = [
+        dict(deploy_contract(w3, token_abi, token_bin), nonce=first),
+        dict(deploy_contract(w3, *artifacts['MessagingContract'], addresses['txspk_token']), nonce=first + 1),
+        dict(deploy_contract(w3, *artifacts['PresaleContract'], addresses['txspk_token']), nonce=first + 2),
+        contract_call(w3, addresses['txspk_token'], token_abi, 'transfer',
+                      [addresses['presale'], w3.to_wei(presale_allocation, 'ether')], TRANSFER_GAS)
+    ]
+    labels = ['deploy TXSPKToken', 'deploy MessagingContract', 'deploy PresaleContract', 'fund presale']
+    whitelist = list(whitelist)
+    for start in range(0, len(whitelist), WHITELIST_CHUNK):
+        chunk = whitelist[start:start + WHITELIST_CHUNK]
+        txs.append(contract_call(w3, addresses['presale'], presale_abi, 'addToWhitelist', [chunk],
+                                 WHITELIST_GAS + WHITELIST_GAS_PER_ADDRESS * len(chunk)))
+        labels.append(f"whitelist {start}-{start + len(chunk)}")
+    if phase:
+        price, duration, max_tokens = phase
+        txs.append(contract_call(w3, addresses['presale'], presale_abi, 'startNextPhase',
+                                 [w3.to_wei(price, 'ether'), duration, w3.to_wei(max_tokens, 'ether')], PHASE_GAS))
+        labels.append('start next phase')
     
-    if tx_receipt.status == 1:
-        print(f"Contract deployed successfully at {tx_receipt.contractAddress}")
-        return tx_receipt.contractAddress
-    else:
-        raise Exception("Contract deployment failed")
+    return addresses, pipeline.submit_many(txs, labels)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Deploy and configure the TXSPEAK contracts')
+    parser.add_argument('--presale-allocation', type=float, default=100_000_000,
+                        help='TXSPK to transfer to the presale contract')
+    parser.add_argument('--whitelist', help='file with one address per line to whitelist for the presale')
+    parser.add_argument('--phase', help='start another presale phase: PRICE_ETH,DURATION_SECONDS,MAX_TOKENS')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds to wait for the batch to be mined')
+    parser.add_argument('--backend-url', default='http://localhost:8001/api/contracts')
+    return parser.parse_args()
 
 def main():
     """Main deployment function"""
+    args = parse_args()
+    # Stuck-transaction replacements and nonce repairs are reported through logging
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    
     # Web3 setup
-    INFURA_URL = os.getenv('INFURA_URL')
     PRIVATE_KEY = os.getenv('PRIVATE_KEY')
     
-    if not INFURA_URL:
-        print("Error: INFURA_URL not found in .env file")
+    if not rpc_urls():
+        print("Error: RPC_URLS or INFURA_URL not found in .env file")
         return
         
     if not PRIVATE_KEY:
@@ -98,9 +128,9 @@ def main():
         print("Please add some Sepolia ETH to this account and set PRIVATE_KEY in .env")
         return
     
-    w3 = Web3(Web3.HTTPProvider(INFURA_URL))
+    w3 = make_web3()
     
-    if not w3.isConnected():
+    if not w3.is_connected():
         print("Error: Failed to connect to Ethereum network")
         return
         
@@ -112,7 +142,7 @@ def main():
     
     # Check balance
     balance = w3.eth.get_balance(account.address)
-    balance_eth = w3.fromWei(balance, 'ether')
+    balance_eth = w3.from_wei(balance, 'ether')
     print(f"Account balance: {balance_eth} ETH")
     
     if balance_eth < 0.01:
@@ -120,32 +150,45 @@ def main():
         print("Get Sepolia testnet ETH from: https://faucet.sepolia.org/")
         return
     
-    print("\n=== Starting Contract Deployment ===\n")
+    whitelist = []
+    if args.whitelist:
+        with open(args.whitelist) as f:
+            whitelist = [Web3.to_checksum_address(line.strip()) for line in f if line.strip()]
+    phase = None
+    if args.phase:
+        price, duration, max_tokens = args.phase.split(',')
+        phase = (float(price), int(duration), float(max_tokens))
     
-    deployed_contracts = {}
+    print("\n=== Starting Contract Deployment ===\n")
     
     try:
-        # For this demo, we'll create mock contract deployments
-        # In production, you would deploy actual compiled contracts
+        artifacts = compile_contracts()
+        pipeline = TxPipeline(w3, account)
+        start_block = w3.eth.block_number
+        started = time.time()
+        deployed_contracts, batch = deploy_all(
+            w3, pipeline, artifacts, args.presale_allocation, whitelist, phase
+        )
+        for pending in batch:
+            print(f"  sent {pending.label} (nonce {pending.nonce})")
         
-        print("📝 Note: This is a demo deployment simulation.")
-        print("In production, you would compile and deploy actual Solidity contracts.")
-        
-        # Mock contract addresses (these would be real after deployment)
-        deployed_contracts = {
-            'txspk_token': '0x' + '1' * 40,  # Mock address
-            'messaging': '0x' + '2' * 40,    # Mock address
-            'presale': '0x' + '3' * 40       # Mock address
-        }
+        receipts = pipeline.wait(batch, timeout=args.timeout)
+        for name, receipt in zip(deployed_contracts, receipts):
+            if receipt.contractAddress != deployed_contracts[name]:
+                raise Exception(f"{name} deployed at {receipt.contractAddress}, expected {deployed_contracts[name]}")
         
-        print("✅ Mock contracts 'deployed':")
+        blocks = {receipt.blockNumber for receipt in receipts}
+        gas_used = sum(receipt.gasUsed for receipt in receipts)
+        print(f"\n✅ {len(receipts)} transactions mined in {len(blocks)} block(s) "
+              f"({min(blocks) - start_block}-{max(blocks) - start_block} blocks after sending), "
+              f"{time.time() - started:.1f}s, {gas_used} gas")
+        print("✅ Contracts deployed:")
         for name, address in deployed_contracts.items():
             print(f"  {name}: {address}")
         
         # Update backend with contract addresses
-        backend_url = "http://localhost:8001/api/contracts"
         try:
-            response = requests.post(backend_url, json=deployed_contracts)
+            response = requests.post(args.backend_url, json=deployed_contracts)
             if response.status_code == 200:
                 print("\n✅ Backend updated with contract addresses")
             else:
@@ -155,10 +198,12 @@ def main():
         
         # Save deployment info
         deployment_info = {
-            'network': 'sepolia',
+            'network': os.getenv('NETWORK', 'sepolia'),
             'deployed_at': int(time.time()),
             'deployer': account.address,
-            'contracts': deployed_contracts
+            'deployed_block': min(blocks),
+            'contracts': deployed_contracts,
+            'transactions': {pending.label: receipt.transactionHash.hex() for pending, receipt in zip(batch, receipts)}
         }
         
         with open('deployment.json', 'w') as f:
@@ -171,4 +216,4 @@ def main():
         print(f"❌ Deployment failed: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,127 @@
+"""
+Push fan-out for TXSPEAK backend
+Delivers chain updates from the single block watcher to many streaming clients
+"""
+
+import asyncio
+import threading
+from collections import deque
+
+
+class Subscription:
+    """One client's bounded queue of pending updates.
+
+    When a slow client lets its queue fill up the oldest update is dropped,
+    and the next read returns a ``resync`` notice telling the client to
+    refetch over the REST endpoints instead.
+    """
+
+    def __init__(self, address, topics, max_queue=100, loop=None):
+        self.address = address.lower() if address else None
+        self.topics = topics
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.cond = threading.Condition()
+        self.loop = loop
+        self.ready = asyncio.Event() if loop else None
+
+    def push(self, update):
+        with self.cond:
+            if len(self.queue) >= self.max_queue:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append(update)
+            self.cond.notify()
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.ready.set)
+
+    def _pop(self):
+        if self.dropped > self.reported_dropped:
+            missed = self.dropped - self.reported_dropped
+            self.reported_dropped = self.dropped
+            return {'type': 'resync', 'data': {'dropped': missed}}
+        return self.queue.popleft() if self.queue else None
+
+    def get(self, timeout=None):
+        """Next update, or None after timeout seconds with nothing to send"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.queue or self.dropped > self.reported_dropped, timeout)
+            return self._pop()
+
+    async def get_async(self, timeout=None):
+        self.ready.clear()
+        with self.cond:
+            update = self._pop()
+        if update is not None:
+            return update
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        with self.cond:
+            return self._pop()
+
+
+class EventHub:
+    """Routes block watcher events to subscribed clients.
+
+    ``inbox`` subscribers get MessageSent for messages addressed to them and
+    status changes for messages they sent or received; ``presale``
+    subscribers get per-block presale deltas with the refreshed stats.
+    """
+
+    def __init__(self, max_subscribers=1000, max_queue=100):
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.by_address = {}
+        self.presale = set()
+        self.count = 0
+
+    def subscribe(self, address, topics, loop=None):
+        """Register a client; returns None when the hub is full"""
+        subscription = Subscription(address, topics, self.max_queue, loop)
+        with self.lock:
+            if self.count >= self.max_subscribers:
+                return None
+            self.count += 1
+            if 'inbox' in topics and subscription.address:
+                self.by_address.setdefault(subscription.address, set()).add(subscription)
+            if 'presale' in topics:
+                self.presale.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.count -= 1
+            subscribers = self.by_address.get(subscription.address)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.by_address[subscription.address]
+            self.presale.discard(subscription)
+
+    def publish_to_address(self, address, update):
+        with self.lock:
+            subscribers = list(self.by_address.get(address.lower(), ()))
+        for subscription in subscribers:
+            subscription.push(update)
+
+    def publish_presale(self, update):
+        with self.lock:
+            subscribers = list(self.presale)
+        for subscription in subscribers:
+            subscription.push(update)
+
+    def has_presale_subscribers(self):
+        return bool(self.presale)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'subscribers': self.count,
+                'addresses': len(self.by_address),
+                'presale_subscribers': len(self.presale)
+            }
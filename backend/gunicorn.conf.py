@@ -0,0 +1,42 @@
+"""
+Production entry point for TXSPEAK backend
+
+    gunicorn -c gunicorn.conf.py server:app
+
+Runs WEB_CONCURRENCY worker processes that share one cache, contract config and
+login nonce store (SHARED_STATE_URL: a SQLite file by default, or redis://... when
+workers span hosts). The worker holding the refresher lease also watches blocks,
+refreshes stats and runs the indexers; the rest serve from the shared data and
+replay the blocks it relays. Set PROMETHEUS_MULTIPROC_DIR to an empty directory
+to merge metrics across workers.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8001')
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+# Threads per worker; each open /api/stream connection holds one
+worker_class = 'gthread'
+threads = int(os.getenv('WORKER_THREADS', '16'))
+timeout = 60
+# Import the app in each worker, so no thread, socket or SQLite connection is shared across a fork
+preload_app = False
+
+os.environ.setdefault('SHARED_STATE_URL', 'sqlite:///txspeak_shared.db')
+# Worker processes already spread signature recovery across cores
+os.environ.setdefault('AUTH_WORKERS', '0')
+
+if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def post_worker_init(worker):
+    import server
+    server.start_worker()
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,175 @@
+"""
+Token holder ledger for TXSPEAK backend
+Replays indexed TXSPKToken Transfer events into an in-memory balance map with disk snapshots
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+
+ZERO_ADDRESS = '0x' + '0' * 40
+
+
+class HolderLedger:
+    """Address -> balance for every TXSPK holder, kept current from indexed events.
+
+    Balances come from Transfer alone: burn() emits Transfer(from, 0x0) as
+    well as TokensBurned, so TokensBurned only feeds the burned counter the
+    reconciliation reports. Holders are ranked as ``(-balance, address)`` in
+    a bisect-sorted list, like the leaderboards.
+
+    Every ``snapshot_interval`` seconds the ledger is written to
+    ``snapshot_path``; on startup it loads the snapshot, unless it is ahead
+    of the index checkpoint, and replays only the events indexed after it.
+    A rollback below the snapshot block discards it.
+    """
+
+    def __init__(self, store, source, snapshot_path=None, snapshot_interval=300):
+        self.store = store
+        self.source = source
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.lock = threading.Lock()
+        self.last_snapshot = time.monotonic()
+        # A snapshot can outlive the index it was taken from; never start ahead of the index
+        checkpoint = store.get_checkpoint(source)
+        self.rebuild(max_block=-1 if checkpoint is None else checkpoint)
+
+    def _reset(self):
+        self.balances = {}
+        self.ranking = []
+        self.minted = 0
+        self.burned = 0
+        self.burn_events = 0
+        self.block = None
+
+    def rebuild(self, max_block=None):
+        """Reload from the snapshot (unless it is newer than max_block) and replay the index"""
+        with self.lock:
+            self._reset()
+            if not self._load_snapshot(max_block):
+                self._discard_snapshot()
+            self._apply(self.store.iter_events(self.source, after_block=self.block))
+
+    def on_events(self, events):
+        with self.lock:
+            self._apply(events)
+            due = self.snapshot_path and time.monotonic() - self.last_snapshot >= self.snapshot_interval
+            snapshot = self._snapshot() if due else None
+        if snapshot:
+            self._write_snapshot(snapshot)
+
+    def on_rollback(self, block_number):
+        self.rebuild(max_block=block_number)
+
+    def _apply(self, events):
+        # Blocks are never split across calls, so anything at or below the last applied block was counted
+        applied = self.block
+        for event in events:
+            if applied is not None and event['block_number'] <= applied:
+                continue
+            args = event['args']
+            if event['event'] == 'Transfer':
+                sender, recipient, value = args['from'].lower(), args['to'].lower(), args['value']
+                if sender == ZERO_ADDRESS:
+                    self.minted += value
+                else:
+                    self._credit(sender, -value)
+                if recipient == ZERO_ADDRESS:
+                    self.burned += value
+                else:
+                    self._credit(recipient, value)
+            elif event['event'] == 'TokensBurned':
+                self.burn_events += 1
+            self.block = event['block_number']
+
+    def _credit(self, address, delta):
+        old = self.balances.get(address, 0)
+        new = old + delta
+        if old > 0:
+            i = bisect_left(self.ranking, (-old, address))
+            if i < len(self.ranking) and self.ranking[i] == (-old, address):
+                del self.ranking[i]
+        if new > 0:
+            self.balances[address] = new
+            insort(self.ranking, (-new, address))
+        else:
+            self.balances.pop(address, None)
+
+    def balance(self, address):
+        return self.balances.get(address.lower(), 0)
+
+    def balances_of(self, addresses):
+        balances = self.balances
+        return {address: balances.get(address.lower(), 0) for address in addresses}
+
+    def top(self, limit=10, offset=0):
+        """Return (rows, holder count) for a page of holders by balance"""
+        with self.lock:
+            page = self.ranking[offset:offset + limit]
+            return [{'address': address, 'balance': -balance} for balance, address in page], len(self.ranking)
+
+    def supply(self):
+        with self.lock:
+            return {
+                'block': self.block,
+                'minted': self.minted,
+                'burned': self.burned,
+                'supply': self.minted - self.burned,
+                'balances_total': sum(self.balances.values()),
+                'holders': len(self.balances)
+            }
+
+    # Snapshots
+
+    def _snapshot(self):
+        self.last_snapshot = time.monotonic()
+        return {
+            'source': self.source,
+            'block': self.block,
+            'minted': str(self.minted),
+            'burned': str(self.burned),
+            'burn_events': self.burn_events,
+            'balances': {address: str(balance) for address, balance in self.balances.items()}
+        }
+
+    def _write_snapshot(self, snapshot):
+        # Write-then-rename so a crash never leaves a truncated snapshot behind
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        with self.lock:
+            snapshot = self._snapshot()
+        self._write_snapshot(snapshot)
+
+    def _load_snapshot(self, max_block):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable holder snapshot {self.snapshot_path}: {e}")
+            return False
+        if snapshot.get('source') != self.source:
+            return False
+        if max_block is not None and (snapshot['block'] or 0) > max_block:
+            return False
+        self.minted = int(snapshot['minted'])
+        self.burned = int(snapshot['burned'])
+        self.burn_events = snapshot['burn_events']
+        self.block = snapshot['block']
+        self.balances = {address: int(balance) for address, balance in snapshot['balances'].items()}
+        self.ranking = sorted((-balance, address) for address, balance in self.balances.items())
+        return True
+
+    def _discard_snapshot(self):
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            os.remove(self.snapshot_path)
@@ -0,0 +1,86 @@
+"""
+Per-user message ID lists for TXSPEAK backend
+Mirrors the userInbox / userSentMessages arrays and extends them incrementally
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+
+class _IdList:
+    def __init__(self):
+        self.ids = []
+        self.checked_at = 0
+        self.stale = True
+        self.lock = threading.Lock()
+
+
+class IdListCache:
+    """Cached copies of on-chain per-user ID arrays.
+
+    The first read of a list downloads it once; after that only the array
+    length is checked (when the entry is stale or older than ``ttl``) and just
+    the new tail is fetched. Message IDs only ever grow, so every list is
+    sorted and a cursor page is a bisect plus a slice.
+
+    ``fetch_all(kind, address)`` returns the full array, ``fetch_length(kind,
+    address)`` its length and ``fetch_range(kind, address, start, end)`` the
+    elements in ``[start, end)``.
+    """
+
+    def __init__(self, fetch_all, fetch_length, fetch_range, ttl=30, max_lists=10000):
+        self.fetch_all = fetch_all
+        self.fetch_length = fetch_length
+        self.fetch_range = fetch_range
+        self.ttl = ttl
+        self.max_lists = max_lists
+        self.lock = threading.Lock()
+        self.lists = OrderedDict()
+
+    def _entry(self, kind, address):
+        key = (kind, address.lower())
+        with self.lock:
+            entry = self.lists.get(key)
+            if entry is None:
+                entry = self.lists[key] = _IdList()
+                while len(self.lists) > self.max_lists:
+                    self.lists.popitem(last=False)
+            else:
+                self.lists.move_to_end(key)
+            return entry
+
+    def get(self, kind, address):
+        """Return the current ID list, syncing it with the chain if needed"""
+        entry = self._entry(kind, address)
+        with entry.lock:
+            now = time.time()
+            if entry.stale or now - entry.checked_at > self.ttl:
+                if not entry.ids:
+                    entry.ids = list(self.fetch_all(kind, address))
+                else:
+                    length = self.fetch_length(kind, address)
+                    if length > len(entry.ids):
+                        entry.ids.extend(self.fetch_range(kind, address, len(entry.ids), length))
+                entry.checked_at = now
+                entry.stale = False
+            return entry.ids
+
+    def page(self, kind, address, before=None, limit=10):
+        """IDs older than ``before`` (oldest first) and the cursor for the next page"""
+        ids = self.get(kind, address)
+        end = len(ids) if before is None else bisect_left(ids, before)
+        start = max(0, end - limit)
+        page = ids[start:end]
+        return page, (page[0] if start > 0 else None)
+
+    def mark_stale(self, kind, address):
+        with self.lock:
+            entry = self.lists.get((kind, address.lower()))
+        if entry is not None:
+            entry.stale = True
+
+    def clear(self):
+        with self.lock:
+            self.lists.clear()
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Bulk whitelist importer for TXSPEAK presale
+Streams addresses from a CSV into PresaleContract.addToWhitelist in gas-limit-sized
+chunks, several transactions in flight at once through TxPipeline.
+
+Usage: python import_whitelist.py whitelist.csv [--presale 0x...] [--column address]
+                                  [--from-block N] [--max-gas N] [--in-flight 8]
+                                  [--checkpoint whitelist.csv.checkpoint]
+
+The file is read one row at a time. Addresses are checksummed and deduplicated,
+and any that already emitted UserWhitelisted are skipped, so importing the same
+file twice costs nothing the second time. After each chunk is mined the checkpoint
+records how many rows are done; rerunning the same command resumes from there.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from eth_account import Account
+from dotenv import load_dotenv
+from web3 import Web3
+from provider import make_web3, rpc_urls
+from tx_pipeline import TxPipeline
+
+load_dotenv()
+
+PRESALE_WHITELIST_ABI = [
+    {
+        "inputs": [{"internalType": "address[]", "name": "users", "type": "address[]"}],
+        "name": "addToWhitelist",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    }
+]
+
+USER_WHITELISTED_TOPIC = Web3.keccak(text='UserWhitelisted(address)')
+
+# Addresses in the two gas estimates that calibrate the per-address cost
+PROBE_SIZE = 20
+
+
+def read_addresses(path, column=None, skip_rows=0):
+    """Yield (row number, checksummed address or None) for each data row, lazily.
+
+    ``column`` is a header name or a 0-based index; by default the first cell
+    that starts with 0x is used, so plain one-address-per-line files work too.
+    Rows that hold no valid address yield None.
+    """
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        index = None
+        for row_number, row in enumerate(reader, 1):
+            if column is not None and index is None:
+                if column.isdigit():
+                    index = int(column)
+                else:
+                    # The header row names the column
+                    index = [cell.strip().lower() for cell in row].index(column.lower())
+                    continue
+            if row_number <= skip_rows:
+                continue
+            if index is not None:
+                cell = row[index].strip() if index < len(row) else ''
+            else:
+                cell = next((cell.strip() for cell in row if cell.strip().lower().startswith('0x')), '')
+                if not cell and row_number == 1:
+                    continue  # header
+            try:
+                yield row_number, Web3.to_checksum_address(cell)
+            except ValueError:
+                yield row_number, None
+
+
+def scan_whitelisted(w3, presale, from_block, known=None, page_size=50_000):
+    """Add every address with a UserWhitelisted log since from_block to known; returns (known, last block scanned)"""
+    known = set() if known is None else known
+    head = w3.eth.block_number
+    block = from_block
+    while block <= head:
+        to_block = min(block + page_size - 1, head)
+        try:
+            logs = w3.eth.get_logs({
+                'fromBlock': block,
+                'toBlock': to_block,
+                'address': presale,
+                'topics': [USER_WHITELISTED_TOPIC]
+            })
+        except Exception as e:
+            if page_size == 1:
+                raise
+            # Providers cap the range or result count - shrink the page and retry
+            page_size = max(1, page_size // 2)
+            print(f"get_logs {block}-{to_block} failed, page size now {page_size}: {e}")
+            continue
+        for log in logs:
+            known.add(Web3.to_checksum_address(bytes(log['topics'][1])[-20:]))
+        block = to_block + 1
+    return known, head
+
+
+class Checkpoint:
+    """Progress of one import, saved after every mined chunk so a rerun resumes where this one stopped.
+
+    The addresses the last scan found are written once, next to the
+    checkpoint, by save_scan. Per-chunk saves stay small: on resume the scan
+    continues from scanned_block and finds this run's imports again in
+    their UserWhitelisted events.
+    """
+
+    def __init__(self, path, source, presale):
+        self.path = path
+        self.scan_path = f"{path}.whitelisted"
+        self.source = source
+        self.presale = presale
+        self.rows = 0
+        self.scanned_block = None
+        self.whitelisted = set()
+        self.imported = 0
+        self.gas_used = 0
+        self.transactions = 0
+        self.elapsed = 0.0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return False
+        if saved.get('source') != self.source or saved.get('presale') != self.presale:
+            print(f"Checkpoint {self.path} is for another file or contract, starting over")
+            return False
+        self.rows = saved['rows']
+        self.scanned_block = saved['scanned_block']
+        try:
+            with open(self.scan_path) as f:
+                self.whitelisted = {line.strip() for line in f if line.strip()}
+        except OSError:
+            # Without the scanned set the scan has to start over
+            self.scanned_block = None
+        self.imported = saved['imported']
+        self.gas_used = saved['gas_used']
+        self.transactions = saved['transactions']
+        self.elapsed = saved['elapsed']
+        return True
+
+    def save(self):
+        # Write-then-rename so an interrupted run never leaves a truncated checkpoint behind
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'source': self.source,
+                'presale': self.presale,
+                'rows': self.rows,
+                'scanned_block': self.scanned_block,
+                'imported': self.imported,
+                'gas_used': self.gas_used,
+                'transactions': self.transactions,
+                'elapsed': self.elapsed
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def save_scan(self, whitelisted, scanned_block):
+        """Record a finished scan; the set is written before the checkpoint that points past it"""
+        tmp_path = f"{self.scan_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(f"{address}\n" for address in sorted(whitelisted))
+        os.replace(tmp_path, self.scan_path)
+        self.whitelisted, self.scanned_block = whitelisted, scanned_block
+        self.save()
+
+
+class WhitelistImporter:
+    """Packs new addresses into addToWhitelist chunks and keeps up to ``in_flight`` of them pending.
+
+    Gas per chunk is linear in its length, so two estimates (one address
+    and PROBE_SIZE addresses) give the fixed and per-address cost, and each
+    chunk holds as many addresses as fit under ``max_gas``. Chunks are sent
+    as soon as they fill; nonces are mined in order, so the oldest pending
+    chunk always completes first and the checkpoint can advance past its
+    last row.
+    """
+
+    def __init__(self, w3, pipeline, presale, checkpoint, max_gas, in_flight=8):
+        self.w3 = w3
+        self.pipeline = pipeline
+        self.contract = w3.eth.contract(address=presale, abi=PRESALE_WHITELIST_ABI)
+        self.checkpoint = checkpoint
+        self.max_gas = max_gas
+        self.in_flight = in_flight
+        self.base_gas = None
+        self.gas_per_address = None
+        self.chunk_size = None
+        self.window = deque()
+        self.started = None
+        self.imported_at_start = checkpoint.imported
+        self.invalid = 0
+        self.duplicates = 0
+        self.skipped = 0
+
+    def _estimate(self, addresses):
+        return self.contract.functions.addToWhitelist(addresses).estimate_gas({'from': self.pipeline.account.address})
+
+    def _calibrate(self, sample):
+        one = self._estimate(sample[:1])
+        if len(sample) > 1:
+            self.gas_per_address = max(1, (self._estimate(sample) - one) // (len(sample) - 1))
+        else:
+            self.gas_per_address = one
+        self.base_gas = max(0, one - self.gas_per_address)
+        budget = self.max_gas / self.pipeline.gas_headroom - self.base_gas
+        self.chunk_size = max(1, int(budget // self.gas_per_address))
+        print(f"addToWhitelist costs ~{self.base_gas} + {self.gas_per_address} gas per address; "
+              f"{self.chunk_size} addresses per transaction")
+
+    def _flush(self, chunk, last_row):
+        """Send full chunks from the front of chunk; returns the remainder"""
+        while len(chunk) >= self.chunk_size:
+            part, chunk = chunk[:self.chunk_size], chunk[self.chunk_size:]
+            # Rows are only done once every address read so far is sent
+            self._send(part, None if chunk else last_row)
+        return chunk
+
+    def _send(self, chunk, last_row):
+        gas = int((self.base_gas + self.gas_per_address * len(chunk)) * self.pipeline.gas_headroom)
+        tx = {
+            'to': self.contract.address,
+            'data': self.contract.encodeABI(fn_name='addToWhitelist', args=[chunk]),
+            'gas': min(gas, self.max_gas)
+        }
+        pending = self.pipeline.submit(tx, f"chunk {self.checkpoint.transactions + len(self.window) + 1}")
+        self.window.append((pending, chunk, last_row))
+        while len(self.window) >= self.in_flight:
+            self._complete_oldest()
+
+    def _complete_oldest(self):
+        pending, chunk, last_row = self.window.popleft()
+        receipt = self.pipeline.wait([pending])[0]
+        checkpoint = self.checkpoint
+        if last_row is not None:
+            checkpoint.rows = last_row
+        checkpoint.whitelisted.update(chunk)
+        checkpoint.imported += len(chunk)
+        checkpoint.gas_used += receipt['gasUsed']
+        checkpoint.transactions += 1
+        checkpoint.elapsed += time.monotonic() - self.started
+        self.started = time.monotonic()
+        checkpoint.save()
+        print(f"  {pending.label}: {len(chunk)} addresses in block {receipt['blockNumber']}, "
+              f"{self.rate():.1f} addresses/s, {self.gas_per_imported():.0f} gas/address")
+
+    def rate(self):
+        elapsed = self.checkpoint.elapsed + time.monotonic() - self.started
+        return self.checkpoint.imported / elapsed if elapsed else 0.0
+
+    def gas_per_imported(self):
+        return self.checkpoint.gas_used / self.checkpoint.imported if self.checkpoint.imported else 0.0
+
+    def run(self, rows):
+        """Import every new address from rows of (row number, address or None)"""
+        self.started = time.monotonic()
+        known = self.checkpoint.whitelisted
+        seen = set()
+        chunk = []
+        last_row = self.checkpoint.rows
+        for row_number, address in rows:
+            last_row = row_number
+            if address is None:
+                self.invalid += 1
+                print(f"  row {row_number}: not an address, skipped")
+                continue
+            if address in seen:
+                self.duplicates += 1
+                continue
+            seen.add(address)
+            if address in known:
+                self.skipped += 1
+                continue
+            chunk.append(address)
+            if self.chunk_size is None and len(chunk) >= PROBE_SIZE:
+                self._calibrate(chunk[:PROBE_SIZE])
+            if self.chunk_size is not None and len(chunk) >= self.chunk_size:
+                chunk = self._flush(chunk, last_row)
+
+        if chunk:
+            if self.chunk_size is None:
+                self._calibrate(chunk[:PROBE_SIZE])
+            chunk = self._flush(chunk, last_row)
+            if chunk:
+                self._send(chunk, last_row)
+        while self.window:
+            self._complete_oldest()
+        # Trailing rows with nothing to import are done too
+        if last_row > self.checkpoint.rows:
+            self.checkpoint.rows = last_row
+            self.checkpoint.save()
+
+
+def default_presale():
+    if os.path.exists('deployment.json'):
+        with open('deployment.json') as f:
+            deployment = json.load(f)
+        return deployment['contracts'].get('presale'), deployment.get('deployed_block', 0)
+    return None, 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Whitelist the addresses in a CSV for the TXSPEAK presale')
+    parser.add_argument('csv', help='CSV (or one address per line) of addresses to whitelist')
+    parser.add_argument('--presale', help='PresaleContract address (default: deployment.json)')
+    parser.add_argument('--column', help='header name or 0-based index of the address column')
+    parser.add_argument('--from-block', type=int,
+                        help='first block to scan for UserWhitelisted (default: deployment.json, else 0)')
+    parser.add_argument('--max-gas', type=int, help='gas limit per transaction (default: a quarter of the block gas limit)')
+    parser.add_argument('--in-flight', type=int, default=8, help='chunks pending at once')
+    parser.add_argument('--checkpoint', help='progress file (default: CSV path + .checkpoint)')
+    parser.add_argument('--restart', action='store_true', help='ignore any existing checkpoint')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Stuck-transaction replacements and nonce repairs are reported through logging
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    private_key = os.getenv('PRIVATE_KEY')
+    if not rpc_urls() or not private_key:
+        print("Error: RPC_URLS (or INFURA_URL) and PRIVATE_KEY must be set in .env")
+        return 1
+
+    presale, deployed_block = default_presale()
+    presale = args.presale or presale
+    if not presale or not Web3.is_address(presale):
+        print("Error: pass --presale with the PresaleContract address, or deploy first so deployment.json has it")
+        return 1
+    presale = Web3.to_checksum_address(presale)
+    from_block = args.from_block if args.from_block is not None else deployed_block
+
+    w3 = make_web3()
+    account = Account.from_key(private_key)
+    pipeline = TxPipeline(w3, account)
+    max_gas = args.max_gas or w3.eth.get_block('latest')['gasLimit'] // 4
+
+    checkpoint = Checkpoint(args.checkpoint or f"{args.csv}.checkpoint", os.path.abspath(args.csv), presale)
+    if not args.restart and checkpoint.load():
+        print(f"Resuming after row {checkpoint.rows}: {checkpoint.imported} addresses imported so far")
+    scan_from = from_block if checkpoint.scanned_block is None else checkpoint.scanned_block + 1
+    started = time.monotonic()
+    checkpoint.save_scan(*scan_whitelisted(w3, presale, scan_from, checkpoint.whitelisted))
+    print(f"{len(checkpoint.whitelisted)} addresses already whitelisted "
+          f"(scanned blocks {scan_from}-{checkpoint.scanned_block} in {time.monotonic() - started:.1f}s)")
+
+    importer = WhitelistImporter(w3, pipeline, presale, checkpoint, max_gas, args.in_flight)
+    try:
+        importer.run(read_addresses(args.csv, args.column, checkpoint.rows))
+    except KeyboardInterrupt:
+        print(f"\nInterrupted after row {checkpoint.rows}; rerun to resume")
+        return 130
+
+    print(f"\n✅ Imported {checkpoint.imported - importer.imported_at_start} addresses in this run "
+          f"({checkpoint.imported} total, {checkpoint.transactions} transactions)")
+    print(f"   skipped {importer.skipped} already whitelisted, {importer.duplicates} duplicates, "
+          f"{importer.invalid} invalid rows")
+    print(f"   {importer.rate():.1f} addresses/s, {importer.gas_per_imported():.0f} gas/address")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,479 @@
+"""
+Event indexer for TXSPEAK backend
+Follows contract logs with paged eth_getLogs and stores them in a local SQLite index
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from eth_utils import event_abi_to_log_topic
+
+# Message status values, matching MessagingContract.MessageStatus
+STATUS_PENDING = 0
+STATUS_ACCEPTED = 1
+STATUS_REJECTED = 2
+STATUS_REFUNDED = 3
+STATUS_READ = 4
+
+# rejectMessage emits MessageRefunded too, but leaves the status at Rejected
+STATUS_EVENTS = {
+    'MessageAccepted': STATUS_ACCEPTED,
+    'MessageRejected': STATUS_REJECTED
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    block_number INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    number INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL,
+    timestamp INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    source TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx_hash TEXT NOT NULL,
+    event TEXT NOT NULL,
+    args TEXT NOT NULL,
+    PRIMARY KEY (source, block_number, log_index)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    sender TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    message_type TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    status_block INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_recipient ON messages (recipient, id);
+CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender, id);
+"""
+
+
+class IndexStore:
+    """SQLite-backed store for indexed events and the tables derived from them"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    @contextmanager
+    def snapshot(self):
+        """Hold one read transaction, so every query inside sees the same committed state"""
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                yield
+            finally:
+                self.conn.commit()
+
+    def get_checkpoint(self, name):
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT block_number FROM checkpoints WHERE name = ?', (name,)
+            ).fetchone()
+        return row['block_number'] if row else None
+
+    def get_block_hash(self, number):
+        with self.lock:
+            row = self.conn.execute('SELECT hash FROM blocks WHERE number = ?', (number,)).fetchone()
+        return row['hash'] if row else None
+
+    def get_block_timestamps(self, numbers):
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT number, timestamp FROM blocks WHERE number IN ({','.join('?' * len(numbers))})",
+                list(numbers)
+            ).fetchall()
+        return {row['number']: row['timestamp'] for row in rows}
+
+    def record(self, name, events, blocks, checkpoint):
+        """Persist a page of events, the block headers seen and the new checkpoint atomically"""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO blocks (number, hash, timestamp) VALUES (?, ?, ?)',
+                [(number, block_hash, timestamp) for number, (block_hash, timestamp) in blocks.items()]
+            )
+            for event in events:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO events (source, block_number, log_index, tx_hash, event, args) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (name, event['block_number'], event['log_index'], event['tx_hash'],
+                     event['event'], json.dumps(event['args']))
+                )
+                self._apply_message_event(event)
+            self.conn.execute(
+                'INSERT OR REPLACE INTO checkpoints (name, block_number) VALUES (?, ?)',
+                (name, checkpoint)
+            )
+
+    def _apply_message_event(self, event):
+        args = event['args']
+        if event['event'] == 'MessageSent':
+            self.conn.execute(
+                'INSERT OR REPLACE INTO messages '
+                '(id, sender, recipient, amount, message_type, status, timestamp, block_number, status_block) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (args['messageId'], args['sender'].lower(), args['recipient'].lower(), str(args['amount']),
+                 args['messageType'], STATUS_PENDING, event['timestamp'], event['block_number'],
+                 event['block_number'])
+            )
+        elif event['event'] in STATUS_EVENTS:
+            self.conn.execute(
+                'UPDATE messages SET status = ?, status_block = ? WHERE id = ?',
+                (STATUS_EVENTS[event['event']], event['block_number'], args['messageId'])
+            )
+
+    def rollback(self, name, block_number):
+        """Drop what a source indexed after block_number and rebuild the derived rows.
+
+        Other sources share the store, so block headers are kept up to the
+        furthest other checkpoint and the messages table is only touched when
+        the source is the one that fills it.
+        """
+        with self.lock, self.conn:
+            message_events = ['MessageSent'] + list(STATUS_EVENTS)
+            fills_messages = self.conn.execute(
+                f"SELECT 1 FROM events WHERE source = ? AND event IN ({','.join('?' * len(message_events))}) LIMIT 1",
+                [name] + message_events
+            ).fetchone() is not None
+            self.conn.execute(
+                'DELETE FROM events WHERE source = ? AND block_number > ?', (name, block_number)
+            )
+            self.conn.execute(
+                'DELETE FROM blocks WHERE number > MAX(?, '
+                '(SELECT COALESCE(MAX(block_number), ?) FROM checkpoints WHERE name != ?))',
+                (block_number, block_number, name)
+            )
+            if fills_messages:
+                self._rollback_messages(name, block_number)
+            self.conn.execute(
+                'INSERT OR REPLACE INTO checkpoints (name, block_number) VALUES (?, ?)',
+                (name, block_number)
+            )
+
+    def _rollback_messages(self, name, block_number):
+        self.conn.execute('DELETE FROM messages WHERE block_number > ?', (block_number,))
+        stale = self.conn.execute(
+            'SELECT id FROM messages WHERE status_block > ?', (block_number,)
+        ).fetchall()
+        for row in stale:
+            self.conn.execute(
+                'UPDATE messages SET status = ?, status_block = block_number WHERE id = ?',
+                (STATUS_PENDING, row['id'])
+            )
+        placeholders = ','.join('?' * len(STATUS_EVENTS))
+        status_rows = self.conn.execute(
+            f"SELECT block_number, event, args FROM events WHERE source = ? AND event IN ({placeholders}) "
+            'ORDER BY block_number, log_index',
+            [name] + list(STATUS_EVENTS)
+        ).fetchall()
+        stale_ids = {row['id'] for row in stale}
+        for row in status_rows:
+            message_id = json.loads(row['args'])['messageId']
+            if message_id in stale_ids:
+                self.conn.execute(
+                    'UPDATE messages SET status = ?, status_block = ? WHERE id = ?',
+                    (STATUS_EVENTS[row['event']], row['block_number'], message_id)
+                )
+
+    def iter_events(self, name, event_names=None, after_block=None):
+        """Yield stored events for a source in chain order, optionally only those after a block"""
+        query = ('SELECT e.block_number, e.log_index, e.tx_hash, e.event, e.args, b.timestamp '
+                 'FROM events e LEFT JOIN blocks b ON b.number = e.block_number WHERE e.source = ?')
+        params = [name]
+        if after_block is not None:
+            query += ' AND e.block_number > ?'
+            params.append(after_block)
+        if event_names:
+            query += f" AND e.event IN ({','.join('?' * len(event_names))})"
+            params += list(event_names)
+        query += ' ORDER BY e.block_number, e.log_index'
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        for row in rows:
+            yield {
+                'event': row['event'],
+                'block_number': row['block_number'],
+                'log_index': row['log_index'],
+                'tx_hash': row['tx_hash'],
+                'timestamp': row['timestamp'],
+                'args': json.loads(row['args'])
+            }
+
+    def message_ids(self, kind, address, before=None, limit=10):
+        """A page of message IDs received ('inbox') or sent ('sent') by address, oldest first.
+
+        Returns the IDs and the cursor for the next (older) page, or None.
+        """
+        column = 'recipient' if kind == 'inbox' else 'sender'
+        query = f'SELECT id FROM messages WHERE {column} = ?'
+        params = [address.lower()]
+        if before is not None:
+            query += ' AND id < ?'
+            params.append(before)
+        query += ' ORDER BY id DESC LIMIT ?'
+        params.append(limit + 1)
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        ids = [row['id'] for row in rows[:limit]]
+        ids.reverse()
+        return ids, (ids[0] if len(rows) > limit else None)
+
+    def message_ids_after(self, after, limit):
+        """Up to limit indexed message IDs greater than after, ascending"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT id FROM messages WHERE id > ? ORDER BY id LIMIT ?', (after, limit)
+            ).fetchall()
+        return [row['id'] for row in rows]
+
+    def max_message_id(self):
+        with self.lock:
+            row = self.conn.execute('SELECT MAX(id) AS id FROM messages').fetchone()
+        return row['id']
+
+    def get_messages(self, message_ids):
+        """Indexed message metadata keyed by message ID"""
+        if not message_ids:
+            return {}
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM messages WHERE id IN ({','.join('?' * len(message_ids))})",
+                list(message_ids)
+            ).fetchall()
+        return {row['id']: dict(row) for row in rows}
+
+
+class EventIndexer:
+    """Follows a contract's logs block range by block range into an IndexStore.
+
+    Progress is checkpointed by block number so the indexer resumes where it
+    stopped. Before each round the hash of the checkpoint block is compared
+    with the chain; on a mismatch the last ``reorg_depth`` blocks are rolled
+    back and indexed again.
+    """
+
+    def __init__(self, w3, store, name, contract, event_names, start_block=0,
+                 page_size=2000, reorg_depth=12, confirmations=0):
+        self.w3 = w3
+        self.store = store
+        self.name = name
+        self.contract = contract
+        self.start_block = start_block
+        self.page_size = page_size
+        self.max_page_size = page_size
+        self.reorg_depth = reorg_depth
+        self.confirmations = confirmations
+        self.listeners = []
+        self.head = None
+        self.synced = False
+        self.stop_event = threading.Event()
+
+        self.topics = {}
+        for abi in contract.abi:
+            if abi.get('type') == 'event' and abi['name'] in event_names:
+                self.topics[event_abi_to_log_topic(abi)] = getattr(contract.events, abi['name'])()
+
+    def subscribe(self, listener):
+        """Register a listener with on_events(events) and on_rollback(block_number) methods"""
+        self.listeners.append(listener)
+
+    @property
+    def checkpoint(self):
+        checkpoint = self.store.get_checkpoint(self.name)
+        return self.start_block - 1 if checkpoint is None else checkpoint
+
+    def poll(self):
+        """Index every new block up to the chain head; returns the number of events stored"""
+        head = self.w3.eth.block_number - self.confirmations
+        self.head = head
+        self._check_reorg()
+
+        indexed = 0
+        while self.checkpoint < head and not self.stop_event.is_set():
+            from_block = self.checkpoint + 1
+            to_block = min(from_block + self.page_size - 1, head)
+            try:
+                logs = self.w3.eth.get_logs({
+                    'fromBlock': from_block,
+                    'toBlock': to_block,
+                    'address': self.contract.address,
+                    'topics': [list(self.topics)]
+                })
+            except Exception as e:
+                if self.page_size == 1:
+                    raise
+                # Providers cap the range or result count - shrink the page and retry
+                self.page_size = max(1, self.page_size // 2)
+                print(f"get_logs {from_block}-{to_block} failed, page size now {self.page_size}: {e}")
+                continue
+
+            events, blocks = self._decode_logs(logs)
+            tip = self.w3.eth.get_block(to_block)
+            blocks[to_block] = (tip['hash'].hex(), tip['timestamp'])
+            self.store.record(self.name, events, blocks, to_block)
+            indexed += len(events)
+            self.page_size = min(self.max_page_size, self.page_size * 2)
+
+            for listener in self.listeners:
+                listener.on_events(events)
+
+        self.synced = self.checkpoint >= head
+        return indexed
+
+    def _decode_logs(self, logs):
+        block_numbers = sorted({log['blockNumber'] for log in logs})
+        known = self.store.get_block_timestamps(block_numbers) if block_numbers else {}
+        blocks = {}
+        for number in block_numbers:
+            if number not in known:
+                block = self.w3.eth.get_block(number)
+                blocks[number] = (block['hash'].hex(), block['timestamp'])
+                known[number] = block['timestamp']
+
+        events = []
+        for log in logs:
+            event_type = self.topics.get(bytes(log['topics'][0]))
+            if event_type is None:
+                continue
+            decoded = event_type.process_log(log)
+            events.append({
+                'event': decoded['event'],
+                'block_number': log['blockNumber'],
+                'log_index': log['logIndex'],
+                'tx_hash': log['transactionHash'].hex(),
+                'timestamp': known[log['blockNumber']],
+                'args': dict(decoded['args'])
+            })
+        events.sort(key=lambda event: (event['block_number'], event['log_index']))
+        return events, blocks
+
+    def _check_reorg(self):
+        checkpoint = self.checkpoint
+        stored_hash = self.store.get_block_hash(checkpoint)
+        if stored_hash is None:
+            return
+        chain_hash = self.w3.eth.get_block(checkpoint)['hash'].hex()
+        if chain_hash == stored_hash:
+            return
+
+        rollback_to = max(self.start_block - 1, checkpoint - self.reorg_depth)
+        print(f"Reorg detected at block {checkpoint}, rolling back {self.name} to {rollback_to}")
+        self.store.rollback(self.name, rollback_to)
+        for listener in self.listeners:
+            listener.on_rollback(rollback_to)
+
+    def run(self, interval=5):
+        while not self.stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error indexing {self.name}: {e}")
+            self.stop_event.wait(interval)
+
+    def start(self, interval=5):
+        thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stop_event.set()
+
+    def status(self):
+        return {
+            'name': self.name,
+            'checkpoint': self.checkpoint,
+            'head': self.head,
+            'synced': self.synced
+        }
+
+
+class IndexFollower:
+    """EventIndexer stand-in for worker processes reading an IndexStore another process writes.
+
+    Rather than reading logs it polls the store's checkpoint and hands the
+    events stored since its last poll to its listeners, inside one read
+    snapshot so a listener never sees a half-written page. The first poll,
+    and any poll that finds the last seen checkpoint block rolled back or
+    re-indexed under a new hash, resyncs listeners through
+    ``on_rollback(checkpoint)``, which rebuilds them from the store. ``head``
+    follows the block watcher's last block.
+    """
+
+    def __init__(self, store, name, block_watcher, start_block=0):
+        self.store = store
+        self.name = name
+        self.block_watcher = block_watcher
+        self.start_block = start_block
+        self.listeners = []
+        self.applied = None
+        self.applied_hash = None
+        self.head = None
+        self.synced = False
+        self.stop_event = threading.Event()
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    @property
+    def checkpoint(self):
+        checkpoint = self.store.get_checkpoint(self.name)
+        return self.start_block - 1 if checkpoint is None else checkpoint
+
+    def poll(self):
+        """Apply what the writer has stored since the last poll; returns the number of events applied"""
+        applied = 0
+        with self.store.snapshot():
+            checkpoint = self.checkpoint
+            if (self.applied is None or checkpoint < self.applied
+                    or self.store.get_block_hash(self.applied) != self.applied_hash):
+                for listener in self.listeners:
+                    listener.on_rollback(checkpoint)
+            elif checkpoint > self.applied:
+                events = list(self.store.iter_events(self.name, after_block=self.applied))
+                for listener in self.listeners:
+                    listener.on_events(events)
+                applied = len(events)
+            self.applied = checkpoint
+            self.applied_hash = self.store.get_block_hash(checkpoint)
+        self.head = self.block_watcher.last_block
+        self.synced = self.head is not None and checkpoint >= self.head
+        return applied
+
+    def run(self, interval=1):
+        while not self.stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error following {self.name}: {e}")
+            self.stop_event.wait(interval)
+
+    def start(self, interval=1):
+        thread = threading.Thread(target=self.run, args=(interval,), daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stop_event.set()
+
+    def status(self):
+        return {
+            'name': self.name,
+            'checkpoint': self.checkpoint,
+            'head': self.head,
+            'synced': self.synced
+        }
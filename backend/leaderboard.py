@@ -0,0 +1,162 @@
+"""
+Leaderboard engine for TXSPEAK backend
+Maintains per-address messaging stats incrementally from indexed MessagingContract events
+"""
+
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+RANKED_METRICS = ('earned', 'spent', 'messages_received', 'messages_sent')
+
+WINDOWS = {
+    'all': None,
+    '7d': 7 * 24 * 3600,
+    '24h': 24 * 3600
+}
+
+
+class Leaderboard:
+    """Per-address stats for one time window, with a sorted ranking per metric.
+
+    Rankings are lists of ``(-value, address)`` kept in order with bisect, so a
+    page of the top-K is a plain slice. Windowed boards keep a heap of the
+    contributions they have applied and subtract them again once they age out.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.stats = {}
+        self.rankings = {metric: [] for metric in RANKED_METRICS}
+        self.expiring = []
+        self.sequence = 0
+
+    def apply(self, address, deltas, timestamp, now):
+        """Add deltas for address; timestamp is the activity time the deltas belong to"""
+        if self.window is not None:
+            expires = timestamp + self.window
+            if expires <= now:
+                return
+            self.sequence += 1
+            heapq.heappush(self.expiring, (expires, self.sequence, address, deltas))
+        self._update(address, deltas, 1)
+
+    def expire(self, now):
+        while self.expiring and self.expiring[0][0] <= now:
+            _, _, address, deltas = heapq.heappop(self.expiring)
+            self._update(address, deltas, -1)
+
+    def _update(self, address, deltas, sign):
+        stats = self.stats.get(address)
+        if stats is None:
+            stats = self.stats[address] = {
+                'earned': 0,
+                'spent': 0,
+                'messages_received': 0,
+                'messages_sent': 0,
+                'response_total': 0,
+                'response_count': 0
+            }
+        for metric, delta in deltas.items():
+            if metric in self.rankings:
+                self._unrank(metric, stats[metric], address)
+            stats[metric] += sign * delta
+            if metric in self.rankings:
+                self._rank(metric, stats[metric], address)
+
+    def _rank(self, metric, value, address):
+        if value > 0:
+            insort(self.rankings[metric], (-value, address))
+
+    def _unrank(self, metric, value, address):
+        if value <= 0:
+            return
+        ranking = self.rankings[metric]
+        i = bisect_left(ranking, (-value, address))
+        if i < len(ranking) and ranking[i] == (-value, address):
+            del ranking[i]
+
+    def top(self, metric, limit=10, offset=0):
+        """Return a page of (address, stats) pairs ranked by metric"""
+        page = self.rankings[metric][offset:offset + limit]
+        return [(address, self.stats[address]) for _, address in page]
+
+    def count(self, metric):
+        return len(self.rankings[metric])
+
+
+class LeaderboardEngine:
+    """Feeds indexed messaging events into all-time, 7-day and 24-hour leaderboards.
+
+    Subscribe it to an EventIndexer; it rebuilds itself from the IndexStore on
+    startup and after a reorg rollback.
+    """
+
+    def __init__(self, store, source):
+        self.store = store
+        self.source = source
+        self.lock = threading.Lock()
+        self.rebuild()
+
+    def rebuild(self):
+        with self.lock:
+            self.boards = {name: Leaderboard(window) for name, window in WINDOWS.items()}
+            self.messages = {}
+            self._apply(self.store.iter_events(self.source))
+
+    def on_events(self, events):
+        with self.lock:
+            self._apply(events)
+
+    def on_rollback(self, block_number):
+        self.rebuild()
+
+    def _apply(self, events):
+        now = time.time()
+        for event in events:
+            args = event['args']
+            timestamp = event['timestamp']
+            if event['event'] == 'MessageSent':
+                sender = args['sender'].lower()
+                recipient = args['recipient'].lower()
+                self.messages[args['messageId']] = (sender, recipient, args['amount'], timestamp)
+                self._contribute(sender, {'spent': args['amount'], 'messages_sent': 1}, timestamp, now)
+                self._contribute(recipient, {'messages_received': 1}, timestamp, now)
+                continue
+
+            message = self.messages.get(args['messageId'])
+            if message is None:
+                continue
+            sender, recipient, amount, sent_at = message
+            # The contract only tracks response time in markAsRead, which emits no event,
+            # so accepting or rejecting a message counts as the recipient's response
+            response = {'response_total': max(0, timestamp - sent_at), 'response_count': 1}
+            if event['event'] == 'MessageAccepted':
+                self._contribute(recipient, dict(response, earned=amount), timestamp, now)
+            elif event['event'] == 'MessageRejected':
+                self._contribute(recipient, response, timestamp, now)
+                # Rejection refunds the sender; the refund ages out together with the original spend
+                self._contribute(sender, {'spent': -amount}, sent_at, now)
+
+    def _contribute(self, address, deltas, timestamp, now):
+        for board in self.boards.values():
+            board.apply(address, deltas, timestamp, now)
+
+    def top(self, window, metric, limit=10, offset=0):
+        """Return (rows, total) for a page of the ranking; rows are stat dicts with the address"""
+        with self.lock:
+            board = self.boards[window]
+            board.expire(time.time())
+            rows = []
+            for address, stats in board.top(metric, limit, offset):
+                count = stats['response_count']
+                rows.append({
+                    'address': address,
+                    'earned': stats['earned'],
+                    'spent': stats['spent'],
+                    'messages_received': stats['messages_received'],
+                    'messages_sent': stats['messages_sent'],
+                    'avg_response_time': stats['response_total'] // count if count else 0
+                })
+            return rows, board.count(metric)
@@ -0,0 +1,177 @@
+"""
+Local stand-in chain for TXSPEAK backend
+An in-process eth-tester chain with configurable per-call latency, plus helpers that
+compile and deploy the three contracts and seed them with realistic activity.
+
+Needs the benchmark extras, which the server itself does not:
+    pip install "eth-tester[py-evm]" py-solc-x
+and a solc 0.8.19 binary (``python -c "import solcx; solcx.install_solc('0.8.19')"``).
+"""
+
+import os
+import random
+import threading
+import time
+from collections import Counter
+from web3 import Web3
+from web3.providers.eth_tester import EthereumTesterProvider
+from content_store import file_cid
+from deploy_contracts import SOLC_VERSION, compile_contracts as compile_txspeak
+
+# Minimal aggregate3 with the same ABI as the canonical Multicall3, so CallBatcher batches locally too
+MULTICALL3_SOURCE = """
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.19;
+
+contract Multicall3 {
+    struct Call3 { address target; bool allowFailure; bytes callData; }
+    struct Result { bool success; bytes returnData; }
+
+    function aggregate3(Call3[] calldata calls) public payable returns (Result[] memory returnData) {
+        returnData = new Result[](calls.length);
+        for (uint256 i = 0; i < calls.length; i++) {
+            (bool success, bytes memory data) = calls[i].target.call(calls[i].callData);
+            require(calls[i].allowFailure || success, "Multicall3: call failed");
+            returnData[i] = Result(success, data);
+        }
+    }
+}
+"""
+
+# Set ``request_scope.label`` on a thread to attribute the RPC calls it makes
+request_scope = threading.local()
+
+
+class SimulatedChain(EthereumTesterProvider):
+    """eth-tester provider that sleeps ``latency`` seconds per request, like a remote node.
+
+    eth-tester is not thread-safe, so requests execute one at a time, but the
+    simulated network delay overlaps across threads. Calls are counted per
+    JSON-RPC method and per ``request_scope.label``.
+    """
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.methods = Counter()
+        self.labels = Counter()
+
+    def make_request(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        label = getattr(request_scope, 'label', None) or 'background'
+        with self.lock:
+            self.methods[method] += 1
+            self.labels[label] += 1
+            return super().make_request(method, params)
+
+    def status(self):
+        """Same shape as PooledHTTPProvider.status, for /api/health"""
+        return [{'url': 'eth-tester', 'latency': self.latency, 'failures': 0, 'open': False}]
+
+    def reset_counts(self):
+        with self.lock:
+            self.methods.clear()
+            self.labels.clear()
+
+
+def compile_contracts():
+    """The TXSPEAK contracts plus the local Multicall3; returns {name: (abi, bytecode)}"""
+    import solcx
+
+    artifacts = compile_txspeak()
+    compiled = solcx.compile_source(MULTICALL3_SOURCE, output_values=['abi', 'bin'], solc_version=SOLC_VERSION)
+    for key, artifact in compiled.items():
+        artifacts[key.rsplit(':', 1)[1]] = (artifact['abi'], artifact['bin'])
+    return artifacts
+
+
+def deploy(w3, abi, bytecode, *args, sender=None):
+    contract = w3.eth.contract(abi=abi, bytecode=bytecode)
+    tx_hash = contract.constructor(*args).transact({'from': sender or w3.eth.accounts[0]})
+    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    return w3.eth.contract(address=receipt.contractAddress, abi=abi)
+
+
+def deploy_all(w3):
+    """Deploy Multicall3 and the three TXSPEAK contracts; returns {name: Contract}"""
+    artifacts = compile_contracts()
+    token = deploy(w3, *artifacts['TXSPKToken'])
+    return {
+        'multicall': deploy(w3, *artifacts['Multicall3']),
+        'txspk_token': token,
+        'messaging': deploy(w3, *artifacts['MessagingContract'], token.address),
+        'presale': deploy(w3, *artifacts['PresaleContract'], token.address)
+    }
+
+
+def create_users(w3, count, eth_each=10):
+    """Add funded, unlocked accounts to the tester chain"""
+    owner = w3.eth.accounts[0]
+    users = []
+    for _ in range(count):
+        key = '0x' + os.urandom(32).hex()
+        address = w3.provider.ethereum_tester.add_account(key)
+        w3.eth.send_transaction({'from': owner, 'to': address, 'value': Web3.to_wei(eth_each, 'ether')})
+        users.append((Web3.to_checksum_address(address), key))
+    return users
+
+
+def seed(w3, contracts, users, messages=500, purchases=200, seed_value=1, content_dir=None):
+    """Give the chain realistic holder, profile, presale and inbox volume.
+
+    With content_dir, every fourth message gets an attachment: a file in
+    content_dir named by its CIDv0, which a DirectoryGateway can serve.
+    Returns the attachment CIDs.
+    """
+    rng = random.Random(seed_value)
+    owner = w3.eth.accounts[0]
+    token, messaging, presale = contracts['txspk_token'], contracts['messaging'], contracts['presale']
+    addresses = [address for address, _ in users]
+
+    token.functions.transfer(presale.address, Web3.to_wei(200_000_000, 'ether')).transact({'from': owner})
+    for i, address in enumerate(addresses):
+        token.functions.transfer(address, Web3.to_wei(rng.randint(1_000, 100_000), 'ether')).transact({'from': owner})
+        if i % 2 == 0:
+            token.functions.setUserProfile(f"user{i}").transact({'from': address})
+        if i % 5 == 0:
+            token.functions.setInboxPrice(Web3.to_wei(rng.choice((1, 5, 10)), 'ether')).transact({'from': address})
+        token.functions.approve(messaging.address, 2 ** 255).transact({'from': address})
+
+    for start in range(0, len(addresses), 100):
+        presale.functions.addToWhitelist(addresses[start:start + 100]).transact({'from': owner})
+    for _ in range(purchases):
+        buyer = rng.choice(addresses)
+        value = Web3.to_wei(rng.choice((0.01, 0.05, 0.1, 0.5, 1)), 'ether')
+        presale.functions.buyTokens().transact({'from': buyer, 'value': value})
+
+    sent = []
+    cids = []
+    for i in range(messages):
+        sender, recipient = rng.sample(addresses, 2)
+        token_amount = Web3.to_wei(rng.choice((10, 25, 50)), 'ether')
+        ipfs_hash = ''
+        if content_dir and i % 4 == 0:
+            tmp_path = os.path.join(content_dir, 'upload.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(rng.randbytes(rng.randint(1_000, 500_000)))
+            cid = file_cid(tmp_path)
+            os.replace(tmp_path, os.path.join(content_dir, cid))
+            cids.append(cid)
+            ipfs_hash = f'ipfs://{cid}'
+        tx_hash = messaging.functions.sendMessage(
+            recipient, f"Subject {i}", f"Message body {i} " * rng.randint(1, 20), ipfs_hash,
+            token_amount, rng.choice(('text', 'pitch', 'question')), False
+        ).transact({'from': sender})
+        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        message_id = messaging.events.MessageSent().process_receipt(receipt)[0]['args']['messageId']
+        sent.append((message_id, recipient))
+
+    for message_id, recipient in sent:
+        outcome = rng.random()
+        if outcome < 0.5:
+            messaging.functions.acceptMessage(message_id).transact({'from': recipient})
+        elif outcome < 0.7:
+            messaging.functions.rejectMessage(message_id).transact({'from': recipient})
+    return cids
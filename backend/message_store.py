@@ -0,0 +1,298 @@
+"""
+Message store for TXSPEAK backend
+Keeps message bodies permanently in SQLite; only the status column is ever refreshed.
+Non-encrypted subjects and contents are also kept in an FTS5 index for search.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from indexer import STATUS_ACCEPTED
+from contracts import Message
+
+ZERO_ADDRESS = '0x' + '0' * 40
+
+# An amount range matching fewer rows than this is read through its index and sorted;
+# a wider one is cheaper to check while walking message IDs newest first
+RANGE_INDEX_ROWS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_bodies (
+    id INTEGER PRIMARY KEY,
+    sender TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    content TEXT NOT NULL,
+    ipfs_hash TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    message_type TEXT NOT NULL,
+    encrypted INTEGER NOT NULL,
+    status_checked_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS message_text USING fts5(
+    subject, content, tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+"""
+
+# Created after the migration in _migrate, since older databases lack amount_value
+INDEXES = """
+CREATE INDEX IF NOT EXISTS message_bodies_sender ON message_bodies (sender, id);
+CREATE INDEX IF NOT EXISTS message_bodies_recipient ON message_bodies (recipient, id);
+CREATE INDEX IF NOT EXISTS message_bodies_timestamp ON message_bodies (timestamp, id);
+CREATE INDEX IF NOT EXISTS message_bodies_amount ON message_bodies (amount_value);
+CREATE INDEX IF NOT EXISTS message_bodies_ipfs_hash ON message_bodies (ipfs_hash);
+"""
+
+
+def fts_query(text):
+    """FTS5 query matching every word of free text, the last one as a prefix; None when there are no words"""
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+class MessageStore:
+    """Permanent cache of getMessage results keyed by message ID.
+
+    Everything except ``status`` is fixed once sendMessage has run. Status
+    moves out of Pending only through acceptMessage / rejectMessage, which
+    emit events, so callers push those with set_status. Accepted -> Read
+    happens in markAsRead without an event, so Accepted rows are re-read from
+    the chain once they are older than ``status_ttl``.
+    """
+
+    def __init__(self, path, status_ttl=30):
+        self.status_ttl = status_ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.conn.executescript(INDEXES)
+
+    def _migrate(self):
+        # amount_value and the text index came after the original schema; upgrade older databases in place.
+        # BEGIN IMMEDIATE so workers opening the database together don't both add the column.
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            columns = {row[1] for row in self.conn.execute('PRAGMA table_info(message_bodies)')}
+            if 'amount_value' in columns:
+                return
+            self.conn.execute('ALTER TABLE message_bodies ADD COLUMN amount_value REAL')
+            self.conn.execute('UPDATE message_bodies SET amount_value = CAST(amount AS REAL)')
+            self.conn.execute(
+                'INSERT INTO message_text (rowid, subject, content) '
+                'SELECT id, subject, content FROM message_bodies WHERE encrypted = 0'
+            )
+        finally:
+            self.conn.commit()
+
+    def lookup(self, message_ids):
+        """Return ({id: Message} for stored messages, [ids that need a chain read])"""
+        if not message_ids:
+            return {}, []
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT id, sender, recipient, subject, content, ipfs_hash, amount, timestamp, status, '
+                f"message_type, encrypted, status_checked_at FROM message_bodies WHERE id IN ({','.join('?' * len(message_ids))})",
+                list(message_ids)
+            ).fetchall()
+
+        now = time.time()
+        found = {}
+        for row in rows:
+            status, checked_at = row[8], row[11]
+            if status == STATUS_ACCEPTED and now - checked_at > self.status_ttl:
+                continue
+            found[row[0]] = Message(
+                row[1], row[2], row[3], row[4], row[5], int(row[6]), row[7], status, row[9], bool(row[10])
+            )
+        return found, [msg_id for msg_id in message_ids if msg_id not in found]
+
+    def put(self, messages):
+        """Store Message records keyed by message ID"""
+        now = time.time()
+        rows = []
+        for msg_id, message in messages.items():
+            # getMessage returns an all-zero struct for IDs that do not exist (yet)
+            if message is None or message.sender == ZERO_ADDRESS:
+                continue
+            rows.append((msg_id, message.sender, message.recipient, message.subject, message.content,
+                         message.ipfs_hash, str(message.amount), float(message.amount), message.timestamp,
+                         message.status, message.message_type, int(message.encrypted), now))
+        if not rows:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO message_bodies (id, sender, recipient, subject, content, ipfs_hash, '
+                'amount, amount_value, timestamp, status, message_type, encrypted, status_checked_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            # Encrypted subjects and contents are ciphertext; only their metadata is searchable
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO message_text (rowid, subject, content) VALUES (?, ?, ?)',
+                [(row[0], row[3], row[4]) for row in rows if not row[11]]
+            )
+
+    def stored_ids(self, message_ids):
+        """The subset of message_ids whose bodies are stored, whatever their status age"""
+        if not message_ids:
+            return set()
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id FROM message_bodies WHERE id IN ({','.join('?' * len(message_ids))})",
+                list(message_ids)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def references(self, cid):
+        """Whether a stored message's ipfsHash is cid, ipfs://cid or /ipfs/cid"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM message_bodies WHERE ipfs_hash IN (?, ?, ?) LIMIT 1',
+                (cid, f'ipfs://{cid}', f'/ipfs/{cid}')
+            ).fetchone()
+        return row is not None
+
+    def discard_after(self, message_id):
+        """Forget messages with IDs above message_id, e.g. after a reorg dropped them"""
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM message_bodies WHERE id > ?', (message_id,))
+            self.conn.execute('DELETE FROM message_text WHERE rowid > ?', (message_id,))
+
+    def _id_range(self, since, until):
+        """IDs of the first and last messages in [since, until], or None at an end with no messages.
+
+        IDs are assigned in sendMessage and timestamps are block times, so
+        both only grow: a time window is an ID range, found with two seeks.
+        """
+        low, high = 0, float('inf')
+        with self.lock:
+            if since is not None:
+                row = self.conn.execute(
+                    'SELECT id FROM message_bodies WHERE timestamp >= ? ORDER BY timestamp, id LIMIT 1', (since,)
+                ).fetchone()
+                low = row[0] if row else None
+            if until is not None:
+                row = self.conn.execute(
+                    'SELECT id FROM message_bodies WHERE timestamp <= ? ORDER BY timestamp DESC, id DESC LIMIT 1',
+                    (until,)
+                ).fetchone()
+                high = row[0] if row else None
+        return low, high
+
+    def _narrow_amount(self, low, high):
+        """Whether fewer than RANGE_INDEX_ROWS messages have amounts in [low, high], counting at most that many"""
+        with self.lock:
+            count = self.conn.execute(
+                'SELECT COUNT(*) FROM (SELECT 1 FROM message_bodies WHERE amount_value >= ? AND amount_value <= ? LIMIT ?)',
+                (low, high, RANGE_INDEX_ROWS)
+            ).fetchone()[0]
+        return count < RANGE_INDEX_ROWS
+
+    def search(self, text=None, sender=None, recipient=None, message_type=None, status=None,
+               min_amount=None, max_amount=None, since=None, until=None, before=None, limit=20):
+        """Stored messages matching every given filter, newest first.
+
+        ``text`` matches words in the subject or content of non-encrypted
+        messages (the last word as a prefix); without it encrypted messages
+        match too. Amounts are in wei (compared as floats, since wei overflows
+        SQLite integers) and times are Unix timestamps, both inclusive. Returns ([(id, Message)], cursor for the next page or None).
+        """
+        query = fts_query(text)
+        if query is not None:
+            # FTS5 walks its rowids backwards for ORDER BY rowid DESC, so a page stops after `limit` matches
+            sql = ('SELECT b.* FROM message_text JOIN message_bodies b ON b.id = message_text.rowid '
+                   'WHERE message_text MATCH ?')
+            params = [query]
+            id_column = 'message_text.rowid'
+        else:
+            sql = 'SELECT b.* FROM message_bodies b WHERE 1'
+            params = []
+            id_column = 'b.id'
+        for clause, value in (('b.sender = ?', sender), ('b.recipient = ?', recipient),
+                              ('b.message_type = ?', message_type), ('b.status = ?', status),
+                              (f'{id_column} < ?', before)):
+            if value is not None:
+                sql += f' AND {clause}'
+                params.append(value)
+        if since is not None or until is not None:
+            low, high = self._id_range(since, until)
+            if low is None or high is None or low > high:
+                return [], None
+            sql += f' AND {id_column} >= ? AND {id_column} <= ?'
+            params += [low, high]
+        if min_amount is not None or max_amount is not None:
+            min_amount = float('-inf') if min_amount is None else float(min_amount)
+            max_amount = float('inf') if max_amount is None else float(max_amount)
+            if query is None and self._narrow_amount(min_amount, max_amount):
+                sql = sql.replace('FROM message_bodies b', 'FROM message_bodies b INDEXED BY message_bodies_amount')
+                sql += ' AND b.amount_value >= ? AND b.amount_value <= ?'
+            else:
+                # A unary + keeps SQLite from reading the amount index
+                sql += ' AND +b.amount_value >= ? AND +b.amount_value <= ?'
+            params += [min_amount, max_amount]
+        sql += f' ORDER BY {id_column} DESC LIMIT ?'
+        params.append(limit + 1)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        # Columns: id, sender, recipient, subject, content, ipfs_hash, amount, timestamp, status,
+        # message_type, encrypted, status_checked_at, amount_value
+        results = [(row[0], Message(row[1], row[2], row[3], row[4], row[5], int(row[6]), row[7], row[8],
+                                    row[9], bool(row[10])))
+                   for row in rows[:limit]]
+        return results, (results[-1][0] if len(rows) > limit else None)
+
+    def set_status(self, message_id, status):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'UPDATE message_bodies SET status = ?, status_checked_at = ? WHERE id = ?',
+                (status, time.time(), message_id)
+            )
+
+
+class MessageBackfill:
+    """Message-indexer listener that stores the body of every message as it is indexed.
+
+    Bodies otherwise only reach the store when someone opens an inbox, so
+    without this search would miss most messages. ``fetch(ids)`` returns
+    {id: Message} read from the chain; catch_up fills in messages indexed
+    before the listener was attached.
+    """
+
+    def __init__(self, store, index_store, fetch, batch_size=200):
+        self.store = store
+        self.index_store = index_store
+        self.fetch = fetch
+        self.batch_size = batch_size
+
+    def on_events(self, events):
+        self.fill([event['args']['messageId'] for event in events if event['event'] == 'MessageSent'])
+
+    def on_rollback(self, block_number):
+        # Message IDs are sequential, so the reorged-out messages are exactly those past the newest one left
+        self.store.discard_after(self.index_store.max_message_id() or 0)
+
+    def fill(self, message_ids):
+        for start in range(0, len(message_ids), self.batch_size):
+            batch = message_ids[start:start + self.batch_size]
+            stored = self.store.stored_ids(batch)
+            missing = [msg_id for msg_id in batch if msg_id not in stored]
+            if missing:
+                self.store.put(self.fetch(missing))
+
+    def catch_up(self):
+        after = 0
+        while True:
+            message_ids = self.index_store.message_ids_after(after, self.batch_size)
+            if not message_ids:
+                return
+            self.fill(message_ids)
+            after = message_ids[-1]
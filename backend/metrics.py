@@ -0,0 +1,142 @@
+"""
+Prometheus metrics for TXSPEAK backend
+Route latency, per-JSON-RPC-method timings recorded at the provider, and scrape-time
+gauges for the cache, block watcher and indexers
+"""
+
+import os
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+HTTP_LATENCY = Histogram(
+    'txspeak_http_request_duration_seconds', 'HTTP request latency by route',
+    ['method', 'route', 'status']
+)
+RPC_LATENCY = Histogram(
+    'txspeak_rpc_request_duration_seconds', 'JSON-RPC request latency by method, including retries',
+    ['method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+RPC_ERRORS = Counter(
+    'txspeak_rpc_errors_total', 'JSON-RPC requests that raised or returned an error, by method',
+    ['method']
+)
+
+
+def observe_request(method, route, status, elapsed):
+    # Label by the URL rule, not the path, so per-address routes stay one series
+    HTTP_LATENCY.labels(method, route or 'unmatched', str(status)).observe(elapsed)
+
+
+def _record_rpc(method, start, response):
+    RPC_LATENCY.labels(method).observe(time.perf_counter() - start)
+    if response is None or 'error' in response:
+        RPC_ERRORS.labels(method).inc()
+
+
+def instrument_provider(provider):
+    """Time every make_request on a web3 provider instance, by JSON-RPC method"""
+    make_request = provider.make_request
+
+    def timed(method, params):
+        start = time.perf_counter()
+        response = None
+        try:
+            response = make_request(method, params)
+            return response
+        finally:
+            _record_rpc(method, start, response)
+
+    provider.make_request = timed
+    return provider
+
+
+def instrument_async_provider(provider):
+    """instrument_provider for an async provider"""
+    make_request = provider.make_request
+
+    async def timed(method, params):
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await make_request(method, params)
+            return response
+        finally:
+            _record_rpc(method, start, response)
+
+    provider.make_request = timed
+    return provider
+
+
+class StateCollector:
+    """Reads cache, block watcher and indexer state when Prometheus scrapes.
+
+    ``indexers`` is a callable returning the running EventIndexers, since
+    they are replaced whenever contract addresses change.
+    """
+
+    def __init__(self, cache, block_watcher, indexers):
+        self.cache = cache
+        self.block_watcher = block_watcher
+        self.indexers = indexers
+
+    def collect(self):
+        stats = self.cache.stats()
+        lookups = CounterMetricFamily('txspeak_cache_lookups', 'Read cache lookups by result', labels=['result'])
+        lookups.add_metric(['hit'], stats['hits'])
+        lookups.add_metric(['stale_hit'], stats['stale_hits'])
+        lookups.add_metric(['miss'], stats['misses'])
+        lookups.add_metric(['shared_hit'], stats['shared_hits'])
+        yield lookups
+        yield GaugeMetricFamily('txspeak_cache_entries', 'Entries in the read cache', value=stats['entries'])
+        yield GaugeMetricFamily('txspeak_cache_bytes', 'Estimated size of the read cache', value=stats['bytes'])
+
+        watcher = self.block_watcher
+        if watcher.polled_at is not None:
+            yield GaugeMetricFamily(
+                'txspeak_updater_lag_seconds', 'Seconds since the block watcher last reached the chain head',
+                value=time.time() - watcher.polled_at
+            )
+        if watcher.last_block is not None and watcher.dispatched_block is not None:
+            yield GaugeMetricFamily('txspeak_updater_head_block', 'Chain head at the last block watcher poll',
+                                    value=watcher.last_block)
+            yield GaugeMetricFamily(
+                'txspeak_updater_lag_blocks', 'Blocks whose events have not been dispatched to the caches yet',
+                value=watcher.last_block - watcher.dispatched_block
+            )
+
+        checkpoint = GaugeMetricFamily('txspeak_indexer_block', 'Last block stored by each indexer', labels=['indexer'])
+        head = GaugeMetricFamily('txspeak_indexer_head_block', 'Chain head at each indexer\'s last poll', labels=['indexer'])
+        for indexer in self.indexers():
+            checkpoint.add_metric([indexer.name], indexer.checkpoint)
+            if indexer.head is not None:
+                head.add_metric([indexer.name], indexer.head)
+        yield checkpoint
+        yield head
+
+
+_state = None
+
+
+def register_state(cache, block_watcher, indexers):
+    global _state
+    _state = StateCollector(cache, block_watcher, indexers)
+    REGISTRY.register(_state)
+
+
+def render():
+    """(body, content type) for a /metrics response.
+
+    Under a multi-worker server with PROMETHEUS_MULTIPROC_DIR set, the
+    histograms and counters of every worker are merged; state gauges are the
+    answering worker's.
+    """
+    if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    from prometheus_client import multiprocess
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _state is not None:
+        registry.register(_state)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
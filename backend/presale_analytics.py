@@ -0,0 +1,206 @@
+"""
+Presale analytics for TXSPEAK backend
+Keeps indexed TokensPurchased / PresalePhaseStarted history as columnar per-minute time series
+"""
+
+import threading
+from array import array
+from bisect import bisect_left
+
+WEI = 10 ** 18
+
+
+class PresaleSeries:
+    """Append-only columns of per-bucket presale totals.
+
+    Only buckets with purchases are stored. ``times`` holds bucket start
+    times in ascending order and every other column the running total up to
+    and including that bucket, so the activity between two times is the
+    difference of two bisected lookups. Downsampling the whole presale to N
+    chart points costs O(N log buckets) no matter how long it ran.
+    """
+
+    def __init__(self, bucket=60):
+        self.bucket = bucket
+        self.times = array('q')
+        self.blocks = array('q')
+        self.raised = array('d')     # ETH
+        self.tokens = array('d')     # whole tokens
+        self.purchases = array('q')
+        self.buyers = array('q')
+        # Exact totals; the float columns are rewritten from these so rounding never accumulates
+        self.total_raised = 0
+        self.total_tokens = 0
+        self.total_purchases = 0
+        self.total_buyers = 0
+
+    def add(self, timestamp, block_number, eth_amount, token_amount, new_buyer):
+        self.total_raised += eth_amount
+        self.total_tokens += token_amount
+        self.total_purchases += 1
+        self.total_buyers += 1 if new_buyer else 0
+
+        start = timestamp - timestamp % self.bucket
+        if not self.times or start > self.times[-1]:
+            self.times.append(start)
+            self.blocks.append(block_number)
+            self.raised.append(0)
+            self.tokens.append(0)
+            self.purchases.append(0)
+            self.buyers.append(0)
+        # Block timestamps never go backwards, so an older bucket folds into the newest one
+        self.blocks[-1] = block_number
+        self.raised[-1] = self.total_raised / WEI
+        self.tokens[-1] = self.total_tokens / WEI
+        self.purchases[-1] = self.total_purchases
+        self.buyers[-1] = self.total_buyers
+
+    def _totals_before(self, timestamp):
+        i = bisect_left(self.times, timestamp) - 1
+        if i < 0:
+            return None, 0.0, 0.0, 0, 0
+        return self.blocks[i], self.raised[i], self.tokens[i], self.purchases[i], self.buyers[i]
+
+    def span(self):
+        """(first bucket start, end of last bucket), or None before the first purchase"""
+        if not self.times:
+            return None
+        return self.times[0], self.times[-1] + self.bucket
+
+    def downsample(self, start, end, points):
+        """Split [start, end) into at most `points` equal, bucket-aligned intervals"""
+        start -= start % self.bucket
+        buckets = max(1, -(-(end - start) // self.bucket))
+        step = self.bucket * max(1, -(-buckets // points))
+
+        rows = []
+        _, raised, tokens, purchases, buyers = self._totals_before(start)
+        for t in range(start, end, step):
+            block, total_raised, total_tokens, total_purchases, total_buyers = self._totals_before(t + step)
+            rows.append({
+                'time': t,
+                'block': block,
+                'eth_raised': total_raised - raised,
+                'tokens_sold': total_tokens - tokens,
+                'purchases': total_purchases - purchases,
+                'new_buyers': total_buyers - buyers,
+                'total_eth_raised': total_raised,
+                'total_tokens_sold': total_tokens,
+                'total_purchases': total_purchases,
+                'total_buyers': total_buyers
+            })
+            raised, tokens, purchases, buyers = total_raised, total_tokens, total_purchases, total_buyers
+        return rows, step
+
+
+class PresaleAnalytics:
+    """Feeds indexed presale events into a PresaleSeries and per-phase totals.
+
+    Subscribe it to an EventIndexer; like LeaderboardEngine it rebuilds
+    itself from the IndexStore on startup and after a reorg rollback.
+    """
+
+    def __init__(self, store, source, bucket=60):
+        self.store = store
+        self.source = source
+        self.bucket = bucket
+        self.lock = threading.Lock()
+        self.rebuild()
+
+    def rebuild(self):
+        with self.lock:
+            self.series = PresaleSeries(self.bucket)
+            self.buyers = set()
+            self.phases = {}
+            self.ended_at = None
+            self._apply(self.store.iter_events(self.source))
+
+    def on_events(self, events):
+        with self.lock:
+            self._apply(events)
+
+    def on_rollback(self, block_number):
+        self.rebuild()
+
+    def _phase(self, number):
+        phase = self.phases.get(number)
+        if phase is None:
+            phase = self.phases[number] = {
+                'phase': number,
+                'price': None,
+                'max_tokens': None,
+                'started_at': None,
+                'started_block': None,
+                'eth_raised': 0,
+                'tokens_sold': 0,
+                'purchases': 0,
+                'buyers': set()
+            }
+        return phase
+
+    def _apply(self, events):
+        for event in events:
+            args = event['args']
+            if event['event'] == 'TokensPurchased':
+                buyer = args['buyer'].lower()
+                new_buyer = buyer not in self.buyers
+                self.buyers.add(buyer)
+                self.series.add(event['timestamp'], event['block_number'],
+                                args['ethAmount'], args['tokenAmount'], new_buyer)
+                phase = self._phase(args['phase'])
+                phase['eth_raised'] += args['ethAmount']
+                phase['tokens_sold'] += args['tokenAmount']
+                phase['purchases'] += 1
+                phase['buyers'].add(buyer)
+            elif event['event'] == 'PresalePhaseStarted':
+                phase = self._phase(args['phase'])
+                phase['price'] = args['price']
+                phase['max_tokens'] = args['maxTokens']
+                phase['started_at'] = event['timestamp']
+                phase['started_block'] = event['block_number']
+            elif event['event'] == 'PresaleEnded':
+                self.ended_at = event['timestamp']
+
+    def history(self, start=None, end=None, points=200):
+        """Return (rows, step) of raised / sold / buyers over time, downsampled to `points`"""
+        with self.lock:
+            span = self.series.span()
+            if span is None:
+                return [], self.bucket
+            start = span[0] if start is None else start
+            end = span[1] if end is None else end
+            if end <= start:
+                return [], self.bucket
+            return self.series.downsample(start, end, points)
+
+    def phase_stats(self):
+        """Per-phase totals and fill rate (tokens sold / phase cap), in phase order"""
+        with self.lock:
+            rows = []
+            for number in sorted(self.phases):
+                phase = self.phases[number]
+                max_tokens = phase['max_tokens']
+                rows.append({
+                    'phase': number,
+                    'price': phase['price'],
+                    'max_tokens': max_tokens,
+                    'started_at': phase['started_at'],
+                    'started_block': phase['started_block'],
+                    'eth_raised': phase['eth_raised'],
+                    'tokens_sold': phase['tokens_sold'],
+                    'purchases': phase['purchases'],
+                    'buyers': len(phase['buyers']),
+                    'fill_rate': phase['tokens_sold'] / max_tokens if max_tokens else None
+                })
+            return rows
+
+    def summary(self):
+        with self.lock:
+            return {
+                'total_eth_raised': self.series.total_raised,
+                'total_tokens_sold': self.series.total_tokens,
+                'purchases': self.series.total_purchases,
+                'buyers': len(self.buyers),
+                'buckets': len(self.series.times),
+                'ended_at': self.ended_at
+            }
@@ -0,0 +1,60 @@
+"""
+Inbox price book for TXSPEAK backend
+Replays indexed InboxPriceSet / ProfileUpdated events into in-memory per-address prices and display names
+"""
+
+import threading
+
+
+class InboxPriceBook:
+    """Address -> inbox price and profile name, kept current from indexed TXSPKToken events.
+
+    getUserInboxPrice and getUserProfile return the last value set, and 0 /
+    '' for addresses that never set one, so once the indexer has caught up a
+    lookup answers exactly what the chain would without calling it. Both
+    events are rare, so a rollback simply replays the whole index.
+    """
+
+    def __init__(self, store, source):
+        self.store = store
+        self.source = source
+        self.lock = threading.Lock()
+        self.rebuild()
+
+    def rebuild(self):
+        with self.lock:
+            self.prices = {}
+            self.profiles = {}
+            self._apply(self.store.iter_events(self.source))
+
+    def on_events(self, events):
+        with self.lock:
+            self._apply(events)
+
+    def on_rollback(self, block_number):
+        self.rebuild()
+
+    def _apply(self, events):
+        for event in events:
+            args = event['args']
+            user = args['user'].lower()
+            if event['event'] == 'InboxPriceSet':
+                if args['price']:
+                    self.prices[user] = args['price']
+                else:
+                    self.prices.pop(user, None)
+            elif event['event'] == 'ProfileUpdated':
+                if args['profile']:
+                    self.profiles[user] = args['profile']
+                else:
+                    self.profiles.pop(user, None)
+
+    def lookup(self, addresses):
+        """{address: (inbox price in wei, profile)} for lowercased addresses"""
+        with self.lock:
+            return {address: (self.prices.get(address, 0), self.profiles.get(address, ''))
+                    for address in addresses}
+
+    def status(self):
+        with self.lock:
+            return {'priced': len(self.prices), 'profiles': len(self.profiles)}
@@ -0,0 +1,303 @@
+"""
+Shared RPC provider for TXSPEAK backend
+Pooled keep-alive HTTP connections to several RPC endpoints with latency-weighted
+routing, circuit breaking and jittered retries
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3, AsyncWeb3
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.providers.base import JSONBaseProvider
+from metrics import instrument_provider, instrument_async_provider
+
+# Same default web3's HTTPProvider falls back to
+DEFAULT_RPC_URL = 'http://localhost:8545'
+
+# JSON-RPC error codes providers use for throttling
+RATE_LIMIT_CODES = {-32005, -32029, 429}
+
+
+class RetryableRPCError(Exception):
+    """An endpoint failure worth retrying on another endpoint"""
+
+
+class Endpoint:
+    """Health and latency bookkeeping for one RPC URL"""
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.failures = 0
+        self.open_until = 0
+        self.probing = False
+
+    def available(self, now):
+        return self.open_until <= now and not self.probing
+
+    def weight(self):
+        # Unmeasured endpoints get tried early so they earn a latency figure
+        return 1.0 / max(self.latency, 0.001) if self.latency is not None else 1000.0
+
+    def record_success(self, elapsed):
+        self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self, threshold, cooldown):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= threshold:
+            self.open_until = time.time() + cooldown
+
+
+class EndpointPool:
+    """Routing and circuit breaking over several RPC URLs, shared by the sync and async providers.
+
+    A healthy endpoint is picked at random, weighted by the inverse of its
+    recent latency. After ``failure_threshold`` consecutive errors or
+    rate-limit responses an endpoint's circuit opens for ``cooldown``
+    seconds; afterwards one probe request is let through to close it again.
+    """
+
+    def __init__(self, urls, failure_threshold=3, cooldown=30):
+        if not urls:
+            raise ValueError('At least one RPC URL is required')
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+
+    def choose(self, tried):
+        now = time.time()
+        with self.lock:
+            candidates = [e for e in self.endpoints if e.available(now) and e not in tried]
+            if not candidates:
+                candidates = [e for e in self.endpoints if e.available(now)]
+            if not candidates:
+                # Every circuit is open - probe the one that has been resting longest
+                endpoint = min(self.endpoints, key=lambda e: e.open_until)
+                endpoint.probing = True
+                return endpoint
+            endpoint = random.choices(candidates, weights=[e.weight() for e in candidates])[0]
+            if endpoint.failures >= self.failure_threshold:
+                endpoint.probing = True
+            return endpoint
+
+    def record_success(self, endpoint, elapsed):
+        with self.lock:
+            endpoint.record_success(elapsed)
+
+    def record_failure(self, endpoint):
+        with self.lock:
+            endpoint.record_failure(self.failure_threshold, self.cooldown)
+
+    def release(self, endpoint):
+        """End a probe that failed for a reason that says nothing about the endpoint"""
+        with self.lock:
+            endpoint.probing = False
+
+    def status(self):
+        now = time.time()
+        with self.lock:
+            return [{
+                'url': endpoint.url,
+                'latency': endpoint.latency,
+                'failures': endpoint.failures,
+                'open': endpoint.open_until > now
+            } for endpoint in self.endpoints]
+
+
+def check_rpc_response(response):
+    """Raise RetryableRPCError for a JSON-RPC rate-limit error, else return the response"""
+    error = response.get('error')
+    if isinstance(error, dict) and error.get('code') in RATE_LIMIT_CODES:
+        raise RetryableRPCError(error.get('message', 'rate limited'))
+    return response
+
+
+class PooledHTTPProvider(JSONBaseProvider):
+    """web3 provider spreading requests over the endpoints of an EndpointPool.
+
+    Connections are kept alive in one requests session. Failed requests are
+    retried on another endpoint with jittered exponential backoff.
+    """
+
+    def __init__(self, urls, pool_size=20, timeout=10, max_retries=3,
+                 failure_threshold=3, cooldown=30, backoff=0.1, pool=None):
+        super().__init__()
+        self.pool = pool or EndpointPool(urls, failure_threshold, cooldown)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.pool.endpoints), pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    def __str__(self):
+        return f"PooledHTTPProvider({len(self.pool.endpoints)} endpoints)"
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        tried = []
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            endpoint = self.pool.choose(tried)
+            tried.append(endpoint)
+            start = time.monotonic()
+            try:
+                response = self._send(endpoint, request_data)
+            except (requests.RequestException, RetryableRPCError) as e:
+                self.pool.record_failure(endpoint)
+                print(f"RPC {method} failed on {endpoint.url}: {e}")
+                last_error = e
+                continue
+            except Exception:
+                self.pool.release(endpoint)
+                raise
+            self.pool.record_success(endpoint, time.monotonic() - start)
+            return response
+        raise last_error
+
+    def _send(self, endpoint, request_data):
+        resp = self.session.post(endpoint.url, data=request_data, timeout=self.timeout)
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise RetryableRPCError(f"HTTP {resp.status_code}")
+        resp.raise_for_status()
+        return check_rpc_response(self.decode_rpc_response(resp.content))
+
+    def status(self):
+        return self.pool.status()
+
+
+class AsyncPooledHTTPProvider(AsyncJSONBaseProvider):
+    """Async counterpart of PooledHTTPProvider, on aiohttp.
+
+    Given the sync provider's EndpointPool, both apps in one process see the
+    same latencies and open circuits. The aiohttp session belongs to the
+    event loop that first used it and is recreated for another loop.
+    """
+
+    def __init__(self, urls, pool_size=100, timeout=10, max_retries=3,
+                 failure_threshold=3, cooldown=30, backoff=0.1, pool=None):
+        super().__init__()
+        self.pool = pool or EndpointPool(urls, failure_threshold, cooldown)
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = None
+        self.session_loop = None
+
+    def __str__(self):
+        return f"AsyncPooledHTTPProvider({len(self.pool.endpoints)} endpoints)"
+
+    def _session(self):
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.session_loop is not loop:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers={'Content-Type': 'application/json'},
+                timeout=self.timeout
+            )
+            self.session_loop = loop
+        return self.session
+
+    async def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        tried = []
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            endpoint = self.pool.choose(tried)
+            tried.append(endpoint)
+            start = time.monotonic()
+            try:
+                response = await self._send(endpoint, request_data)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RetryableRPCError) as e:
+                self.pool.record_failure(endpoint)
+                print(f"RPC {method} failed on {endpoint.url}: {e}")
+                last_error = e
+                continue
+            except Exception:
+                self.pool.release(endpoint)
+                raise
+            self.pool.record_success(endpoint, time.monotonic() - start)
+            return response
+        raise last_error
+
+    async def _send(self, endpoint, request_data):
+        async with self._session().post(endpoint.url, data=request_data) as resp:
+            if resp.status == 429 or resp.status >= 500:
+                raise RetryableRPCError(f"HTTP {resp.status}")
+            resp.raise_for_status()
+            return check_rpc_response(self.decode_rpc_response(await resp.read()))
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def status(self):
+        return self.pool.status()
+
+
+def rpc_urls():
+    """RPC endpoints from RPC_URLS (comma separated), falling back to INFURA_URL"""
+    urls = [url.strip() for url in os.getenv('RPC_URLS', '').split(',') if url.strip()]
+    if not urls and os.getenv('INFURA_URL'):
+        urls = [os.getenv('INFURA_URL')]
+    return urls
+
+_web3 = None
+_pool = None
+_web3_lock = threading.Lock()
+
+def endpoint_pool():
+    """Process-wide EndpointPool over rpc_urls(), shared by make_web3 and make_async_web3"""
+    global _pool
+    with _web3_lock:
+        if _pool is None:
+            _pool = EndpointPool(rpc_urls() or [DEFAULT_RPC_URL])
+        return _pool
+
+def provider_settings():
+    return {
+        'timeout': float(os.getenv('RPC_TIMEOUT', '10')),
+        'max_retries': int(os.getenv('RPC_MAX_RETRIES', '3'))
+    }
+
+def make_web3():
+    """Process-wide Web3 instance on the shared pooled provider"""
+    global _web3
+    pool = endpoint_pool()
+    with _web3_lock:
+        if _web3 is None:
+            _web3 = Web3(instrument_provider(PooledHTTPProvider(
+                None, pool_size=int(os.getenv('RPC_POOL_SIZE', '20')), pool=pool, **provider_settings()
+            )))
+        return _web3
+
+def use_web3(w3):
+    """Install w3 as the instance make_web3 returns, e.g. on a local stand-in chain; call before importing server"""
+    global _web3
+    with _web3_lock:
+        _web3 = w3
+    return w3
+
+def make_async_web3():
+    """AsyncWeb3 over the same endpoints, and the same circuit breakers, as make_web3"""
+    return AsyncWeb3(instrument_async_provider(AsyncPooledHTTPProvider(
+        None, pool_size=int(os.getenv('RPC_ASYNC_POOL_SIZE', '100')), pool=endpoint_pool(), **provider_settings()
+    )))
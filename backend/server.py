@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS
 from web3 import Web3
 from eth_account import Account
@@ -9,6 +9,28 @@ from datetime import datetime
 from dotenv import load_dotenv
 import threading
 import requests
+from batcher import CallBatcher, MULTICALL3_ADDRESS
+from indexer import (IndexStore, EventIndexer, IndexFollower, STATUS_EVENTS, STATUS_PENDING, STATUS_ACCEPTED,
+                     STATUS_REJECTED, STATUS_REFUNDED, STATUS_READ)
+from leaderboard import LeaderboardEngine, WINDOWS
+from presale_analytics import PresaleAnalytics
+from holders import HolderLedger
+from price_book import InboxPriceBook
+from cache import TTLCache
+from contracts import ContractRegistry
+import metrics
+from block_watcher import BlockWatcher
+from provider import make_web3
+from id_lists import IdListCache
+from message_store import MessageStore, MessageBackfill
+from content_store import ContentStore, make_gateway, parse_cid
+from event_hub import EventHub
+from auth import SignatureVerifier, NonceStore, SharedNonceStore, SessionTokens
+from shared_state import open_shared_store, WorkerCoordinator
+from functools import wraps
+import hashlib
+import secrets
+import signal
 
 # Load environment variables
 load_dotenv()
@@ -20,8 +42,45 @@ CORS(app)
 INFURA_URL = os.getenv('INFURA_URL')
 PRIVATE_KEY = os.getenv('PRIVATE_KEY')
 NETWORK = os.getenv('NETWORK', 'sepolia')
+INDEX_DB_PATH = os.getenv('INDEX_DB_PATH', 'txspeak_index.db')
+MESSAGE_DB_PATH = os.getenv('MESSAGE_DB_PATH', 'txspeak_messages.db')
+# http(s) gateway URL with {cid}, or file:///path for a local stand-in
+IPFS_GATEWAY = os.getenv('IPFS_GATEWAY', 'https://ipfs.io/ipfs/{cid}')
+CONTENT_CACHE_DIR = os.getenv('CONTENT_CACHE_DIR', 'txspeak_content')
+CONTENT_CACHE_MAX_BYTES = int(os.getenv('CONTENT_CACHE_MAX_BYTES', str(1024 ** 3)))
+CONTENT_MAX_OBJECT_BYTES = int(os.getenv('CONTENT_MAX_OBJECT_BYTES', str(50 * 1024 ** 2)))
+CONTENT_FETCH_TIMEOUT = float(os.getenv('CONTENT_FETCH_TIMEOUT', '10'))
+INDEXER_START_BLOCK = int(os.getenv('INDEXER_START_BLOCK', '0'))
+INDEXER_REORG_DEPTH = int(os.getenv('INDEXER_REORG_DEPTH', '12'))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+WS_URL = os.getenv('WS_URL')
+BLOCK_POLL_INTERVAL = float(os.getenv('BLOCK_POLL_INTERVAL', '2'))
+STREAM_MAX_CLIENTS = int(os.getenv('STREAM_MAX_CLIENTS', '1000'))
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', '100'))
+STREAM_KEEPALIVE = 15
+AUTH_WORKERS = int(os.getenv('AUTH_WORKERS', str(os.cpu_count() or 1)))
+AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', '10000'))
+AUTH_BATCH_LIMIT = 500
+BULK_ADDRESS_LIMIT = int(os.getenv('BULK_ADDRESS_LIMIT', '500'))
+AUTH_NONCE_TTL = int(os.getenv('AUTH_NONCE_TTL', '300'))
+SESSION_TTL = int(os.getenv('SESSION_TTL', str(24 * 3600)))
+# sqlite:///path or redis://host:port/db; unset keeps cache, config and nonces in process memory
+SHARED_STATE_URL = os.getenv('SHARED_STATE_URL')
+REFRESHER_LEASE_TTL = int(os.getenv('REFRESHER_LEASE_TTL', '15'))
 
-w3 = Web3(Web3.HTTPProvider(INFURA_URL))
+# State shared by every worker process of a multi-worker deployment (see gunicorn.conf.py)
+shared_store = open_shared_store(SHARED_STATE_URL) if SHARED_STATE_URL else None
+
+# Tokens only survive restarts (and work across processes) with a configured secret;
+# without one, workers sharing state agree on a generated secret kept in the store
+SESSION_SECRET = os.getenv('SESSION_SECRET')
+if not SESSION_SECRET and shared_store:
+    shared_store.add('session_secret', secrets.token_hex(32))
+    SESSION_SECRET = shared_store.get('session_secret')
+SESSION_SECRET = SESSION_SECRET or secrets.token_hex(32)
+
+w3 = make_web3()
+batcher = CallBatcher(w3, os.getenv('MULTICALL_ADDRESS', MULTICALL3_ADDRESS))
 
 # Contract addresses (will be set after deployment)
 CONTRACT_ADDRESSES = {
@@ -60,6 +119,16 @@ TXSPK_TOKEN_ABI = [
         "stateMutability": "view",
         "type": "function"
     },
+    {
+        "inputs": [
+            {"internalType": "address", "name": "owner", "type": "address"},
+            {"internalType": "address", "name": "spender", "type": "address"}
+        ],
+        "name": "allowance",
+        "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
     {
         "inputs": [{"internalType": "address", "name": "user", "type": "address"}],
         "name": "getUserProfile",
@@ -73,9 +142,50 @@ TXSPK_TOKEN_ABI = [
         "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
         "stateMutability": "view",
         "type": "function"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "address", "name": "from", "type": "address"},
+            {"indexed": True, "internalType": "address", "name": "to", "type": "address"},
+            {"indexed": False, "internalType": "uint256", "name": "value", "type": "uint256"}
+        ],
+        "name": "Transfer",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "address", "name": "from", "type": "address"},
+            {"indexed": False, "internalType": "uint256", "name": "amount", "type": "uint256"}
+        ],
+        "name": "TokensBurned",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "address", "name": "user", "type": "address"},
+            {"indexed": False, "internalType": "string", "name": "profile", "type": "string"}
+        ],
+        "name": "ProfileUpdated",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "address", "name": "user", "type": "address"},
+            {"indexed": False, "internalType": "uint256", "name": "price", "type": "uint256"}
+        ],
+        "name": "InboxPriceSet",
+        "type": "event"
     }
 ]
 
+TOKEN_EVENTS = ['Transfer', 'TokensBurned', 'ProfileUpdated', 'InboxPriceSet']
+HOLDER_EVENTS = ['Transfer', 'TokensBurned']
+PRICE_EVENTS = ['InboxPriceSet', 'ProfileUpdated']
+
 MESSAGING_ABI = [
     {
         "inputs": [{"internalType": "uint256", "name": "messageId", "type": "uint256"}],
@@ -102,6 +212,33 @@ MESSAGING_ABI = [
         "stateMutability": "view",
         "type": "function"
     },
+    {
+        "inputs": [{"internalType": "address", "name": "user", "type": "address"}],
+        "name": "getUserSentMessages",
+        "outputs": [{"internalType": "uint256[]", "name": "", "type": "uint256[]"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {"internalType": "address", "name": "", "type": "address"},
+            {"internalType": "uint256", "name": "", "type": "uint256"}
+        ],
+        "name": "userInbox",
+        "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "inputs": [
+            {"internalType": "address", "name": "", "type": "address"},
+            {"internalType": "uint256", "name": "", "type": "uint256"}
+        ],
+        "name": "userSentMessages",
+        "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
+        "stateMutability": "view",
+        "type": "function"
+    },
     {
         "inputs": [{"internalType": "address", "name": "user", "type": "address"}],
         "name": "getLeaderboardData",
@@ -114,9 +251,60 @@ MESSAGING_ABI = [
         ],
         "stateMutability": "view",
         "type": "function"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "uint256", "name": "messageId", "type": "uint256"},
+            {"indexed": True, "internalType": "address", "name": "sender", "type": "address"},
+            {"indexed": True, "internalType": "address", "name": "recipient", "type": "address"},
+            {"indexed": False, "internalType": "uint256", "name": "amount", "type": "uint256"},
+            {"indexed": False, "internalType": "string", "name": "messageType", "type": "string"}
+        ],
+        "name": "MessageSent",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "uint256", "name": "messageId", "type": "uint256"},
+            {"indexed": True, "internalType": "address", "name": "recipient", "type": "address"}
+        ],
+        "name": "MessageAccepted",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "uint256", "name": "messageId", "type": "uint256"},
+            {"indexed": True, "internalType": "address", "name": "recipient", "type": "address"}
+        ],
+        "name": "MessageRejected",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "uint256", "name": "messageId", "type": "uint256"},
+            {"indexed": True, "internalType": "address", "name": "sender", "type": "address"},
+            {"indexed": False, "internalType": "uint256", "name": "amount", "type": "uint256"}
+        ],
+        "name": "MessageRefunded",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "address", "name": "user", "type": "address"},
+            {"indexed": False, "internalType": "uint256", "name": "amount", "type": "uint256"}
+        ],
+        "name": "EarningsWithdrawn",
+        "type": "event"
     }
 ]
 
+MESSAGING_EVENTS = ['MessageSent', 'MessageAccepted', 'MessageRejected', 'MessageRefunded', 'EarningsWithdrawn']
+
 PRESALE_ABI = [
     {
         "inputs": [],
@@ -144,78 +332,753 @@ PRESALE_ABI = [
         ],
         "stateMutability": "view",
         "type": "function"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": True, "internalType": "address", "name": "buyer", "type": "address"},
+            {"indexed": False, "internalType": "uint256", "name": "ethAmount", "type": "uint256"},
+            {"indexed": False, "internalType": "uint256", "name": "tokenAmount", "type": "uint256"},
+            {"indexed": False, "internalType": "uint256", "name": "phase", "type": "uint256"}
+        ],
+        "name": "TokensPurchased",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [
+            {"indexed": False, "internalType": "uint256", "name": "phase", "type": "uint256"},
+            {"indexed": False, "internalType": "uint256", "name": "price", "type": "uint256"},
+            {"indexed": False, "internalType": "uint256", "name": "maxTokens", "type": "uint256"}
+        ],
+        "name": "PresalePhaseStarted",
+        "type": "event"
+    },
+    {
+        "anonymous": False,
+        "inputs": [],
+        "name": "PresaleEnded",
+        "type": "event"
     }
 ]
 
-# In-memory cache for performance
-cache = {
-    'token_stats': {},
-    'presale_stats': {},
-    'leaderboard': {},
-    'last_update': 0
-}
+PRESALE_EVENTS = ['TokensPurchased', 'PresalePhaseStarted', 'PresaleEnded']
+
+# In-memory cache for performance, written through to the shared store when there is one
+cache = TTLCache(max_bytes=CACHE_MAX_BYTES, shared=shared_store)
+
+# Cache TTLs in seconds. Entries touched by contract events are invalidated by
+# the block watcher, so these only bound staleness if the watcher stalls.
+STATS_TTL = 3600
+ACCOUNT_TTL = 3600
+# Messages move to Read in markAsRead without emitting an event
+MESSAGE_TTL = 30
+
+# Message bodies never change, so they are kept on disk permanently
+message_store = MessageStore(MESSAGE_DB_PATH, status_ttl=MESSAGE_TTL)
+
+# IPFS content referenced by messages, fetched ahead of the clients that will ask for it
+content_store = ContentStore(
+    CONTENT_CACHE_DIR, make_gateway(IPFS_GATEWAY),
+    max_bytes=CONTENT_CACHE_MAX_BYTES, max_object_bytes=CONTENT_MAX_OBJECT_BYTES
+)
+# CIDs name their content, so a response for one never changes
+CONTENT_MAX_AGE = 365 * 24 * 3600
 
 # Helper functions
 def wei_to_ether(wei_amount):
-    return w3.fromWei(wei_amount, 'ether')
+    return w3.from_wei(wei_amount, 'ether')
 
 def ether_to_wei(ether_amount):
-    return w3.toWei(ether_amount, 'ether')
+    return w3.to_wei(ether_amount, 'ether')
 
-def get_contract_instance(address, abi):
-    return w3.eth.contract(address=address, abi=abi)
+# Bindings and call codecs for the configured contracts, rebuilt only by POST /api/contracts
+contracts = ContractRegistry(w3, {
+    'txspk_token': TXSPK_TOKEN_ABI,
+    'messaging': MESSAGING_ABI,
+    'presale': PRESALE_ABI
+})
+contracts.update(CONTRACT_ADDRESSES)
 
-def update_cache():
-    """Update cache with latest blockchain data"""
-    global cache
-    try:
-        current_time = time.time()
-        
-        # Only update every 30 seconds to avoid rate limiting
-        if current_time - cache['last_update'] < 30:
-            return
-            
-        if CONTRACT_ADDRESSES['txspk_token']:
-            token_contract = get_contract_instance(CONTRACT_ADDRESSES['txspk_token'], TXSPK_TOKEN_ABI)
-            cache['token_stats'] = {
-                'total_supply': token_contract.functions.totalSupply().call(),
-                'name': token_contract.functions.name().call(),
-                'symbol': token_contract.functions.symbol().call()
+def format_presale_stats(stats, phase_info):
+    return {
+        'total_eth_raised': wei_to_ether(stats.total_eth_raised),
+        'total_tokens_sold': stats.total_tokens_sold,
+        'participant_count': stats.participant_count,
+        'current_phase': stats.current_phase,
+        'presale_active': stats.presale_active,
+        'phase_price': wei_to_ether(phase_info.price),
+        'phase_start': phase_info.start_time,
+        'phase_end': phase_info.end_time,
+        'phase_max_tokens': phase_info.max_tokens,
+        'phase_sold_tokens': phase_info.sold_tokens,
+        'phase_active': phase_info.active
+    }
+
+def format_profile(address, profile, inbox_price, balance):
+    return {
+        'address': address,
+        'display_name': profile if profile else address[:10] + '...',
+        'inbox_price': inbox_price,
+        'balance': balance,
+        'balance_formatted': w3.from_wei(balance, 'ether') if balance is not None else None
+    }
+
+def format_message(msg_id, message):
+    return {
+        'id': msg_id,
+        'sender': message.sender,
+        'recipient': message.recipient,
+        'subject': message.subject,
+        'content': message.content,
+        'ipfsHash': message.ipfs_hash,
+        'amount': message.amount,
+        'timestamp': message.timestamp,
+        'status': message.status,
+        'messageType': message.message_type,
+        'encrypted': message.encrypted
+    }
+
+# Signature recovery runs in worker processes, memoized per (message, signature)
+signature_verifier = SignatureVerifier(workers=AUTH_WORKERS, cache_size=AUTH_CACHE_SIZE)
+
+def recover_signer(message, signature):
+    """Recover the address that signed an authentication message"""
+    return signature_verifier.recover(message, signature)
+
+# Login nonces and session tokens
+nonce_store = SharedNonceStore(shared_store, ttl=AUTH_NONCE_TTL) if shared_store else NonceStore(ttl=AUTH_NONCE_TTL)
+session_tokens = SessionTokens(SESSION_SECRET, ttl=SESSION_TTL)
+
+def complete_login(address, recovered_address):
+    """Check a recovered signer against the claimed address and issue a session token"""
+    if recovered_address.lower() != address.lower():
+        return None
+    token, expires_at = session_tokens.issue(address)
+    return {'token': token, 'expires_at': expires_at}
+
+def session_address(authorization):
+    """Address of a valid `Authorization: Bearer <token>` header, else None"""
+    if not authorization or not authorization.startswith('Bearer '):
+        return None
+    return session_tokens.verify(authorization[len('Bearer '):])
+
+def require_session(view):
+    """Reject requests without a valid session token; sets g.session_address"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        address = session_address(request.headers.get('Authorization'))
+        if not address:
+            return jsonify({'error': 'Authentication required'}), 401
+        g.session_address = address
+        return view(*args, **kwargs)
+    return wrapper
+
+# Local event index
+index_store = IndexStore(INDEX_DB_PATH)
+message_indexer = None
+leaderboard_engine = None
+presale_indexer = None
+presale_analytics = None
+PRESALE_BUCKET = int(os.getenv('PRESALE_BUCKET', '60'))
+token_indexer = None
+holder_ledger = None
+price_indexer = None
+price_book = None
+HOLDER_SNAPSHOT_PATH = os.getenv('HOLDER_SNAPSHOT_PATH', 'txspeak_holders.json')
+HOLDER_SNAPSHOT_INTERVAL = int(os.getenv('HOLDER_SNAPSHOT_INTERVAL', '300'))
+
+def replace_indexer(current, key, event_names, source=None):
+    """Return a new, unstarted indexer for the contract at key, or None if current already follows it.
+
+    ``source`` names the index (default: key), so one contract can have several with different events.
+    Workers that are not the refresher get an IndexFollower on the refresher's index instead.
+    """
+    binding = contracts.get(key)
+    if not binding:
+        return None
+    name = f"{source or key}:{binding.address.lower()}"
+    indexer_class = EventIndexer if is_refresher() else IndexFollower
+    if current and current.name == name and isinstance(current, indexer_class):
+        return None
+    if current:
+        current.stop()
+    if indexer_class is IndexFollower:
+        return IndexFollower(index_store, name, block_watcher, start_block=INDEXER_START_BLOCK)
+    return EventIndexer(
+        w3, index_store, name, binding.contract, event_names,
+        start_block=INDEXER_START_BLOCK, reorg_depth=INDEXER_REORG_DEPTH
+    )
+
+def ensure_indexer():
+    """Start (or restart) the indexers for the configured contract addresses"""
+    global message_indexer, leaderboard_engine, presale_indexer, presale_analytics, token_indexer, holder_ledger
+    global price_indexer, price_book
+    indexer = replace_indexer(message_indexer, 'messaging', MESSAGING_EVENTS)
+    if indexer:
+        message_indexer = indexer
+        leaderboard_engine = LeaderboardEngine(index_store, indexer.name)
+        indexer.subscribe(leaderboard_engine)
+        if is_refresher():
+            # Store every message body as it is indexed, so search covers unopened messages too
+            backfill = MessageBackfill(message_store, index_store, fetch_messages)
+            indexer.subscribe(backfill)
+            threading.Thread(target=backfill.catch_up, daemon=True).start()
+        indexer.start()
+
+    indexer = replace_indexer(presale_indexer, 'presale', PRESALE_EVENTS)
+    if indexer:
+        presale_indexer = indexer
+        presale_analytics = PresaleAnalytics(index_store, indexer.name, bucket=PRESALE_BUCKET)
+        indexer.subscribe(presale_analytics)
+        indexer.start()
+
+    indexer = replace_indexer(token_indexer, 'txspk_token', HOLDER_EVENTS)
+    if indexer:
+        token_indexer = indexer
+        # Only the refresher writes snapshots; followers replay the index
+        snapshot_path = HOLDER_SNAPSHOT_PATH if is_refresher() else None
+        holder_ledger = HolderLedger(index_store, indexer.name, snapshot_path, HOLDER_SNAPSHOT_INTERVAL)
+        indexer.subscribe(holder_ledger)
+        indexer.start()
+
+    # Its own index, so existing token indexes need not be rebuilt to pick up these events
+    indexer = replace_indexer(price_indexer, 'txspk_token', PRICE_EVENTS, source='inbox_prices')
+    if indexer:
+        price_indexer = indexer
+        price_book = InboxPriceBook(index_store, indexer.name)
+        indexer.subscribe(price_book)
+        indexer.start()
+
+def caught_up(indexer):
+    """Whether an indexer has reached the block the watcher last dispatched"""
+    if not indexer or not indexer.synced:
+        return False
+    return indexer.head is not None and block_watcher.dispatched_block is not None and \
+        indexer.head >= block_watcher.dispatched_block
+
+def local_balances(addresses):
+    """Balances from the holder ledger, or None unless its indexer has reached the watched head"""
+    indexer, ledger = token_indexer, holder_ledger
+    if not ledger or not caught_up(indexer):
+        return None
+    return ledger.balances_of(addresses)
+
+def local_prices(addresses):
+    """{address: (inbox price, profile)} from the price book, or None unless its indexer has reached the watched head"""
+    indexer, book = price_indexer, price_book
+    if not book or not caught_up(indexer):
+        return None
+    return book.lookup(addresses)
+
+def load_stats(keys, block_identifier='latest'):
+    """Cache loader for the global token and presale stats"""
+    values = {}
+    if 'token_stats' in keys:
+        values['token_stats'] = {}
+        token = contracts.get('txspk_token')
+        if token:
+            total_supply, name, symbol = batcher.call([
+                token.totalSupply(),
+                token.name(),
+                token.symbol()
+            ], block_identifier)
+            values['token_stats'] = {
+                'total_supply': total_supply,
+                'name': name,
+                'symbol': symbol
             }
-        
-        if CONTRACT_ADDRESSES['presale']:
-            presale_contract = get_contract_instance(CONTRACT_ADDRESSES['presale'], PRESALE_ABI)
-            stats = presale_contract.functions.getPresaleStats().call()
-            phase_info = presale_contract.functions.getCurrentPhaseInfo().call()
+    
+    if 'presale_stats' in keys:
+        values['presale_stats'] = {}
+        presale = contracts.get('presale')
+        if presale:
+            stats, phase_info = batcher.call([
+                presale.getPresaleStats(),
+                presale.getCurrentPhaseInfo()
+            ], block_identifier)
             
-            cache['presale_stats'] = {
-                'total_eth_raised': wei_to_ether(stats[0]),
-                'total_tokens_sold': stats[1],
-                'participant_count': stats[2],
-                'current_phase': stats[3],
-                'presale_active': stats[4],
-                'phase_price': wei_to_ether(phase_info[0]),
-                'phase_start': phase_info[1],
-                'phase_end': phase_info[2],
-                'phase_max_tokens': phase_info[3],
-                'phase_sold_tokens': phase_info[4],
-                'phase_active': phase_info[5]
-            }
+            values['presale_stats'] = format_presale_stats(stats, phase_info)
+    return values
+
+ACCOUNT_READS = {
+    'balance': 'balanceOf',
+    'profile': 'getUserProfile',
+    'inbox_price': 'getUserInboxPrice'
+}
+
+def load_account_reads(keys, block_identifier='latest'):
+    """Cache loader for per-address token reads, keyed by (kind, address)"""
+    token = contracts['txspk_token']
+    results = batcher.call([
+        getattr(token, ACCOUNT_READS[kind])(Web3.to_checksum_address(address))
+        for kind, address in keys
+    ], block_identifier)
+    return dict(zip(keys, results))
+
+def prefetch_content(messages):
+    """Start downloading the IPFS content of messages in the background"""
+    content_store.prefetch({parse_cid(message.ipfs_hash) for message in messages if message is not None} - {None})
+
+def fetch_messages(message_ids):
+    """Message records read from the chain in one batched call, keyed by ID"""
+    messaging = contracts['messaging']
+    messages = dict(zip(message_ids, batcher.call([messaging.getMessage(msg_id) for msg_id in message_ids])))
+    prefetch_content(messages.values())
+    return messages
+
+def load_messages(keys):
+    """Cache loader for Message records, keyed by ('message', id)"""
+    message_ids = [msg_id for _, msg_id in keys]
+    found, missing = message_store.lookup(message_ids)
+    if missing:
+        fetched = fetch_messages(missing)
+        message_store.put(fetched)
+        found.update(fetched)
+    return {('message', msg_id): found.get(msg_id) for msg_id in message_ids}
+
+# Pinned-block reads
+#
+# The block watcher invalidates cache entries for every event it dispatches,
+# so a cached value loaded at block B still holds at any later dispatched
+# block. Each request resolves one block N up front and loads its misses at
+# N, so all values in one response describe the same chain state, and whole
+# responses can be cached under (path, args, N).
+RESPONSE_TTL = int(os.getenv('RESPONSE_TTL', '60'))
+
+def current_block():
+    """Block to pin a request's reads to: the newest block the watcher has fully dispatched"""
+    block = block_watcher.dispatched_block
+    return block if block is not None else w3.eth.block_number
+
+def pinned(loader, block):
+    """Bind a cache loader to block; if the watcher has moved past block meanwhile the results
+    are returned but not cached, since its invalidations may have run before this load started"""
+    def load(keys):
+        values = loader(keys, block)
+        # last_block advances before the new block's invalidations are dispatched
+        seen = block_watcher.last_block
+        if seen is not None and seen > block:
+            for key in keys:
+                cache.invalidate(key)
+        return values
+    # Fences the shared cache write, see TTLCache
+    load.block = block
+    return load
+
+def response_etag(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+def pinned_response(response_class, body, etag, block, if_none_match):
+    """JSON response with ETag and X-Block-Number; 304 when the client already has this body"""
+    if if_none_match.contains(etag):
+        response = response_class('', status=304)
+    else:
+        response = response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['X-Block-Number'] = str(block)
+    response.cache_control.no_cache = True
+    return response
+
+def block_cached(view):
+    """Pin a GET view to one block (as g.block) and cache its 200 responses under (path, args, block)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.block = current_block()
+        key = ('response', request.path, tuple(sorted(request.args.items(multi=True))), g.block)
+        rendered = {}
         
-        cache['last_update'] = current_time
-        print(f"Cache updated at {datetime.now()}")
+        def render(keys):
+            rendered['response'] = response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return {}
+            body = response.get_data()
+            return {key: (body, response_etag(body))}
         
+        # render needs this request's context, so expired responses are re-rendered, never refreshed in the background
+        cached = cache.get(key, render, RESPONSE_TTL, stale_ttl=0)
+        if cached is None:
+            return rendered.get('response') or view(*args, **kwargs)
+        body, etag = cached
+        return pinned_response(Response, body, etag, g.block, request.if_none_match)
+    return wrapper
+
+def parse_address_list(data):
+    """Deduplicated, lowercased addresses from an {"addresses": [...]} body; returns (addresses, error)"""
+    addresses = (data or {}).get('addresses')
+    if not isinstance(addresses, list) or not addresses:
+        return None, 'Missing addresses'
+    if len(addresses) > BULK_ADDRESS_LIMIT:
+        return None, f'At most {BULK_ADDRESS_LIMIT} addresses per request'
+    invalid = [str(address) for address in addresses if not isinstance(address, str) or not Web3.is_address(address)]
+    if invalid:
+        return None, f"Invalid addresses: {', '.join(invalid[:10])}"
+    return list(dict.fromkeys(address.lower() for address in addresses)), None
+
+def local_account_reads(addresses, kinds):
+    """{(kind, address): value} for whichever kinds the local indexes can answer at the watched head"""
+    local = {}
+    balances = local_balances(addresses) if 'balance' in kinds else None
+    if balances is not None:
+        local.update({('balance', address): balance for address, balance in balances.items()})
+    prices = local_prices(addresses) if 'profile' in kinds or 'inbox_price' in kinds else None
+    if prices is not None:
+        for address, (inbox_price, profile) in prices.items():
+            if 'inbox_price' in kinds:
+                local[('inbox_price', address)] = inbox_price
+            if 'profile' in kinds:
+                local[('profile', address)] = profile
+    return local
+
+def bulk_account_reads(addresses, kinds, block):
+    """{(kind, address): value} for lowercased addresses; cache misses share one batched read at block"""
+    local = local_account_reads(addresses, kinds)
+    keys = [(kind, address) for address in addresses for kind in kinds if (kind, address) not in local]
+    reads = cache.get_many(keys, pinned(load_account_reads, block), ACCOUNT_TTL)
+    reads.update(local)
+    return reads
+
+def format_balance(balance):
+    return {
+        'balance': balance,
+        'balance_formatted': w3.from_wei(balance, 'ether') if balance is not None else None
+    }
+
+def parse_quote_request(data):
+    """(sender, recipients, offered amount in wei, error) from {"sender", "recipients", "amount"}; addresses lowercased"""
+    data = data or {}
+    sender = data.get('sender')
+    if not isinstance(sender, str) or not Web3.is_address(sender):
+        return None, None, None, 'Invalid sender'
+    recipients, error = parse_address_list({'addresses': data.get('recipients')})
+    if error:
+        return None, None, None, error.replace('addresses', 'recipients')
+    amount = data.get('amount')
+    try:
+        amount = ether_to_wei(amount) if amount not in (None, '') else 0
+    except (TypeError, ValueError, ArithmeticError):
+        return None, None, None, 'Invalid amount'
+    if amount < 0:
+        return None, None, None, 'Invalid amount'
+    return sender.lower(), recipients, amount, None
+
+def build_quote(sender, recipients, amount, block):
+    """What messaging each recipient costs sender and whether sender can pay it; returns (quote, error).
+
+    sendMessage needs amount > 0 and at least the recipient's inbox price, so
+    each cost is the larger of the offer, the price and 1 wei. It pays with
+    transferFrom, so the sender's allowance to the messaging contract has to
+    cover the total as well as the balance. The allowance is read at block
+    on every quote; everything else comes from the price book and holder
+    ledger once they have caught up. error is set when a chain read failed.
+    """
+    reads = bulk_account_reads(recipients, ('profile', 'inbox_price'), block)
+    reads.update(bulk_account_reads([sender], ('balance',), block))
+    token = contracts['txspk_token']
+    allowance = batcher.call([
+        token.allowance(Web3.to_checksum_address(sender), contracts['messaging'].address)
+    ], block)[0]
+    balance = reads[('balance', sender)]
+    unknown = [address for address in recipients if reads[('inbox_price', address)] is None]
+    if balance is None or allowance is None or unknown:
+        return None, 'Could not read ' + (
+            f"the inbox price of {', '.join(unknown[:10])}" if unknown else "the sender's balance or allowance"
+        )
+
+    quotes = []
+    total = 0
+    for address in recipients:
+        checksum_address = Web3.to_checksum_address(address)
+        inbox_price = reads[('inbox_price', address)]
+        cost = max(amount, inbox_price, 1)
+        total += cost
+        quotes.append({
+            'address': checksum_address,
+            'display_name': reads[('profile', address)] or checksum_address[:10] + '...',
+            'inbox_price': inbox_price,
+            'inbox_price_formatted': wei_to_ether(inbox_price),
+            'cost': cost,
+            'cost_formatted': wei_to_ether(cost)
+        })
+    shortfall = max(total - min(balance, allowance), 0)
+    return {
+        'sender': Web3.to_checksum_address(sender),
+        'balance': balance,
+        'balance_formatted': wei_to_ether(balance),
+        'allowance': allowance,
+        'allowance_formatted': wei_to_ether(allowance),
+        'total': total,
+        'total_formatted': wei_to_ether(total),
+        'affordable': shortfall == 0,
+        'needs_approval': allowance < total,
+        'shortfall': shortfall,
+        'shortfall_formatted': wei_to_ether(shortfall),
+        'recipients': quotes,
+        'source': 'index' if caught_up(price_indexer) else 'chain'
+    }, None
+
+# Per-user message ID lists, used until the event index has caught up
+ID_LIST_READS = {
+    'inbox': ('getUserInbox', 'userInbox'),
+    'sent': ('getUserSentMessages', 'userSentMessages')
+}
+
+def fetch_id_list(kind, address):
+    getter = getattr(contracts['messaging'], ID_LIST_READS[kind][0])
+    return getter(Web3.to_checksum_address(address)).call()
+
+def fetch_id_list_length(kind, address):
+    # getLeaderboardData returns both array lengths without copying the arrays
+    stats = contracts['messaging'].getLeaderboardData(Web3.to_checksum_address(address)).call()
+    return stats.messages_received if kind == 'inbox' else stats.messages_sent
+
+def fetch_id_list_range(kind, address, start, end):
+    getter = getattr(contracts['messaging'], ID_LIST_READS[kind][1])
+    address = Web3.to_checksum_address(address)
+    ids = batcher.call([getter(address, i) for i in range(start, end)])
+    if None in ids:
+        raise ValueError(f"Failed to read {kind} IDs {start}-{end} for {address}")
+    return ids
+
+id_lists = IdListCache(fetch_id_list, fetch_id_list_length, fetch_id_list_range, ttl=ACCOUNT_TTL)
+
+def page_message_ids(kind, address, before=None, limit=10):
+    """A page of a user's inbox or sent message IDs (oldest first) and the next cursor"""
+    if message_indexer and message_indexer.synced:
+        return index_store.message_ids(kind, address, before, limit)
+    return id_lists.page(kind, address, before, limit)
+
+def update_cache(block=None):
+    """Update cache with latest blockchain data"""
+    try:
+        block = current_block() if block is None else block
+        cache.refresh(['token_stats', 'presale_stats'], pinned(load_stats, block), STATS_TTL)
+        print(f"Cache updated at {datetime.now()}")
     except Exception as e:
         print(f"Error updating cache: {e}")
 
+def build_leaderboard(window, limit, offset):
+    earners, total_earners = leaderboard_engine.top(window, 'earned', limit, offset)
+    senders, total_senders = leaderboard_engine.top(window, 'spent', limit, offset)
+    return {
+        'window': window,
+        'limit': limit,
+        'offset': offset,
+        'synced': message_indexer.synced,
+        'total_earners': total_earners,
+        'total_senders': total_senders,
+        'top_earners': [
+            dict(row, messages=row['messages_received']) for row in earners
+        ],
+        'top_senders': [
+            dict(row, messages=row['messages_sent']) for row in senders
+        ]
+    }
+
+# Block-driven cache invalidation
+block_watcher = BlockWatcher(w3, poll_interval=BLOCK_POLL_INTERVAL, ws_url=WS_URL)
+
+def watch_contracts():
+    """Point the block watcher at the configured contract addresses"""
+    watched = {
+        'txspk_token': TOKEN_EVENTS,
+        'messaging': MESSAGING_EVENTS,
+        'presale': PRESALE_EVENTS
+    }
+    for key, event_names in watched.items():
+        binding = contracts.get(key)
+        block_watcher.watch(key, binding.contract if binding else None, event_names)
+
+def invalidate_for_events(block_number, events):
+    """Drop exactly the cache entries the events in a new block touched"""
+    if events is None:
+        cache.clear()
+        id_lists.clear()
+        if is_refresher():
+            update_cache(block_number)
+        return
+    
+    stale_stats = set()
+    for event in events:
+        args = event['args']
+        name = event['event']
+        if name == 'Transfer':
+            for address in (args['from'], args['to']):
+                cache.invalidate(('balance', address.lower()))
+            if int(args['from'], 16) == 0 or int(args['to'], 16) == 0:
+                stale_stats.add('token_stats')
+        elif name == 'TokensBurned':
+            stale_stats.add('token_stats')
+        elif name == 'ProfileUpdated':
+            cache.invalidate(('profile', args['user'].lower()))
+        elif name == 'InboxPriceSet':
+            cache.invalidate(('inbox_price', args['user'].lower()))
+        elif name in ('TokensPurchased', 'PresalePhaseStarted', 'PresaleEnded'):
+            stale_stats.add('presale_stats')
+        elif name == 'MessageSent':
+            id_lists.mark_stale('inbox', args['recipient'])
+            id_lists.mark_stale('sent', args['sender'])
+        elif name in STATUS_EVENTS:
+            message_store.set_status(args['messageId'], STATUS_EVENTS[name])
+            cache.invalidate(('message', args['messageId']))
+    
+    if stale_stats and is_refresher():
+        # Global stats are hot - reload them now rather than on the next request
+        cache.refresh(stale_stats, pinned(load_stats, block_number), STATS_TTL)
+    elif stale_stats:
+        # The refresher reloads them into the shared cache
+        for key in stale_stats:
+            cache.invalidate(key)
+
+block_watcher.subscribe(invalidate_for_events)
+
+# Push updates to streaming clients
+event_hub = EventHub(max_subscribers=STREAM_MAX_CLIENTS, max_queue=STREAM_QUEUE_SIZE)
+
+def push_updates(block_number, events):
+    """Fan the events of a new block out to inbox and presale subscribers"""
+    if events is None:
+        return
+    
+    presale_delta = None
+    for event in events:
+        args = event['args']
+        name = event['event']
+        if name == 'MessageSent':
+            event_hub.publish_to_address(args['recipient'], {
+                'type': 'message',
+                'block': block_number,
+                'data': {
+                    'id': args['messageId'],
+                    'sender': args['sender'],
+                    'recipient': args['recipient'],
+                    'amount': args['amount'],
+                    'messageType': args['messageType']
+                }
+            })
+        elif name in STATUS_EVENTS:
+            update = {
+                'type': 'status',
+                'block': block_number,
+                'data': {'id': args['messageId'], 'status': STATUS_EVENTS[name]}
+            }
+            event_hub.publish_to_address(args['recipient'], update)
+            found, _ = message_store.lookup([args['messageId']])
+            if args['messageId'] in found:
+                event_hub.publish_to_address(found[args['messageId']].sender, update)
+        elif name in PRESALE_EVENTS:
+            if presale_delta is None:
+                presale_delta = {'eth_raised': 0, 'tokens_sold': 0, 'purchases': 0}
+            if name == 'TokensPurchased':
+                presale_delta['eth_raised'] += args['ethAmount']
+                presale_delta['tokens_sold'] += args['tokenAmount']
+                presale_delta['purchases'] += 1
+    
+    if presale_delta is not None and event_hub.has_presale_subscribers():
+        event_hub.publish_presale({
+            'type': 'presale',
+            'block': block_number,
+            'data': {
+                'delta': presale_delta,
+                'stats': cache.get('presale_stats', load_stats, STATS_TTL)
+            }
+        })
+
+block_watcher.subscribe(push_updates)
+
+# Background refresher and worker roles
+#
+# Without shared state this process is the refresher. With it, every worker
+# serves requests but only the one holding the refresher lease watches blocks,
+# refreshes stats and indexes events; the others replay what it relays.
+coordinator = None
+
+def is_refresher():
+    return coordinator is None or coordinator.is_refresher
+
+def apply_contracts(addresses):
+    """Switch this process to a new set of contract addresses"""
+    CONTRACT_ADDRESSES.update(addresses)
+    contracts.update(CONTRACT_ADDRESSES)
+    cache.clear()
+    id_lists.clear()
+    watch_contracts()
+    ensure_indexer()
+
+def set_contract_addresses(addresses):
+    """Apply new contract addresses here and publish them to the other workers"""
+    apply_contracts(addresses)
+    if coordinator:
+        coordinator.publish_config(CONTRACT_ADDRESSES)
+
+def sync_contracts(addresses):
+    # Config published by another worker
+    if addresses != CONTRACT_ADDRESSES:
+        apply_contracts(addresses)
+
+def start_refresher():
+    """Warm the cache, start invalidating it from new blocks and start the event indexers"""
+    update_cache()
+    watch_contracts()
+    block_watcher.start()
+    ensure_indexer()
+
+def restart_worker():
+    # Another worker holds the lease now; exit so the process manager starts a clean follower
+    print("Lost the refresher lease, restarting worker")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+def start_worker():
+    """Start this process's background work; call once per process, after any fork"""
+    # Fork signature workers before any background thread exists
+    signature_verifier.start()
+    if coordinator:
+        coordinator.start()
+    else:
+        start_refresher()
+
+if shared_store:
+    coordinator = WorkerCoordinator(
+        shared_store, block_watcher, cache,
+        on_promote=start_refresher, on_config=sync_contracts, on_demote=restart_worker,
+        lease_ttl=REFRESHER_LEASE_TTL
+    )
+
+def format_sse(update):
+    return f"event: {update['type']}\ndata: {json.dumps(update, default=str)}\n\n"
+
 # Routes
+# Metrics
+def running_indexers():
+    return [indexer for indexer in (message_indexer, presale_indexer, token_indexer, price_indexer) if indexer]
+
+metrics.register_state(cache, block_watcher, running_indexers)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else None
+        metrics.observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
         'network': NETWORK,
         'connected': w3.is_connected(),
-        'block_number': w3.eth.block_number if w3.is_connected() else None
+        'block_number': w3.eth.block_number if w3.is_connected() else None,
+        'rpc_endpoints': w3.provider.status()
     })
 
 @app.route('/api/contracts', methods=['GET'])
@@ -229,147 +1092,461 @@ def get_contracts():
 def set_contracts():
     """Set contract addresses after deployment"""
     data = request.get_json()
-    CONTRACT_ADDRESSES.update(data)
+    set_contract_addresses(data)
     return jsonify({'message': 'Contract addresses updated', 'contracts': CONTRACT_ADDRESSES})
 
 @app.route('/api/token/stats', methods=['GET'])
+@block_cached
 def get_token_stats():
-    update_cache()
-    return jsonify({
-        'success': True,
-        'data': cache['token_stats']
-    })
+    try:
+        return jsonify({
+            'success': True,
+            'data': cache.get('token_stats', pinned(load_stats, g.block), STATS_TTL),
+            'block_number': g.block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/token/balance/<address>', methods=['GET'])
+@block_cached
 def get_token_balance(address):
     try:
         if not CONTRACT_ADDRESSES['txspk_token']:
             return jsonify({'error': 'Token contract not deployed yet'}), 400
             
-        if not w3.isAddress(address):
+        if not w3.is_address(address):
             return jsonify({'error': 'Invalid address'}), 400
             
-        token_contract = get_contract_instance(CONTRACT_ADDRESSES['txspk_token'], TXSPK_TOKEN_ABI)
-        balance = token_contract.functions.balanceOf(address).call()
+        address = address.lower()
+        balance = bulk_account_reads([address], ('balance',), g.block)[('balance', address)]
         
         return jsonify({
             'success': True,
             'balance': balance,
-            'balance_formatted': w3.fromWei(balance, 'ether')
+            'balance_formatted': w3.from_wei(balance, 'ether'),
+            'block_number': g.block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/token/balances', methods=['POST'])
+def get_token_balances():
+    """Balances for many addresses at once: {"addresses": [...]}"""
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token']:
+            return jsonify({'error': 'Token contract not deployed yet'}), 400
+        
+        addresses, error = parse_address_list(request.get_json(silent=True))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        block = current_block()
+        reads = bulk_account_reads(addresses, ('balance',), block)
+        return jsonify({
+            'success': True,
+            'balances': {address: format_balance(reads[('balance', address)]) for address in addresses},
+            'block_number': block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/token/holders', methods=['GET'])
+def get_token_holders():
+    """Top holders and holder count from the local holder ledger"""
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token']:
+            return jsonify({'error': 'Token contract not deployed yet'}), 400
+        if not holder_ledger:
+            return jsonify({'error': 'Holder index not available yet'}), 503
+        
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        rows, total = holder_ledger.top(limit, offset)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'holders': [dict(row, balance_formatted=w3.from_wei(row['balance'], 'ether')) for row in rows],
+                'holder_count': total,
+                'limit': limit,
+                'offset': offset,
+                'synced': token_indexer.synced
+            }
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def reconcile_supply():
+    """Compare the ledger's minted - burned with totalSupply() at the indexer checkpoint"""
+    block = token_indexer.checkpoint
+    chain_supply = contracts['txspk_token'].totalSupply().call(block_identifier=block)
+    supply = holder_ledger.supply()
+    return dict(
+        supply,
+        checkpoint=block,
+        chain_supply=chain_supply,
+        matches=supply['supply'] == chain_supply == supply['balances_total']
+    )
+
+@app.route('/api/token/holders/reconcile', methods=['GET'])
+def get_holder_reconciliation():
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token']:
+            return jsonify({'error': 'Token contract not deployed yet'}), 400
+        if not holder_ledger:
+            return jsonify({'error': 'Holder index not available yet'}), 503
+        
+        return jsonify({
+            'success': True,
+            'data': reconcile_supply()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/user/profile/<address>', methods=['GET'])
+@block_cached
 def get_user_profile(address):
     try:
         if not CONTRACT_ADDRESSES['txspk_token']:
             return jsonify({'error': 'Token contract not deployed yet'}), 400
             
-        if not w3.isAddress(address):
+        if not w3.is_address(address):
             return jsonify({'error': 'Invalid address'}), 400
             
-        token_contract = get_contract_instance(CONTRACT_ADDRESSES['txspk_token'], TXSPK_TOKEN_ABI)
-        profile = token_contract.functions.getUserProfile(address).call()
-        inbox_price = token_contract.functions.getUserInboxPrice(address).call()
-        balance = token_contract.functions.balanceOf(address).call()
+        reads = bulk_account_reads([address.lower()], ('profile', 'inbox_price', 'balance'), g.block)
+        profile, inbox_price, balance = [reads[(kind, address.lower())] for kind in ('profile', 'inbox_price', 'balance')]
         
         return jsonify({
             'success': True,
-            'profile': {
-                'address': address,
-                'display_name': profile if profile else address[:10] + '...',
-                'inbox_price': inbox_price,
-                'balance': balance,
-                'balance_formatted': w3.fromWei(balance, 'ether')
-            }
+            'profile': format_profile(address, profile, inbox_price, balance),
+            'block_number': g.block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/user/profiles', methods=['POST'])
+def get_user_profiles():
+    """Profiles for many addresses at once: {"addresses": [...]}"""
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token']:
+            return jsonify({'error': 'Token contract not deployed yet'}), 400
+        
+        addresses, error = parse_address_list(request.get_json(silent=True))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        block = current_block()
+        reads = bulk_account_reads(addresses, ('profile', 'inbox_price', 'balance'), block)
+        return jsonify({
+            'success': True,
+            'profiles': {
+                address: format_profile(Web3.to_checksum_address(address), reads[('profile', address)],
+                                        reads[('inbox_price', address)], reads[('balance', address)])
+                for address in addresses
+            },
+            'block_number': block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/quote', methods=['GET', 'POST'])
+def get_quote():
+    """Cost of messaging one or many recipients and whether the sender can afford it.
+
+    GET ?sender=&recipients=a,b&amount= or POST {"sender", "recipients": [...], "amount"};
+    amount is the optional offer per message in TXSPK.
+    """
+    try:
+        if not CONTRACT_ADDRESSES['txspk_token'] or not CONTRACT_ADDRESSES['messaging']:
+            return jsonify({'error': 'Contracts not deployed yet'}), 400
+
+        if request.method == 'POST':
+            data = request.get_json(silent=True)
+        else:
+            data = dict(request.args, recipients=[r for r in request.args.get('recipients', '').split(',') if r])
+        sender, recipients, amount, error = parse_quote_request(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        block = current_block()
+        quote, error = build_quote(sender, recipients, amount, block)
+        if error:
+            return jsonify({'error': error}), 503
+        return jsonify({
+            'success': True,
+            'quote': quote,
+            'block_number': block
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/messages/inbox/<address>', methods=['GET'])
 def get_user_inbox(address):
+    return list_messages('inbox', address)
+
+@app.route('/api/messages/sent/<address>', methods=['GET'])
+def get_user_sent_messages(address):
+    return list_messages('sent', address)
+
+def list_messages(kind, address):
+    """Cursor-paginated inbox or sent messages: ?before=<id>&limit=N"""
     try:
         if not CONTRACT_ADDRESSES['messaging']:
             return jsonify({'error': 'Messaging contract not deployed yet'}), 400
             
-        if not w3.isAddress(address):
+        if not w3.is_address(address):
             return jsonify({'error': 'Invalid address'}), 400
-            
-        messaging_contract = get_contract_instance(CONTRACT_ADDRESSES['messaging'], MESSAGING_ABI)
-        inbox_ids = messaging_contract.functions.getUserInbox(address).call()
+        
+        before = request.args.get('before', type=int)
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        page_ids, next_cursor = page_message_ids(kind, address, before, limit)
+        
+        results = cache.get_many([('message', msg_id) for msg_id in page_ids], load_messages, MESSAGE_TTL)
+        prefetch_content(results.values())
         
         messages = []
-        for msg_id in inbox_ids[-10:]:  # Get last 10 messages
-            try:
-                msg_data = messaging_contract.functions.getMessage(msg_id).call()
-                messages.append({
-                    'id': msg_id,
-                    'sender': msg_data[0],
-                    'recipient': msg_data[1],
-                    'subject': msg_data[2],
-                    'content': msg_data[3],
-                    'ipfsHash': msg_data[4],
-                    'amount': msg_data[5],
-                    'timestamp': msg_data[6],
-                    'status': msg_data[7],
-                    'messageType': msg_data[8],
-                    'encrypted': msg_data[9]
-                })
-            except Exception as e:
-                print(f"Error fetching message {msg_id}: {e}")
+        for msg_id in page_ids:
+            message = results[('message', msg_id)]
+            if message is None:
+                print(f"Error fetching message {msg_id}")
                 continue
+            messages.append(format_message(msg_id, message))
         
         return jsonify({
             'success': True,
-            'messages': messages
+            'messages': messages,
+            'next_cursor': next_cursor
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def content_headers(response):
+    """Long-lived caching for a CID's bytes; sandboxed so stored HTML can't script this origin"""
+    response.headers['Cache-Control'] = f'public, max-age={CONTENT_MAX_AGE}, immutable'
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = 'sandbox'
+    return response
+
+def find_content(cid):
+    """(path, content type, size) for a CID some message references; returns (entry, error, status)"""
+    if parse_cid(cid) != cid:
+        return None, 'Invalid CID', 400
+    entry = content_store.lookup(cid)
+    if entry is None:
+        # Only fetch what messages point at, so this is not an open gateway proxy
+        if not message_store.references(cid):
+            return None, 'Content not found', 404
+        entry = content_store.fetch(cid, timeout=CONTENT_FETCH_TIMEOUT)
+        if entry is None:
+            return None, 'Content unavailable from IPFS', 504
+    return entry, None, 200
+
+@app.route('/api/content/<cid>', methods=['GET'])
+def get_content(cid):
+    """Bytes of a message's IPFS attachment from the local cache; supports Range and If-None-Match"""
+    entry, error, status = find_content(cid)
+    if error:
+        return jsonify({'error': error}), status
+    path, content_type, _ = entry
+    # conditional handles Range, If-Range and If-None-Match against the CID;
+    # whole files go out through the server's wsgi.file_wrapper (sendfile under gunicorn)
+    response = send_file(path, mimetype=content_type or 'application/octet-stream', conditional=True, etag=cid)
+    return content_headers(response)
+
+MESSAGE_STATUSES = {
+    'pending': STATUS_PENDING,
+    'accepted': STATUS_ACCEPTED,
+    'rejected': STATUS_REJECTED,
+    'refunded': STATUS_REFUNDED,
+    'read': STATUS_READ
+}
+
+def parse_search_filters(args):
+    """MessageStore.search keyword arguments from the query string; returns (filters, error)"""
+    filters = {
+        'text': args.get('q'),
+        'message_type': args.get('type'),
+        'since': args.get('from', type=int),
+        'until': args.get('to', type=int),
+        'before': args.get('before', type=int),
+        'limit': min(max(args.get('limit', 20, type=int), 1), 100)
+    }
+    for name in ('sender', 'recipient'):
+        address = args.get(name)
+        if address is not None:
+            if not w3.is_address(address):
+                return None, f'Invalid {name} address'
+            filters[name] = Web3.to_checksum_address(address)
+    status = args.get('status')
+    if status is not None:
+        if status.lower() not in MESSAGE_STATUSES:
+            return None, f"Invalid status, expected one of: {', '.join(MESSAGE_STATUSES)}"
+        filters['status'] = MESSAGE_STATUSES[status.lower()]
+    for name in ('min_amount', 'max_amount'):
+        amount = args.get(name, type=float)
+        if amount is not None:
+            filters[name] = ether_to_wei(amount)
+    return filters, None
+
+@app.route('/api/messages/search', methods=['GET'])
+def search_messages():
+    """Search stored messages, newest first:
+    ?q=words&sender=&recipient=&type=&status=&min_amount=&max_amount=&from=&to=&before=<id>&limit=N
+
+    Text matches the subject and content of non-encrypted messages. Amounts are in TXSPK,
+    from/to are Unix timestamps. Served from the local message store; never calls the node.
+    """
+    try:
+        if not CONTRACT_ADDRESSES['messaging']:
+            return jsonify({'error': 'Messaging contract not deployed yet'}), 400
+        
+        filters, error = parse_search_filters(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        results, next_cursor = message_store.search(**filters)
+        return jsonify({
+            'success': True,
+            'messages': [format_message(msg_id, message) for msg_id, message in results],
+            'next_cursor': next_cursor
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/presale/stats', methods=['GET'])
+@block_cached
 def get_presale_stats():
-    update_cache()
-    return jsonify({
-        'success': True,
-        'data': cache['presale_stats']
-    })
+    try:
+        return jsonify({
+            'success': True,
+            'data': cache.get('presale_stats', pinned(load_stats, g.block), STATS_TTL),
+            'block_number': g.block
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def format_presale_history(rows):
+    # ETH and token columns are floats; trim the rounding noise from interval differences
+    return [{key: round(value, 6) if isinstance(value, float) else value for key, value in row.items()}
+            for row in rows]
+
+def format_presale_phase(phase):
+    return dict(phase, price=wei_to_ether(phase['price']) if phase['price'] is not None else None,
+                eth_raised=wei_to_ether(phase['eth_raised']))
+
+@app.route('/api/presale/history', methods=['GET'])
+def get_presale_history():
+    """Raised / sold / buyers over time from the local presale index; never calls the node"""
+    try:
+        if not CONTRACT_ADDRESSES['presale']:
+            return jsonify({'error': 'Presale contract not deployed yet'}), 400
+        if not presale_analytics:
+            return jsonify({'error': 'Presale analytics not available yet'}), 503
+        
+        start = request.args.get('from', type=int)
+        end = request.args.get('to', type=int)
+        points = min(max(request.args.get('points', 200, type=int), 1), 1000)
+        rows, step = presale_analytics.history(start, end, points)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'step': step,
+                'points': format_presale_history(rows),
+                'synced': presale_indexer.synced
+            }
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/presale/phases', methods=['GET'])
+def get_presale_phases():
+    """Per-phase raise and fill rate from the local presale index"""
+    try:
+        if not CONTRACT_ADDRESSES['presale']:
+            return jsonify({'error': 'Presale contract not deployed yet'}), 400
+        if not presale_analytics:
+            return jsonify({'error': 'Presale analytics not available yet'}), 503
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'phases': [format_presale_phase(phase) for phase in presale_analytics.phase_stats()],
+                'synced': presale_indexer.synced
+            }
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/leaderboard', methods=['GET'])
 def get_leaderboard():
     try:
         if not CONTRACT_ADDRESSES['messaging']:
             return jsonify({'error': 'Messaging contract not deployed yet'}), 400
-            
-        # Mock leaderboard data for now
-        # In a real implementation, this would aggregate data from all users
-        mock_leaderboard = {
-            'top_earners': [
-                {'address': '0x742d35cc6ba9a8c0c1b0c4e2e0b9b8a2b1b7e8e1', 'earned': 12000, 'messages': 156},
-                {'address': '0x742d35cc6ba9a8c0c1b0c4e2e0b9b8a2b1b7e8e2', 'earned': 8600, 'messages': 98},
-                {'address': '0x742d35cc6ba9a8c0c1b0c4e2e0b9b8a2b1b7e8e3', 'earned': 6800, 'messages': 145}
-            ],
-            'top_senders': [
-                {'address': '0x742d35cc6ba9a8c0c1b0c4e2e0b9b8a2b1b7e8e4', 'spent': 15000, 'messages': 203},
-                {'address': '0x742d35cc6ba9a8c0c1b0c4e2e0b9b8a2b1b7e8e5', 'spent': 11200, 'messages': 89},
-                {'address': '0x742d35cc6ba9a8c0c1b0c4e2e0b9b8a2b1b7e8e6', 'spent': 9800, 'messages': 167}
-            ]
-        }
+        if not leaderboard_engine:
+            return jsonify({'error': 'Leaderboard not available yet'}), 503
+        
+        window = request.args.get('window', 'all')
+        if window not in WINDOWS:
+            return jsonify({'error': f"Invalid window, expected one of: {', '.join(WINDOWS)}"}), 400
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        offset = max(request.args.get('offset', 0, type=int), 0)
         
         return jsonify({
             'success': True,
-            'data': mock_leaderboard
+            'data': build_leaderboard(window, limit, offset)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stream', methods=['GET'])
+def stream_updates():
+    """Server-Sent Events stream: ?address=<address>&topics=inbox,presale"""
+    address = request.args.get('address')
+    topics = set(request.args.get('topics', 'inbox,presale').split(','))
+    
+    if address and not w3.is_address(address):
+        return jsonify({'error': 'Invalid address'}), 400
+    if 'inbox' in topics and not address:
+        return jsonify({'error': 'Address required for inbox updates'}), 400
+    
+    subscription = event_hub.subscribe(address, topics)
+    if subscription is None:
+        return jsonify({'error': 'Too many streaming clients'}), 503
+    
+    def generate():
+        try:
+            yield ': connected\n\n'
+            while True:
+                update = subscription.get(timeout=STREAM_KEEPALIVE)
+                # Comment lines keep proxies from closing an idle stream
+                yield format_sse(update) if update else ': keepalive\n\n'
+        finally:
+            event_hub.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/indexer/status', methods=['GET'])
+def get_indexer_status():
+    return jsonify({
+        'success': True,
+        'indexer': message_indexer.status() if message_indexer else None,
+        'presale_indexer': presale_indexer.status() if presale_indexer else None,
+        'token_indexer': token_indexer.status() if token_indexer else None,
+        'price_indexer': price_indexer.status() if price_indexer else None
+    })
+
 @app.route('/api/auth/nonce/<address>', methods=['GET'])
 def get_auth_nonce(address):
     """Generate nonce for wallet authentication"""
-    if not w3.isAddress(address):
+    if not w3.is_address(address):
         return jsonify({'error': 'Invalid address'}), 400
         
-    nonce = f"Please sign this message to authenticate with TXSPEAK: {int(time.time())}"
+    nonce = nonce_store.issue(address)
     
     return jsonify({
         'success': True,
@@ -389,39 +1566,72 @@ def verify_signature():
         
     try:
         # Recover address from signature
-        message_hash = w3.keccak(text=message)
-        recovered_address = w3.eth.account.recover_message(
-            message_hash, 
-            signature=signature
-        )
+        recovered_address = recover_signer(message, signature)
         
-        if recovered_address.lower() == address.lower():
-            # Generate simple JWT-like token (in production, use proper JWT)
-            token = f"{address}:{int(time.time())}"
-            return jsonify({
-                'success': True,
-                'token': token,
-                'address': address
-            })
-        else:
+        session = complete_login(address, recovered_address)
+        if not session:
             return jsonify({'error': 'Invalid signature'}), 401
+        if not nonce_store.consume(address, message):
+            return jsonify({'error': 'Invalid or expired nonce'}), 401
+        
+        return jsonify({
+            'success': True,
+            'token': session['token'],
+            'expires_at': session['expires_at'],
+            'address': address
+        })
             
     except Exception as e:
         return jsonify({'error': f'Verification failed: {str(e)}'}), 401
 
-# Background cache updater
-def cache_updater():
-    while True:
-        update_cache()
-        time.sleep(60)  # Update every minute
+@app.route('/api/auth/verify/batch', methods=['POST'])
+def verify_signatures_batch():
+    """Verify many signed messages at once: {"items": [{address, message, signature}, ...]}"""
+    data = request.get_json() or {}
+    items = data.get('items')
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Missing items'}), 400
+    if len(items) > AUTH_BATCH_LIMIT:
+        return jsonify({'error': f'At most {AUTH_BATCH_LIMIT} items per batch'}), 400
+    if not all(isinstance(item, dict) and all([item.get('address'), item.get('message'), item.get('signature')])
+               for item in items):
+        return jsonify({'error': 'Missing required fields'}), 400
+    
+    recovered = signature_verifier.recover_many([(item['message'], item['signature']) for item in items])
+    return jsonify({
+        'success': True,
+        'results': [format_verification(item, address, error)
+                    for item, (address, error) in zip(items, recovered)]
+    })
+
+def format_verification(item, recovered_address, error):
+    address = item['address']
+    if error is not None:
+        return {'address': address, 'valid': False, 'error': f'Verification failed: {error}'}
+    session = complete_login(address, recovered_address)
+    if not session:
+        return {'address': address, 'valid': False, 'error': 'Invalid signature'}
+    if not nonce_store.consume(address, item['message']):
+        return {'address': address, 'valid': False, 'error': 'Invalid or expired nonce'}
+    return dict(session, address=address, valid=True)
+
+@app.route('/api/auth/session', methods=['GET'])
+@require_session
+def get_session():
+    """Check a session token without touching signatures or the chain"""
+    return jsonify({
+        'success': True,
+        'address': g.session_address
+    })
 
 if __name__ == '__main__':
     print(f"Starting TXSPEAK Backend on {NETWORK} network")
     print(f"Connected to Web3: {w3.is_connected()}")
     print(f"Latest block: {w3.eth.block_number if w3.is_connected() else 'Not connected'}")
     
-    # Start background cache updater
-    cache_thread = threading.Thread(target=cache_updater, daemon=True)
-    cache_thread.start()
+    # Single-process development server; use gunicorn.conf.py in production
+    start_worker()
     
-    app.run(host='0.0.0.0', port=8001, debug=True)
\ No newline at end of file
+    # The reloader would run a second copy of the background threads
+    app.run(host='0.0.0.0', port=8001, debug=os.getenv('FLASK_DEBUG') == '1', use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,434 @@
+"""
+Shared state for TXSPEAK backend
+Cross-process cache entries, contract config, login nonces, the refresher lease and a relay
+of the refresher's blocks, kept in a local SQLite file or a Redis-compatible server
+"""
+
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL
+);
+CREATE TABLE IF NOT EXISTS relay (
+    block_number INTEGER PRIMARY KEY,
+    previous INTEGER,
+    events BLOB NOT NULL
+);
+"""
+
+
+def _key(key):
+    # Cache keys are strings or tuples of strings and ints, whose repr is stable
+    return repr(key)
+
+
+class SQLiteSharedStore:
+    """Shared state in one SQLite file, for workers on a single host.
+
+    Cache entries hold ``(value, expires)``; writes can be fenced on the
+    relayed chain head so a worker never stores a value read at a block the
+    refresher has already moved past (see ``put_entries``).
+    """
+
+    def __init__(self, path, sweep_interval=60):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+        # Autocommit: transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _write(self):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    # Cache entries
+
+    def get_entries(self, keys):
+        """{key: (value, expires)} for the keys with an unexpired entry"""
+        names = {_key(key): key for key in keys}
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT key, value, expires FROM entries WHERE key IN ({','.join('?' * len(names))}) AND expires > ?",
+                list(names) + [time.time()]
+            ).fetchall()
+        return {names[name]: (pickle.loads(value), expires) for name, value, expires in rows}
+
+    def put_entries(self, entries, fence=None):
+        """Store {key: (value, expires)}; with a fence block, only while the relayed head is at or below it"""
+        with self._write() as conn:
+            if fence is not None:
+                head = self._get_state(conn, 'head')
+                if head is not None and head > fence:
+                    return False
+            conn.executemany(
+                'INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)',
+                [(_key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+                 for key, (value, expires) in entries.items()]
+            )
+            if time.monotonic() - self.last_sweep >= self.sweep_interval:
+                self.last_sweep = time.monotonic()
+                now = time.time()
+                conn.execute('DELETE FROM entries WHERE expires <= ?', (now,))
+                conn.execute('DELETE FROM state WHERE expires <= ?', (now,))
+        return True
+
+    def delete_entries(self, keys):
+        with self._write() as conn:
+            conn.executemany('DELETE FROM entries WHERE key = ?', [(_key(key),) for key in keys])
+
+    def clear_entries(self):
+        with self._write() as conn:
+            conn.execute('DELETE FROM entries')
+
+    # Named values, optionally expiring
+
+    def _get_state(self, conn, name):
+        row = conn.execute('SELECT value, expires FROM state WHERE name = ?', (name,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return pickle.loads(row[0])
+
+    def get(self, name):
+        with self.lock:
+            return self._get_state(self.conn, name)
+
+    def set(self, name, value, ttl=None):
+        expires = time.time() + ttl if ttl is not None else None
+        with self._write() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO state (name, value, expires) VALUES (?, ?, ?)',
+                (name, pickle.dumps(value), expires)
+            )
+
+    def add(self, name, value, ttl=None):
+        """Set name only if it has no unexpired value; True if this call set it"""
+        expires = time.time() + ttl if ttl is not None else None
+        with self._write() as conn:
+            if self._get_state(conn, name) is not None:
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO state (name, value, expires) VALUES (?, ?, ?)',
+                (name, pickle.dumps(value), expires)
+            )
+        return True
+
+    def pop(self, name):
+        """Delete name and return its value, or None if it had none; only one caller gets the value"""
+        with self._write() as conn:
+            value = self._get_state(conn, name)
+            conn.execute('DELETE FROM state WHERE name = ?', (name,))
+        return value
+
+    def acquire_lease(self, name, owner, ttl):
+        """Take or renew a lease; True while owner holds it"""
+        with self._write() as conn:
+            holder = self._get_state(conn, name)
+            if holder is not None and holder != owner:
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO state (name, value, expires) VALUES (?, ?, ?)',
+                (name, pickle.dumps(owner), time.time() + ttl)
+            )
+        return True
+
+    # Block relay
+
+    def head(self):
+        return self.get('head')
+
+    def announce(self, block_number):
+        self.set('head', block_number)
+
+    def append_block(self, block_number, previous, events, keep=1000):
+        with self._write() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO relay (block_number, previous, events) VALUES (?, ?, ?)',
+                (block_number, previous, pickle.dumps(events, pickle.HIGHEST_PROTOCOL))
+            )
+            conn.execute('DELETE FROM relay WHERE block_number <= ?', (block_number - keep,))
+
+    def blocks_after(self, block_number):
+        """[(block, previous, events)] relayed after block_number, oldest first; only the newest for None"""
+        with self.lock:
+            if block_number is None:
+                rows = self.conn.execute(
+                    'SELECT block_number, previous, events FROM relay ORDER BY block_number DESC LIMIT 1'
+                ).fetchall()
+            else:
+                rows = self.conn.execute(
+                    'SELECT block_number, previous, events FROM relay WHERE block_number > ? ORDER BY block_number',
+                    (block_number,)
+                ).fetchall()
+        return [(number, previous, pickle.loads(events)) for number, previous, events in rows]
+
+
+# Compare-and-extend, so a lease is only ever renewed by its holder
+ACQUIRE_LEASE = """
+local holder = redis.call('GET', KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+
+class RedisSharedStore:
+    """SQLiteSharedStore's interface on a Redis-compatible server, for workers on several hosts.
+
+    Only plain commands, MULTI/WATCH and one EVAL are used, so KeyDB,
+    Dragonfly or a local stand-in can take Redis's place.
+    """
+
+    def __init__(self, url, prefix='txspeak:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('A redis:// SHARED_STATE_URL needs the redis package (pip install redis)') from None
+        self.redis = redis.Redis.from_url(url)
+        self.watch_error = redis.WatchError
+        self.prefix = prefix
+        self.acquire_script = self.redis.register_script(ACQUIRE_LEASE)
+
+    def _entry(self, key):
+        return f"{self.prefix}entry:{_key(key)}"
+
+    def _state(self, name):
+        return f"{self.prefix}state:{name}"
+
+    def get_entries(self, keys):
+        keys = list(keys)
+        now = time.time()
+        found = {}
+        for key, raw in zip(keys, self.redis.mget([self._entry(key) for key in keys])):
+            if raw is not None:
+                value, expires = pickle.loads(raw)
+                if expires > now:
+                    found[key] = (value, expires)
+        return found
+
+    def put_entries(self, entries, fence=None):
+        now = time.time()
+        with self.redis.pipeline() as pipe:
+            try:
+                pipe.watch(self._state('head'))
+                if fence is not None:
+                    head = pipe.get(self._state('head'))
+                    if head is not None and pickle.loads(head) > fence:
+                        return False
+                pipe.multi()
+                for key, (value, expires) in entries.items():
+                    pipe.set(self._entry(key), pickle.dumps((value, expires), pickle.HIGHEST_PROTOCOL),
+                             px=max(1, int((expires - now) * 1000)))
+                pipe.execute()
+            except self.watch_error:
+                # The head moved while writing: the values may predate its invalidations
+                return False
+        return True
+
+    def delete_entries(self, keys):
+        keys = [self._entry(key) for key in keys]
+        if keys:
+            self.redis.delete(*keys)
+
+    def clear_entries(self):
+        batch = []
+        for name in self.redis.scan_iter(match=f"{self.prefix}entry:*", count=1000):
+            batch.append(name)
+            if len(batch) >= 1000:
+                self.redis.delete(*batch)
+                batch = []
+        if batch:
+            self.redis.delete(*batch)
+
+    def get(self, name):
+        raw = self.redis.get(self._state(name))
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, name, value, ttl=None):
+        self.redis.set(self._state(name), pickle.dumps(value), px=int(ttl * 1000) if ttl is not None else None)
+
+    def add(self, name, value, ttl=None):
+        px = int(ttl * 1000) if ttl is not None else None
+        return bool(self.redis.set(self._state(name), pickle.dumps(value), px=px, nx=True))
+
+    def pop(self, name):
+        with self.redis.pipeline() as pipe:
+            pipe.get(self._state(name))
+            pipe.delete(self._state(name))
+            raw, _ = pipe.execute()
+        return pickle.loads(raw) if raw is not None else None
+
+    def acquire_lease(self, name, owner, ttl):
+        return bool(self.acquire_script(keys=[self._state(name)], args=[pickle.dumps(owner), int(ttl * 1000)]))
+
+    def head(self):
+        return self.get('head')
+
+    def announce(self, block_number):
+        self.set('head', block_number)
+
+    def append_block(self, block_number, previous, events, keep=1000):
+        relay = f"{self.prefix}relay"
+        with self.redis.pipeline() as pipe:
+            pipe.zremrangebyscore(relay, block_number, block_number)
+            pipe.zadd(relay, {pickle.dumps((block_number, previous, events), pickle.HIGHEST_PROTOCOL): block_number})
+            pipe.zremrangebyscore(relay, '-inf', block_number - keep)
+            pipe.execute()
+
+    def blocks_after(self, block_number):
+        relay = f"{self.prefix}relay"
+        if block_number is None:
+            raw = self.redis.zrevrange(relay, 0, 0)
+        else:
+            raw = self.redis.zrangebyscore(relay, f"({block_number}", '+inf')
+        return [pickle.loads(item) for item in raw]
+
+
+def open_shared_store(url):
+    """SharedStore for SHARED_STATE_URL: redis://, rediss:// or unix:// for Redis, else a SQLite path"""
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisSharedStore(url)
+    if url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return SQLiteSharedStore(url)
+
+
+class WorkerCoordinator:
+    """Elects the one worker that runs the background refresher and keeps the others in step with it.
+
+    Every worker polls the shared store every ``interval`` seconds to take or
+    renew the ``refresher`` lease and to pick up contract config published
+    by whichever worker handled ``POST /api/contracts``. The lease holder
+    announces each new head before its block watcher dispatches the block,
+    then relays the block's events. The other workers never start their
+    block watcher or indexers: they replay relayed blocks into the watcher's
+    subscribers, so local caches and streams see the same invalidations.
+
+    If the refresher stops renewing, its lease lapses after ``lease_ttl``
+    seconds and the next worker to poll is promoted, continuing from the
+    last block it replayed. A refresher that finds its lease taken calls
+    ``on_demote``, which should restart the process.
+    """
+
+    def __init__(self, store, block_watcher, cache, on_promote, on_config, on_demote,
+                 lease_ttl=15, interval=0.5, keep_blocks=1000):
+        self.store = store
+        self.block_watcher = block_watcher
+        self.cache = cache
+        self.on_promote = on_promote
+        self.on_config = on_config
+        self.on_demote = on_demote
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+        self.keep_blocks = keep_blocks
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_refresher = False
+        self.relayed = None
+        self.stop_event = threading.Event()
+        block_watcher.subscribe(self._announce, first=True)
+        block_watcher.subscribe(self._relay)
+
+    def _announce(self, block_number, events):
+        # Runs before the block's invalidations, so fenced writes of older reads are refused from here on
+        if self.is_refresher:
+            self.store.announce(block_number)
+
+    def _relay(self, block_number, events):
+        if self.is_refresher:
+            self.store.append_block(block_number, self.relayed, events, self.keep_blocks)
+            self.relayed = block_number
+
+    def publish_config(self, addresses):
+        self.store.set('contracts', dict(addresses))
+
+    def poll(self):
+        held = self.store.acquire_lease('refresher', self.owner, self.lease_ttl)
+        if self.is_refresher and not held:
+            self.is_refresher = False
+            self.on_demote()
+            return
+
+        promoted = held and not self.is_refresher
+        if promoted:
+            print(f"Worker {self.owner} is now the background refresher")
+            self.is_refresher = True
+            self.cache.owns_invalidation = True
+            self.relayed = self.block_watcher.dispatched_block
+            self.on_promote()
+
+        addresses = self.store.get('contracts')
+        if addresses is not None:
+            self.on_config(addresses)
+
+        if promoted:
+            return
+        if held:
+            watcher = self.block_watcher
+            if self.relayed is None and watcher.dispatched_block is not None:
+                # Give followers a starting block before the first new one arrives
+                self.store.announce(watcher.dispatched_block)
+                self.store.append_block(watcher.dispatched_block, None, [], self.keep_blocks)
+                self.relayed = watcher.dispatched_block
+        else:
+            self.cache.owns_invalidation = False
+            self._follow()
+
+    def _follow(self):
+        watcher = self.block_watcher
+        entries = self.store.blocks_after(watcher.dispatched_block)
+        watcher.polled_at = time.time()
+        if not entries:
+            return
+        if watcher.dispatched_block is None:
+            # Nothing is cached yet, so start from the newest block without replaying anything
+            watcher.last_block = watcher.dispatched_block = entries[-1][0]
+            return
+        if entries[0][1] != watcher.dispatched_block:
+            print(f"Fell behind the block relay at {watcher.dispatched_block}, skipping to {entries[-1][0]}")
+            watcher.replay(entries[-1][0], None)
+            return
+        for block_number, _, events in entries:
+            watcher.replay(block_number, events)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling shared state: {e}")
+
+    def start(self):
+        """Poll once now (so config and role are settled before serving), then keep polling"""
+        self.poll()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
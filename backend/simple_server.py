@@ -1,8 +1,7 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
-from web3 import Web3
-import os
 from dotenv import load_dotenv
+from provider import make_web3
 
 load_dotenv()
 
@@ -10,8 +9,7 @@ app = Flask(__name__)
 CORS(app)
 
 # Web3 setup
-INFURA_URL = os.getenv('INFURA_URL')
-w3 = Web3(Web3.HTTPProvider(INFURA_URL))
+w3 = make_web3()
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
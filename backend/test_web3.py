@@ -1,15 +1,30 @@
 #!/usr/bin/env python3
-from web3 import Web3
-import os
+import asyncio
 from dotenv import load_dotenv
+from provider import make_web3, make_async_web3
 
 load_dotenv()
 
-INFURA_URL = os.getenv('INFURA_URL')
-w3 = Web3(Web3.HTTPProvider(INFURA_URL))
+w3 = make_web3()
 
 print(f"Connected to Web3: {w3.is_connected()}")
 if w3.is_connected():
     print(f"Latest block: {w3.eth.block_number}")
 else:
-    print("Not connected to network")
\ No newline at end of file
+    print("Not connected to network")
+
+async def check_async():
+    # Same endpoints and circuit breakers as w3, so a dead primary fails over here too
+    aw3 = make_async_web3()
+    try:
+        connected = await aw3.is_connected()
+        print(f"Connected to AsyncWeb3: {connected}")
+        if connected:
+            print(f"Latest block (async): {await aw3.eth.block_number}")
+    finally:
+        await aw3.provider.close()
+
+asyncio.run(check_async())
+
+for endpoint in w3.provider.status():
+    print(f"  {endpoint['url']}: latency={endpoint['latency']} failures={endpoint['failures']} open={endpoint['open']}")
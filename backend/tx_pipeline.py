@@ -0,0 +1,335 @@
+"""
+Transaction pipeline for TXSPEAK backend
+Signs transactions locally with consecutive nonces so many can be in flight at once, prices
+them with EIP-1559 fees, tracks their receipts together and replaces any that get stuck
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+import rlp
+from eth_utils import keccak, to_checksum_address
+from web3.exceptions import TransactionNotFound
+
+GWEI = 10 ** 9
+
+log = logging.getLogger(__name__)
+
+
+def create_address(sender, nonce):
+    """Address of the contract deployed by sender's transaction with this nonce"""
+    return to_checksum_address(keccak(rlp.encode([bytes.fromhex(sender[2:]), nonce]))[12:])
+
+
+def estimate_fees(w3, blocks=5, percentile=50, base_fee_headroom=2):
+    """EIP-1559 fee fields from eth_feeHistory, or a legacy gasPrice where the chain has no base fee.
+
+    maxFeePerGas leaves room for the base fee to double, which takes six
+    full blocks at 12.5% a block; the tip is the median of recent blocks'
+    ``percentile`` tips.
+    """
+    try:
+        history = w3.eth.fee_history(blocks, 'latest', [percentile])
+        base_fee = history['baseFeePerGas'][-1]
+    except Exception:
+        base_fee = None
+    if not base_fee:
+        return {'gasPrice': w3.eth.gas_price}
+    tips = sorted(reward[0] for reward in history.get('reward') or [] if reward)
+    tip = max(tips[len(tips) // 2] if tips else GWEI, 1)
+    return {'maxFeePerGas': base_fee * base_fee_headroom + tip, 'maxPriorityFeePerGas': tip}
+
+
+class NonceAllocator:
+    """Hands out consecutive nonces for one sender, reading the pending count only once"""
+
+    def __init__(self, w3, address):
+        self.w3 = w3
+        self.address = address
+        self.lock = threading.Lock()
+        self.next_nonce = None
+
+    def allocate(self, count=1):
+        """Reserve count consecutive nonces and return the first"""
+        with self.lock:
+            if self.next_nonce is None:
+                self.next_nonce = self.w3.eth.get_transaction_count(self.address, 'pending')
+            first = self.next_nonce
+            self.next_nonce += count
+            return first
+
+    def release(self, first, end):
+        """Give back nonces first..end-1 if none after them were handed out; returns whether they were.
+
+        The next allocation re-reads the pending count, which starts over at
+        first once nothing at or above it reached the node.
+        """
+        with self.lock:
+            if self.next_nonce != end:
+                return False
+            self.next_nonce = None
+            return True
+
+    def resync(self):
+        """Re-read the pending count on the next allocation, e.g. after sending from elsewhere"""
+        with self.lock:
+            self.next_nonce = None
+
+
+class PendingTx:
+    """One nonce's transaction. Replacements reuse the nonce, so whichever version is mined completes it."""
+
+    def __init__(self, tx, label=None):
+        self.tx = tx
+        self.nonce = tx['nonce']
+        self.label = label or f"nonce {tx['nonce']}"
+        self.hashes = []
+        self.sent_at = None
+        self.replacements = 0
+        self.future = Future()
+
+    def receipt(self, timeout=None):
+        """Block until mined; returns the receipt (check its status) or raises if the nonce was lost"""
+        return self.future.result(timeout)
+
+    def done(self):
+        return self.future.done()
+
+
+class TxFailed(Exception):
+    pass
+
+
+class TxPipeline:
+    """Sends transactions from one local account without waiting for each to be mined.
+
+    Nonces come from a NonceAllocator, so a batch is signed and sent back to
+    back and lands in as few blocks as the chain allows. One tracker thread
+    reads the sender's mined nonce every ``poll_interval`` seconds and
+    fetches receipts, concurrently, only for nonces below it. A transaction
+    still unmined ``replace_after`` seconds after it was sent is re-signed
+    at the same nonce with fees raised by at least ``fee_bump`` (nodes
+    require 10%) and sent again, up to ``max_replacements`` times.
+    """
+
+    def __init__(self, w3, account, poll_interval=1.0, replace_after=45, fee_bump=1.125,
+                 max_replacements=5, gas_headroom=1.2, fee_ttl=10, workers=8):
+        self.w3 = w3
+        self.account = account
+        self.poll_interval = poll_interval
+        self.replace_after = replace_after
+        self.fee_bump = fee_bump
+        self.max_replacements = max_replacements
+        self.gas_headroom = gas_headroom
+        self.fee_ttl = fee_ttl
+        self.chain_id = w3.eth.chain_id
+        self.nonces = NonceAllocator(w3, account.address)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.fees = None
+        self.fees_at = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tx-pipeline')
+        self.tracker = None
+        self.wake = threading.Event()
+
+    # Submission
+
+    def current_fees(self):
+        now = time.monotonic()
+        if self.fees is None or now - self.fees_at > self.fee_ttl:
+            self.fees = estimate_fees(self.w3)
+            self.fees_at = now
+        return self.fees
+
+    def _prepare(self, tx):
+        tx = dict(tx)
+        tx.setdefault('from', self.account.address)
+        tx.setdefault('value', 0)
+        tx['chainId'] = self.chain_id
+        if 'gas' not in tx:
+            tx['gas'] = int(self.w3.eth.estimate_gas(tx) * self.gas_headroom)
+        if 'gasPrice' not in tx and 'maxFeePerGas' not in tx:
+            tx.update(self.current_fees())
+        return tx
+
+    def submit(self, tx, label=None):
+        return self.submit_many([tx], [label])[0]
+
+    def submit_many(self, txs, labels=None):
+        """Sign and send txs with consecutive nonces, in order; returns their PendingTx.
+
+        Gas is estimated for txs without a ``gas`` field before any nonce is
+        taken, so a failing estimate never leaves a gap. Transactions that
+        call contracts deployed earlier in the same batch cannot be
+        estimated yet and must carry their own ``gas``. A tx may carry a
+        nonce reserved with ``nonces.allocate``, e.g. to predict a contract
+        address with create_address; the rest get the next free nonces.
+        """
+        labels = labels or [None] * len(txs)
+        try:
+            prepared = list(self.executor.map(self._prepare, txs))
+        except Exception:
+            # Nonces reserved for the batch would otherwise never be used
+            reserved = sorted(tx['nonce'] for tx in txs if 'nonce' in tx)
+            if reserved:
+                self._close_gap(reserved)
+            raise
+        unassigned = [tx for tx in prepared if 'nonce' not in tx]
+        if unassigned:
+            first = self.nonces.allocate(len(unassigned))
+            for i, tx in enumerate(unassigned):
+                tx['nonce'] = first + i
+        batch = [PendingTx(tx, label) for tx, label in zip(prepared, labels)]
+        with self.lock:
+            for pending in batch:
+                self.pending[pending.nonce] = pending
+        # In nonce order, so no node ever sees a gap
+        ordered = sorted(batch, key=lambda pending: pending.nonce)
+        for i, pending in enumerate(ordered):
+            if not self._send(pending):
+                self._abandon(pending, ordered[i + 1:])
+                break
+        self._ensure_tracker()
+        return batch
+
+    def _abandon(self, failed, rest):
+        """Fail the txs after a send that failed, then close the nonce gap it left.
+
+        Later nonces would wait behind the gap forever, so they are not sent.
+        If nothing was allocated after the batch the nonces go back to the
+        allocator; otherwise other transactions already sit behind them, and
+        each is filled with a 0-value transfer to self.
+        """
+        for pending in rest:
+            self._finish(pending, error=TxFailed(f"{pending.label}: not sent, {failed.label} failed before it"))
+        self._close_gap([failed.nonce] + [pending.nonce for pending in rest])
+
+    def _close_gap(self, unused):
+        """Return sorted unused nonces to the allocator, or fill them if later nonces were handed out"""
+        if unused == list(range(unused[0], unused[-1] + 1)) and self.nonces.release(unused[0], unused[-1] + 1):
+            return
+        fillers = [PendingTx(self._prepare({'to': self.account.address, 'gas': 21000, 'nonce': nonce}),
+                             f"gap filler for nonce {nonce}") for nonce in unused]
+        with self.lock:
+            for pending in fillers:
+                self.pending[pending.nonce] = pending
+        for pending in fillers:
+            if not self._send(pending):
+                log.warning("Could not fill nonce gap at %s; re-reading the pending nonce", pending.nonce)
+                self.nonces.resync()
+                break
+        self._ensure_tracker()
+
+    def _send(self, pending):
+        """Send the current version of pending; returns False if the node refused it"""
+        signed = self.account.sign_transaction(pending.tx)
+        try:
+            tx_hash = self.w3.eth.send_raw_transaction(signed.rawTransaction)
+        except ValueError as e:
+            message = str(e).lower()
+            if 'already known' in message:
+                tx_hash = signed.hash
+            elif 'nonce too low' in message:
+                # Possibly an earlier version of this nonce was just mined; the tracker will tell
+                tx_hash = None
+            else:
+                self._finish(pending, error=TxFailed(f"{pending.label}: {e}"))
+                return False
+        if tx_hash is not None:
+            pending.hashes.append(bytes(tx_hash))
+        pending.sent_at = time.monotonic()
+        return True
+
+    def _replace(self, pending):
+        tx = dict(pending.tx)
+        fresh = estimate_fees(self.w3)
+        self.fees, self.fees_at = fresh, time.monotonic()
+        # Keep the original's type; the estimate only sets a floor, whichever shape it has
+        if 'maxFeePerGas' in tx:
+            tx['maxPriorityFeePerGas'] = max(fresh.get('maxPriorityFeePerGas', 0),
+                                             int(tx['maxPriorityFeePerGas'] * self.fee_bump) + 1)
+            tx['maxFeePerGas'] = max(fresh.get('maxFeePerGas', fresh.get('gasPrice', 0)),
+                                     int(tx['maxFeePerGas'] * self.fee_bump) + 1, tx['maxPriorityFeePerGas'])
+        else:
+            tx['gasPrice'] = max(fresh.get('gasPrice', 0), int(tx['gasPrice'] * self.fee_bump) + 1)
+        pending.tx = tx
+        pending.replacements += 1
+        log.info("Replacing stuck %s (attempt %s)", pending.label, pending.replacements)
+        self._send(pending)
+
+    # Tracking
+
+    def _ensure_tracker(self):
+        with self.lock:
+            if self.tracker is None or not self.tracker.is_alive():
+                self.tracker = threading.Thread(target=self._track, daemon=True, name='tx-tracker')
+                self.tracker.start()
+        self.wake.set()
+
+    def _track(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.tracker = None
+                    return
+                outstanding = sorted(self.pending.values(), key=lambda pending: pending.nonce)
+            try:
+                self._poll(outstanding)
+            except Exception as e:
+                log.error("Error tracking transactions: %s", e)
+            self.wake.wait(self.poll_interval)
+            self.wake.clear()
+
+    def _poll(self, outstanding):
+        mined_nonce = self.w3.eth.get_transaction_count(self.account.address, 'latest')
+        mined = [pending for pending in outstanding if pending.nonce < mined_nonce]
+        for pending, receipt in zip(mined, self.executor.map(self._find_receipt, mined)):
+            if receipt is not None:
+                self._finish(pending, receipt=receipt)
+            else:
+                self._finish(pending, error=TxFailed(f"{pending.label}: nonce {pending.nonce} was used by another transaction"))
+
+        now = time.monotonic()
+        for pending in outstanding:
+            if pending.nonce < mined_nonce or pending.done() or pending.sent_at is None:
+                continue
+            if now - pending.sent_at < self.replace_after:
+                continue
+            if pending.replacements >= self.max_replacements:
+                self._finish(pending, error=TxFailed(f"{pending.label}: still unmined after {pending.replacements} replacements"))
+            else:
+                self._replace(pending)
+
+    def _find_receipt(self, pending):
+        # A version of the nonce can be mined a moment before its receipt is served
+        for _ in range(3):
+            for tx_hash in reversed(pending.hashes):
+                try:
+                    return self.w3.eth.get_transaction_receipt(tx_hash)
+                except TransactionNotFound:
+                    continue
+            time.sleep(self.poll_interval)
+        return None
+
+    def _finish(self, pending, receipt=None, error=None):
+        with self.lock:
+            self.pending.pop(pending.nonce, None)
+        if pending.future.done():
+            return
+        if error is not None:
+            pending.future.set_exception(error)
+        else:
+            pending.future.set_result(receipt)
+
+    def wait(self, batch, timeout=None):
+        """Receipts for a batch, in order; raises TxFailed if any was lost or reverted"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        receipts = []
+        for pending in batch:
+            remaining = max(0, deadline - time.monotonic()) if deadline is not None else None
+            receipt = pending.receipt(remaining)
+            if receipt['status'] != 1:
+                raise TxFailed(f"{pending.label} reverted in {receipt['transactionHash'].hex()}")
+            receipts.append(receipt)
+        return receipts